@@ -6,6 +6,11 @@ test_only = False  # test process
 seed = None  # train process will init a random seed and record
 save_path = "exp/default"
 num_worker = 16  # total worker in all gpu
+prefetch_factor = None  # batches loaded in advance by each worker, None: torch default
+pin_memory = True
+# benchmark data.train at startup and apply the best loader setting, e.g. dict(
+# num_workers=[2, 4, 8], prefetch_factor=[2, 4], pin_memory=[True], num_batches=20)
+tune_dataloader = None
 batch_size = 16  # total batch size in all gpu
 batch_size_val = None  # auto adapt to bs 1 for each gpu
 batch_size_test = None  # auto adapt to bs 1 for each gpu
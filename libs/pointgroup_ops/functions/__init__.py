@@ -1 +1,2 @@
 from .functions import bfs_cluster, ballquery_batch_p, Clustering
+from .cluster import ball_query, connected_components
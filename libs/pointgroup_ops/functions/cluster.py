@@ -0,0 +1,152 @@
+"""
+Torch backend of pointgroup_ops
+
+Device agnostic counterparts of the pointgroup_ops_cuda ops. The ball query hashes
+points into cells of size radius (per batch) and only measures pairs in the 27
+neighbouring cells (9 ranges of points sorted by cell); candidates are counted
+first so every buffer is sized exactly (no retry with a larger meanActive).
+Clusters are the connected components of the ball query graph restricted to points
+of the same semantic label, found by union-find (hooking to the smallest root and
+pointer jumping).
+
+Both ops return what the CUDA / C++ ops return: neighbours of each point in
+ascending index order (at most max_active, as the kernel keeps the first 1000),
+clusters numbered by their smallest point index. Only the order of points inside
+a cluster differs (ascending index instead of BFS order), and when balls are
+truncated at max_active the graph is taken as undirected while BFS follows it
+from the seed side.
+"""
+
+import torch
+
+
+def _expand(start, count):
+    # concat of arange(start[i], start[i] + count[i]) and the segment of each item
+    segment = torch.repeat_interleave(
+        torch.arange(len(count), device=count.device), count
+    )
+    local = torch.arange(len(segment), device=count.device) - torch.repeat_interleave(
+        torch.cumsum(count, dim=0) - count, count
+    )
+    return start[segment] + local, segment
+
+
+def ball_query(coords, batch_idxs, radius, max_active=1000, max_candidates=1 << 24):
+    """
+    Neighbours within radius (d2 < radius^2) in the same batch, queried on a
+    spatial hash of cell size radius.
+
+    :param coords: (n, 3) float
+    :param batch_idxs: (n) int
+    :param radius: float
+    :param max_active: int, keep the first max_active neighbours of each point
+    :param max_candidates: int, candidate pairs measured at once (memory bound)
+    :return: idx (nActive), int
+    :return: start_len (n, 2), int
+    """
+    n, device = coords.shape[0], coords.device
+    if n == 0:
+        return (
+            torch.zeros(0, dtype=torch.int, device=device),
+            torch.zeros((0, 2), dtype=torch.int, device=device),
+        )
+    coords = coords.float()
+    cell = torch.floor(coords / radius).long()
+    # margin of one cell, so neighbouring cells never wrap to the next row
+    cell = cell - cell.min(dim=0)[0] + 1
+    size = (cell.max(dim=0)[0] + 2).tolist()
+    key = batch_idxs.long() * size[0] + cell[:, 0]
+    key = (key * size[1] + cell[:, 1]) * size[2] + cell[:, 2]
+    sorted_key, order = torch.sort(key, stable=True)
+
+    # cells (x, y, z - 1 : z + 2) are consecutive keys, so the points of 9 rows of
+    # 3 cells are 9 ranges of sorted points, searched for sorted keys
+    shift = torch.arange(-1, 2, device=device)
+    shift = torch.cartesian_prod(shift, shift)
+    shift = (shift[:, 0] * size[1] + shift[:, 1]) * size[2]
+    row = sorted_key[None, :] + shift[:, None]  # (9, n)
+    lower = torch.searchsorted(sorted_key, row - 1)
+    upper = torch.searchsorted(sorted_key, row + 1, right=True)
+    start = torch.empty((n, 9), dtype=torch.long, device=device)
+    start[order] = lower.T
+    count = torch.empty_like(start)
+    count[order] = (upper - lower).T
+
+    # chunk queries by number of candidates, each chunk is sized exactly
+    candidates = torch.cumsum(count.sum(dim=1), dim=0)
+    num_chunks = -(-int(candidates[-1]) // max_candidates)
+    bounds = torch.searchsorted(
+        candidates,
+        torch.arange(1, num_chunks, device=device) * max_candidates,
+        right=True,
+    )
+    bounds = [0] + bounds.tolist() + [n]
+
+    radius2 = torch.tensor(radius, dtype=torch.float).square()
+    idx, length = [], []
+    for begin, end in zip(bounds[:-1], bounds[1:]):
+        if begin == end:
+            continue
+        k, pair = _expand(start[begin:end].flatten(), count[begin:end].flatten())
+        k = order[k]
+        q = torch.div(pair, 9, rounding_mode="floor") + begin
+        diff = coords[q] - coords[k]
+        d2 = diff[:, 0] * diff[:, 0] + diff[:, 1] * diff[:, 1] + diff[:, 2] * diff[:, 2]
+        mask = d2 < radius2
+        q, k = q[mask], k[mask]
+        # ascending neighbour index within each query, keep the first max_active
+        sort = torch.argsort(q * n + k)
+        q, k = q[sort], k[sort]
+        count_ = torch.bincount(q - begin, minlength=end - begin)
+        rank = torch.arange(len(q), device=device) - torch.repeat_interleave(
+            torch.cumsum(count_, dim=0) - count_, count_
+        )
+        idx.append(k[rank < max_active])
+        length.append(count_.clamp(max=max_active))
+    idx, length = torch.cat(idx).int(), torch.cat(length)
+    start_len = torch.stack([torch.cumsum(length, dim=0) - length, length], dim=1)
+    return idx, start_len.int()
+
+
+def connected_components(semantic_label, ball_query_idxs, start_len, threshold):
+    """
+    Clusters of neighbouring points with the same semantic label.
+
+    :param semantic_label: (N), int
+    :param ball_query_idxs: (nActive), int
+    :param start_len: (N, 2), int
+    :param threshold: int, minimum number of points of a cluster
+    :return: cluster_idxs: int (sumNPoint, 2), dim 0 for cluster_id, dim 1 for corresponding point idxs in N
+    :return: cluster_offsets: int (nCluster + 1)
+    """
+    n, device = start_len.shape[0], start_len.device
+    start, length = start_len[:, 0].long(), start_len[:, 1].long()
+    position, src = _expand(start, length)
+    dst = ball_query_idxs.long()[position]
+    mask = semantic_label[src] == semantic_label[dst]
+    src, dst = src[mask], dst[mask]
+
+    parent = torch.arange(n, device=device)
+    while True:
+        # hook both roots of each edge to the smaller one, then compress
+        root = torch.minimum(parent[src], parent[dst])
+        hooked = parent.scatter_reduce(0, parent[src], root, reduce="amin")
+        hooked.scatter_reduce_(0, parent[dst], root, reduce="amin")
+        while True:
+            jumped = hooked[hooked]
+            if torch.equal(jumped, hooked):
+                break
+            hooked = jumped
+        if torch.equal(hooked, parent):
+            break
+        parent = hooked
+
+    # root is the smallest point index of a cluster, as the seed of BFS
+    size = torch.bincount(parent, minlength=n)
+    keep = size >= max(threshold, 1)
+    cluster_id = torch.cumsum(keep, dim=0) - 1
+    points = torch.argsort(parent, stable=True)
+    points = points[keep[parent[points]]]
+    cluster_idxs = torch.stack([cluster_id[parent[points]], points], dim=1)
+    cluster_offsets = torch.nn.functional.pad(torch.cumsum(size[keep], dim=0), (1, 0))
+    return cluster_idxs.int(), cluster_offsets.int()
@@ -1,6 +1,13 @@
 import torch
 from torch.autograd import Function
-import pointgroup_ops_cuda
+
+from .cluster import ball_query, connected_components
+
+try:
+    import pointgroup_ops_cuda
+except ImportError:
+    # torch backend only (pointgroup_ops built without CUDA)
+    pointgroup_ops_cuda = None
 
 
 class BallQueryBatchP(Function):
@@ -12,27 +19,18 @@ class BallQueryBatchP(Function):
         :param batch_idxs: (n) int
         :param batch_offsets: (B+1) int
         :param radius: float
-        :param meanActive: int
+        :param meanActive: int, unused, output is sized exactly by the spatial hash
         :return: idx (nActive), int
         :return: start_len (n, 2), int
         """
 
-        n = coords.size(0)
+        assert coords.is_contiguous()
+        assert batch_idxs.is_contiguous()
+        assert batch_offsets.is_contiguous()
 
-        assert coords.is_contiguous() and coords.is_cuda
-        assert batch_idxs.is_contiguous() and batch_idxs.is_cuda
-        assert batch_offsets.is_contiguous() and batch_offsets.is_cuda
-
-        while True:
-            idx = torch.cuda.IntTensor(n * meanActive).zero_()
-            start_len = torch.cuda.IntTensor(n, 2).zero_()
-            nActive = pointgroup_ops_cuda.ballquery_batch_p(
-                coords, batch_idxs, batch_offsets, idx, start_len, n, meanActive, radius
-            )
-            if nActive <= n * meanActive:
-                break
-            meanActive = int(nActive // n + 1)
-        idx = idx[:nActive]
+        # spatial hash on any device, instead of the brute force kernel retried
+        # with a larger n * meanActive buffer until the output fits
+        idx, start_len = ball_query(coords, batch_idxs, radius)
 
         return idx, start_len
 
@@ -107,7 +105,9 @@ class Clustering:
             return torch.zeros((0, 2)).int(), torch.zeros(1).int()
 
         batch_idxs_ = batch_idxs[object_idxs].int()
-        batch_offsets_ = torch.FloatTensor([0, object_idxs.shape[0]]).int().cuda()
+        batch_offsets_ = torch.tensor(
+            [0, object_idxs.shape[0]], dtype=torch.int, device=vertices.device
+        )
 
         idx, start_len = ballquery_batch_p(
             vertices_, batch_idxs_, batch_offsets_, self.thresh, self.closed_points
@@ -153,6 +153,11 @@ class BFSCluster(Function):
         assert ball_query_idxs.is_contiguous()
         assert start_len.is_contiguous()
 
+        if pointgroup_ops_cuda is None or semantic_label.is_cuda:
+            return connected_components(
+                semantic_label, ball_query_idxs, start_len, threshold
+            )
+
         cluster_idxs = semantic_label.new()
         cluster_offsets = semantic_label.new()
 
@@ -1,7 +1,7 @@
 import os
 from sys import argv
 from setuptools import setup
-from torch.utils.cpp_extension import BuildExtension, CUDAExtension
+from torch.utils.cpp_extension import BuildExtension, CUDAExtension, CUDA_HOME
 from distutils.sysconfig import get_config_vars
 
 (opt,) = get_config_vars("OPT")
@@ -43,17 +43,24 @@ include_dirs = []
 if not (INCLUDE_DIRS is False):
     include_dirs += INCLUDE_DIRS
 
-setup(
-    name="pointgroup_ops",
-    packages=["pointgroup_ops"],
-    package_dir={"pointgroup_ops": "functions"},
-    ext_modules=[
+# without a CUDA toolkit only the torch backend (functions/cluster.py) is installed
+ext_modules = (
+    [
         CUDAExtension(
             name="pointgroup_ops_cuda",
             sources=["src/bfs_cluster.cpp", "src/bfs_cluster_kernel.cu"],
             extra_compile_args={"cxx": ["-g"], "nvcc": ["-O2"]},
         )
-    ],
+    ]
+    if CUDA_HOME is not None
+    else []
+)
+
+setup(
+    name="pointgroup_ops",
+    packages=["pointgroup_ops"],
+    package_dir={"pointgroup_ops": "functions"},
+    ext_modules=ext_modules,
     include_dirs=[*include_dirs],
     cmdclass={"build_ext": BuildExtension},
 )
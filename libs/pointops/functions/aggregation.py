@@ -1,7 +1,12 @@
 import torch
 from torch.autograd import Function
 
-from pointops._C import aggregation_forward_cuda, aggregation_backward_cuda
+from .cpu import aggregation_forward_cpu, aggregation_backward_cpu
+
+try:
+    from pointops._C import aggregation_forward_cuda, aggregation_backward_cuda
+except ImportError:  # built without CUDA, CPU backend only
+    aggregation_forward_cuda = aggregation_backward_cuda = None
 
 
 class Aggregation(Function):
@@ -18,10 +23,11 @@ class Aggregation(Function):
         )
         n, nsample, c = position.shape
         w_c = weight.shape[-1]
-        output = torch.cuda.FloatTensor(n, c).zero_()
-        aggregation_forward_cuda(
-            n, nsample, c, w_c, input, position, weight, idx, output
+        output = torch.zeros((n, c), dtype=torch.float32, device=input.device)
+        aggregation_forward = (
+            aggregation_forward_cuda if input.is_cuda else aggregation_forward_cpu
         )
+        aggregation_forward(n, nsample, c, w_c, input, position, weight, idx, output)
         ctx.save_for_backward(input, position, weight, idx)
         return output
 
@@ -34,10 +40,16 @@ class Aggregation(Function):
         input, position, weight, idx = ctx.saved_tensors
         n, nsample, c = position.shape
         w_c = weight.shape[-1]
-        grad_input = torch.cuda.FloatTensor(n, c).zero_()
-        grad_position = torch.cuda.FloatTensor(n, nsample, c).zero_()
-        grad_weight = torch.cuda.FloatTensor(n, nsample, w_c).zero_()
-        aggregation_backward_cuda(
+        device = grad_output.device
+        grad_input = torch.zeros((n, c), dtype=torch.float32, device=device)
+        grad_position = torch.zeros((n, nsample, c), dtype=torch.float32, device=device)
+        grad_weight = torch.zeros((n, nsample, w_c), dtype=torch.float32, device=device)
+        aggregation_backward = (
+            aggregation_backward_cuda
+            if grad_output.is_cuda
+            else aggregation_backward_cpu
+        )
+        aggregation_backward(
             n,
             nsample,
             c,
@@ -1,13 +1,26 @@
 import torch
 from torch.autograd import Function
 
-from pointops._C import (
-    attention_relation_step_forward_cuda,
-    attention_relation_step_backward_cuda,
-    attention_fusion_step_forward_cuda,
-    attention_fusion_step_backward_cuda,
+from .cpu import (
+    attention_relation_step_forward_cpu,
+    attention_relation_step_backward_cpu,
+    attention_fusion_step_forward_cpu,
+    attention_fusion_step_backward_cpu,
 )
 
+try:
+    from pointops._C import (
+        attention_relation_step_forward_cuda,
+        attention_relation_step_backward_cuda,
+        attention_fusion_step_forward_cuda,
+        attention_fusion_step_backward_cuda,
+    )
+except ImportError:  # built without CUDA, CPU backend only
+    attention_relation_step_forward_cuda = None
+    attention_relation_step_backward_cuda = None
+    attention_fusion_step_forward_cuda = None
+    attention_fusion_step_backward_cuda = None
+
 
 class AttentionRelationStep(Function):
     @staticmethod
@@ -30,8 +43,13 @@ class AttentionRelationStep(Function):
 
         _, g, c = query.shape
         m = index_target.shape[0]
-        output = torch.cuda.FloatTensor(m, g).zero_()
-        attention_relation_step_forward_cuda(
+        output = torch.zeros((m, g), dtype=torch.float32, device=query.device)
+        attention_relation_step_forward = (
+            attention_relation_step_forward_cuda
+            if query.is_cuda
+            else attention_relation_step_forward_cpu
+        )
+        attention_relation_step_forward(
             m, g, c, query, key, weight, index_target.int(), index_refer.int(), output
         )
         ctx.save_for_backward(query, key, weight, index_target, index_refer)
@@ -42,10 +60,16 @@ class AttentionRelationStep(Function):
         query, key, weight, index_target, index_refer = ctx.saved_tensors
         n, g, c = query.shape
         m = index_target.shape[0]
-        grad_query = torch.cuda.FloatTensor(n, g, c).zero_()
-        grad_key = torch.cuda.FloatTensor(n, g, c).zero_()
-        grad_weight = torch.cuda.FloatTensor(c).zero_()
-        attention_relation_step_backward_cuda(
+        device = grad_output.device
+        grad_query = torch.zeros((n, g, c), dtype=torch.float32, device=device)
+        grad_key = torch.zeros((n, g, c), dtype=torch.float32, device=device)
+        grad_weight = torch.zeros(c, dtype=torch.float32, device=device)
+        attention_relation_step_backward = (
+            attention_relation_step_backward_cuda
+            if grad_output.is_cuda
+            else attention_relation_step_backward_cpu
+        )
+        attention_relation_step_backward(
             m,
             g,
             c,
@@ -83,8 +107,13 @@ class AttentionFusionStep(Function):
 
         n, g, c = value.shape
         m = index_refer.shape[0]
-        output = torch.cuda.FloatTensor(n, g, c).zero_()
-        attention_fusion_step_forward_cuda(
+        output = torch.zeros((n, g, c), dtype=torch.float32, device=value.device)
+        attention_fusion_step_forward = (
+            attention_fusion_step_forward_cuda
+            if value.is_cuda
+            else attention_fusion_step_forward_cpu
+        )
+        attention_fusion_step_forward(
             m, g, c, weight, value, index_target.int(), index_refer.int(), output
         )
         ctx.save_for_backward(weight, value, index_target, index_refer)
@@ -99,9 +128,15 @@ class AttentionFusionStep(Function):
         weight, value, index_target, index_refer = ctx.saved_tensors
         n, g, c = value.shape
         m = index_target.shape[0]
-        grad_weight = torch.cuda.FloatTensor(m, g).zero_()
-        grad_value = torch.cuda.FloatTensor(n, g, c).zero_()
-        attention_fusion_step_backward_cuda(
+        device = grad_output.device
+        grad_weight = torch.zeros((m, g), dtype=torch.float32, device=device)
+        grad_value = torch.zeros((n, g, c), dtype=torch.float32, device=device)
+        attention_fusion_step_backward = (
+            attention_fusion_step_backward_cuda
+            if grad_output.is_cuda
+            else attention_fusion_step_backward_cpu
+        )
+        attention_fusion_step_backward(
             m,
             g,
             c,
@@ -0,0 +1,308 @@
+"""
+CPU backend of pointops
+
+Counterparts of the pointops._C CUDA kernels with the same arguments (outputs are
+written into the given tensors), used by the pointops functions when the inputs
+are not on a CUDA device. Neighbour queries run on a KD-tree per batch
+(scipy.spatial.cKDTree, multithreaded) and fall back to a blocked brute-force
+search if scipy is not installed; the other ops are vectorized torch ops.
+"""
+
+import numpy as np
+import torch
+
+try:
+    from scipy.spatial import cKDTree
+except ImportError:
+    cKDTree = None
+
+
+def _batch_ranges(offset):
+    offset = [0] + offset.tolist()
+    return [(offset[i], offset[i + 1]) for i in range(len(offset) - 1)]
+
+
+def _brute_force_knn(nsample, xyz, new_xyz, block_size=4096):
+    # (m, k) dist2 and idx, k = min(nsample, n), sorted by distance
+    k = min(nsample, xyz.shape[0])
+    dist2, idx = [], []
+    for start in range(0, new_xyz.shape[0], block_size):
+        d2 = torch.cdist(new_xyz[start : start + block_size].float(), xyz.float())
+        d2, i = torch.topk(d2.square_(), k, dim=1, largest=False, sorted=True)
+        dist2.append(d2)
+        idx.append(i)
+    return torch.cat(dist2), torch.cat(idx)
+
+
+def _ball_candidates(radius, xyz, new_xyz):
+    """
+    All (query, point) pairs within radius as (row, col, dist2), sorted by query.
+    """
+    m = new_xyz.shape[0]
+    if cKDTree is not None:
+        tree = cKDTree(xyz.detach().numpy(), balanced_tree=False)
+        neighbours = tree.query_ball_point(
+            new_xyz.detach().numpy(), r=radius, workers=-1
+        )
+        count = np.fromiter((len(n) for n in neighbours), dtype=np.int64, count=m)
+        col = np.fromiter(
+            (i for n in neighbours for i in n), dtype=np.int64, count=count.sum()
+        )
+        count, col = torch.from_numpy(count), torch.from_numpy(col)
+        row = torch.repeat_interleave(torch.arange(m), count)
+    else:
+        row, col = [], []
+        for start in range(0, m, 1024):
+            d2 = torch.cdist(new_xyz[start : start + 1024], xyz).square_()
+            r, c = torch.nonzero(d2 <= radius**2, as_tuple=True)
+            row.append(r + start)
+            col.append(c)
+        row, col = torch.cat(row), torch.cat(col)
+    dist2 = (new_xyz[row] - xyz[col]).square().sum(-1)
+    return row, col, dist2
+
+
+def _sort_rows(row, key):
+    # order of the candidates by query, then by key
+    order = torch.argsort(key, stable=True)
+    return order[torch.argsort(row[order], stable=True)]
+
+
+def _select_rows(m, nsample, row, col, dist2, select):
+    """
+    Write candidates at the given positions (m, nsample) within the sorted candidate
+    list of each query, -1 / 1e10 where the position is out of range.
+    """
+    count = torch.bincount(row, minlength=m)
+    row_start = torch.cumsum(count, 0) - count
+    mask = select < count.unsqueeze(1)
+    select = (row_start.unsqueeze(1) + select)[mask]
+    idx = torch.full((m, nsample), -1, dtype=torch.int32)
+    dist2_out = torch.full((m, nsample), 1e10, dtype=torch.float32)
+    idx[mask] = col[select].int()
+    dist2_out[mask] = dist2[select].float()
+    return idx, dist2_out
+
+
+def knn_query_cpu(m, nsample, xyz, new_xyz, offset, new_offset, idx, dist2):
+    # -1 / 1e10 placeholders when a batch has less than nsample points
+    idx.fill_(-1)
+    dist2.fill_(1e10)
+    for (s, e), (new_s, new_e) in zip(_batch_ranges(offset), _batch_ranges(new_offset)):
+        if e == s or new_e == new_s:
+            continue
+        k = min(nsample, e - s)
+        if cKDTree is not None:
+            tree = cKDTree(xyz[s:e].detach().numpy(), balanced_tree=False)
+            d, i = tree.query(new_xyz[new_s:new_e].detach().numpy(), k=k, workers=-1)
+            d2 = torch.from_numpy(np.square(d).reshape(-1, k))
+            i = torch.from_numpy(i.reshape(-1, k))
+        else:
+            d2, i = _brute_force_knn(k, xyz[s:e], new_xyz[new_s:new_e])
+        idx[new_s:new_e, :k] = i.int() + s
+        dist2[new_s:new_e, :k] = d2.float()
+
+
+def ball_query_cpu(
+    m, nsample, min_radius, max_radius, xyz, new_xyz, offset, new_offset, idx, dist2
+):
+    """
+    Candidates (d2 <= 1e-5 or min_radius^2 <= d2 < max_radius^2) sorted by distance,
+    all of them if no more than nsample, otherwise nsample evenly strided ones.
+    """
+    for (s, e), (new_s, new_e) in zip(_batch_ranges(offset), _batch_ranges(new_offset)):
+        m_b = new_e - new_s
+        radius = max(max_radius, 1e-5**0.5)
+        row, col, d2 = _ball_candidates(radius, xyz[s:e], new_xyz[new_s:new_e])
+        valid = (d2 <= 1e-5) | ((d2 >= min_radius**2) & (d2 < max_radius**2))
+        row, col, d2 = row[valid], col[valid], d2[valid]
+        order = _sort_rows(row, d2)
+        row, col, d2 = row[order], col[order], d2[order]
+        # stride over the sorted candidates of queries with more than nsample
+        count = torch.bincount(row, minlength=m_b)
+        sep = torch.clamp(count.float() / nsample, min=1)
+        select = (sep.unsqueeze(1) * torch.arange(nsample).float()).long()
+        idx_b, d2_b = _select_rows(m_b, nsample, row, col + s, d2, select)
+        idx[new_s:new_e] = idx_b
+        dist2[new_s:new_e] = d2_b
+
+
+def random_ball_query_cpu(
+    m,
+    nsample,
+    min_radius,
+    max_radius,
+    order,
+    xyz,
+    new_xyz,
+    offset,
+    new_offset,
+    idx,
+    dist2,
+):
+    """
+    First nsample candidates (d2 <= 1e-5 or min_radius^2 <= d2 < max_radius^2) in the
+    given random order of each batch.
+    """
+    order = order.long()
+    rank = torch.empty_like(order)
+    rank[order] = torch.arange(order.shape[0])
+    for (s, e), (new_s, new_e) in zip(_batch_ranges(offset), _batch_ranges(new_offset)):
+        radius = max(max_radius, 1e-5**0.5)
+        row, col, d2 = _ball_candidates(radius, xyz[s:e], new_xyz[new_s:new_e])
+        valid = (d2 <= 1e-5) | ((d2 >= min_radius**2) & (d2 < max_radius**2))
+        row, col, d2 = row[valid], col[valid], d2[valid]
+        col = col + s
+        sort = _sort_rows(row, rank[col])
+        row, col, d2 = row[sort], col[sort], d2[sort]
+        select = torch.arange(nsample).unsqueeze(0).expand(new_e - new_s, -1)
+        idx_b, d2_b = _select_rows(new_e - new_s, nsample, row, col, d2, select)
+        idx[new_s:new_e] = idx_b
+        dist2[new_s:new_e] = d2_b
+
+
+def farthest_point_sampling_cpu(b, n_max, xyz, offset, new_offset, tmp, idx):
+    """
+    All batches are sampled together on a (b, n_max) padded layout, starting from
+    the first point of each batch. numpy ufuncs with preallocated outputs keep the
+    per-step overhead low (the loop has one step per sampled point).
+    """
+    ranges, new_ranges = _batch_ranges(offset), _batch_ranges(new_offset)
+    count = np.array([e - s for s, e in ranges])
+    new_count = np.array([e - s for s, e in new_ranges])
+    start = np.array([s for s, _ in ranges])
+    n_max = int(count.max())
+    pos = np.arange(n_max)[None, :]
+    padded = pos >= count[:, None]
+    index = np.minimum(start[:, None] + pos, xyz.shape[0] - 1)
+    points = np.ascontiguousarray(xyz.detach().numpy()[index].transpose(2, 0, 1))
+    # padded points are never selected, their distance stays at -1
+    dist = np.full((b, n_max), 1e10, dtype=points.dtype)
+    dist[padded] = -1
+    d, t = np.empty_like(dist), np.empty_like(dist)
+    batch = np.arange(b)
+    old = np.zeros(b, dtype=np.int64)
+    sampled = [old]
+    for _ in range(1, int(new_count.max())):
+        last = points[:, batch, old][:, :, None]  # (3, b, 1)
+        np.subtract(points[0], last[0], out=d)
+        np.square(d, out=d)
+        for axis in (1, 2):
+            np.subtract(points[axis], last[axis], out=t)
+            np.square(t, out=t)
+            d += t
+        np.minimum(dist, d, out=dist)
+        old = dist.argmax(axis=1)
+        sampled.append(old)
+    sampled = np.stack(sampled, axis=1) + start[:, None]  # (b, new_n_max)
+    mask = np.arange(sampled.shape[1])[None, :] < new_count[:, None]
+    idx.copy_(torch.from_numpy(sampled[mask]))
+
+
+def grouping_forward_cpu(m, nsample, c, input, idx, output):
+    output.copy_(input[idx.view(-1).long()].view(m, nsample, c))
+
+
+def grouping_backward_cpu(m, nsample, c, grad_output, idx, grad_input):
+    grad_input.index_add_(0, idx.view(-1).long(), grad_output.reshape(-1, c))
+
+
+def interpolation_forward_cpu(n, c, k, input, idx, weight, output):
+    output += torch.einsum("nkc,nk->nc", input[idx.long()], weight)
+
+
+def interpolation_backward_cpu(n, c, k, grad_output, idx, weight, grad_input):
+    grad = grad_output.unsqueeze(1) * weight.unsqueeze(-1)  # (n, k, c)
+    grad_input.index_add_(0, idx.view(-1).long(), grad.view(-1, c))
+
+
+def subtraction_forward_cpu(n, nsample, c, input1, input2, idx, output):
+    output.copy_(input1.unsqueeze(1) - input2[idx.long()])
+
+
+def subtraction_backward_cpu(n, nsample, c, idx, grad_output, grad_input1, grad_input2):
+    grad_input1 += grad_output.sum(1)
+    grad_input2.index_add_(0, idx.view(-1).long(), -grad_output.reshape(-1, c))
+
+
+def aggregation_forward_cpu(n, nsample, c, w_c, input, position, weight, idx, output):
+    # channel c_i uses weight channel c_i % w_c
+    weight = weight[:, :, torch.arange(c) % w_c]
+    output += ((input[idx.long()] + position) * weight).sum(1)
+
+
+def aggregation_backward_cpu(
+    n,
+    nsample,
+    c,
+    w_c,
+    input,
+    position,
+    weight,
+    idx,
+    grad_output,
+    grad_input,
+    grad_position,
+    grad_weight,
+):
+    w_idx = torch.arange(c) % w_c
+    grad = grad_output.unsqueeze(1) * weight[:, :, w_idx]  # (n, nsample, c)
+    grad_input.index_add_(0, idx.view(-1).long(), grad.view(-1, c))
+    grad_position.copy_(grad)
+    grad_weight.index_add_(
+        2, w_idx, grad_output.unsqueeze(1) * (input[idx.long()] + position)
+    )
+
+
+def attention_relation_step_forward_cpu(
+    m, g, c, query, key, weight, index_target, index_refer, output
+):
+    q, k = query[index_target.long()], key[index_refer.long()]  # (m, g, c)
+    output += torch.einsum("mgc,mgc,c->mg", q, k, weight)
+
+
+def attention_relation_step_backward_cpu(
+    m,
+    g,
+    c,
+    query,
+    grad_query,
+    key,
+    grad_key,
+    weight,
+    grad_weight,
+    index_target,
+    index_refer,
+    grad_output,
+):
+    index_target, index_refer = index_target.long(), index_refer.long()
+    q, k = query[index_target], key[index_refer]  # (m, g, c)
+    grad = grad_output.unsqueeze(-1)  # (m, g, 1)
+    grad_query.index_add_(0, index_target, grad * k * weight)
+    grad_key.index_add_(0, index_refer, grad * q * weight)
+    grad_weight += (grad * q * k).sum((0, 1))
+
+
+def attention_fusion_step_forward_cpu(
+    m, g, c, weight, value, index_target, index_refer, output
+):
+    fusion = weight.unsqueeze(-1) * value[index_refer.long()]  # (m, g, c)
+    output.index_add_(0, index_target.long(), fusion)
+
+
+def attention_fusion_step_backward_cpu(
+    m,
+    g,
+    c,
+    weight,
+    grad_weight,
+    value,
+    grad_value,
+    index_target,
+    index_refer,
+    grad_output,
+):
+    index_target, index_refer = index_target.long(), index_refer.long()
+    grad = grad_output[index_target]  # (m, g, c)
+    grad_weight += (grad * value[index_refer]).sum(-1)
+    grad_value.index_add_(0, index_refer, grad * weight.unsqueeze(-1))
@@ -1,7 +1,12 @@
 import torch
 from torch.autograd import Function
 
-from pointops._C import grouping_forward_cuda, grouping_backward_cuda
+from .cpu import grouping_forward_cpu, grouping_backward_cpu
+
+try:
+    from pointops._C import grouping_forward_cuda, grouping_backward_cuda
+except ImportError:  # built without CUDA, CPU backend only
+    grouping_forward_cuda = grouping_backward_cuda = None
 
 
 class Grouping(Function):
@@ -13,8 +18,11 @@ class Grouping(Function):
         """
         assert input.is_contiguous() and idx.is_contiguous()
         m, nsample, n, c = idx.shape[0], idx.shape[1], input.shape[0], input.shape[1]
-        output = torch.cuda.FloatTensor(m, nsample, c)
-        grouping_forward_cuda(m, nsample, c, input, idx, output)
+        output = torch.empty((m, nsample, c), dtype=torch.float32, device=input.device)
+        grouping_forward = (
+            grouping_forward_cuda if input.is_cuda else grouping_forward_cpu
+        )
+        grouping_forward(m, nsample, c, input, idx, output)
         ctx.n = n
         ctx.save_for_backward(idx)
         return output
@@ -28,8 +36,11 @@ class Grouping(Function):
         n = ctx.n
         (idx,) = ctx.saved_tensors
         m, nsample, c = grad_output.shape
-        grad_input = torch.cuda.FloatTensor(n, c).zero_()
-        grouping_backward_cuda(m, nsample, c, grad_output, idx, grad_input)
+        grad_input = torch.zeros((n, c), dtype=torch.float32, device=grad_output.device)
+        grouping_backward = (
+            grouping_backward_cuda if grad_output.is_cuda else grouping_backward_cpu
+        )
+        grouping_backward(m, nsample, c, grad_output, idx, grad_input)
         return grad_input, None
 
 
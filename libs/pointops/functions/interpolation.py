@@ -1,8 +1,13 @@
 import torch
 from torch.autograd import Function
 
-from pointops._C import interpolation_forward_cuda, interpolation_backward_cuda
 from .query import knn_query
+from .cpu import interpolation_forward_cpu, interpolation_backward_cpu
+
+try:
+    from pointops._C import interpolation_forward_cuda, interpolation_backward_cuda
+except ImportError:  # built without CUDA, CPU backend only
+    interpolation_forward_cuda = interpolation_backward_cuda = None
 
 
 def interpolation(xyz, new_xyz, feat, offset, new_offset, k=3):
@@ -16,7 +21,9 @@ def interpolation(xyz, new_xyz, feat, offset, new_offset, k=3):
     norm = torch.sum(dist_recip, dim=1, keepdim=True)
     weight = dist_recip / norm  # (n, 3)
 
-    new_feat = torch.cuda.FloatTensor(new_xyz.shape[0], feat.shape[1]).zero_()
+    new_feat = torch.zeros(
+        (new_xyz.shape[0], feat.shape[1]), dtype=torch.float32, device=feat.device
+    )
     for i in range(k):
         new_feat += feat[idx[:, i].long(), :] * weight[:, i].unsqueeze(-1)
     return new_feat
@@ -36,8 +43,11 @@ class Interpolation(Function):
         weight = dist_recip / norm  # (n, k)
 
         n, c, m = new_xyz.shape[0], input.shape[1], input.shape[0]
-        output = torch.cuda.FloatTensor(n, c).zero_()
-        interpolation_forward_cuda(n, c, k, input, idx, weight, output)
+        output = torch.zeros((n, c), dtype=torch.float32, device=input.device)
+        interpolation_forward = (
+            interpolation_forward_cuda if input.is_cuda else interpolation_forward_cpu
+        )
+        interpolation_forward(n, c, k, input, idx, weight, output)
         ctx.m, ctx.k = m, k
         ctx.save_for_backward(idx, weight)
         return output
@@ -51,8 +61,13 @@ class Interpolation(Function):
         m, k = ctx.m, ctx.k
         idx, weight = ctx.saved_tensors
         n, c = grad_output.shape
-        grad_input = torch.cuda.FloatTensor(m, c).zero_()
-        interpolation_backward_cuda(n, c, k, grad_output, idx, weight, grad_input)
+        grad_input = torch.zeros((m, c), dtype=torch.float32, device=grad_output.device)
+        interpolation_backward = (
+            interpolation_backward_cuda
+            if grad_output.is_cuda
+            else interpolation_backward_cpu
+        )
+        interpolation_backward(n, c, k, grad_output, idx, weight, grad_input)
         return None, None, grad_input, None, None, None
 
 
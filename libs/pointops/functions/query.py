@@ -1,7 +1,12 @@
 import torch
 from torch.autograd import Function
 
-from pointops._C import knn_query_cuda, random_ball_query_cuda, ball_query_cuda
+from .cpu import knn_query_cpu, random_ball_query_cpu, ball_query_cpu
+
+try:
+    from pointops._C import knn_query_cuda, random_ball_query_cuda, ball_query_cuda
+except ImportError:  # built without CUDA, CPU backend only
+    knn_query_cuda = random_ball_query_cuda = ball_query_cuda = None
 
 
 class KNNQuery(Function):
@@ -16,11 +21,10 @@ class KNNQuery(Function):
             new_offset = offset
         assert xyz.is_contiguous() and new_xyz.is_contiguous()
         m = new_xyz.shape[0]
-        idx = torch.cuda.IntTensor(m, nsample).zero_()
-        dist2 = torch.cuda.FloatTensor(m, nsample).zero_()
-        knn_query_cuda(
-            m, nsample, xyz, new_xyz, offset.int(), new_offset.int(), idx, dist2
-        )
+        idx = torch.zeros((m, nsample), dtype=torch.int32, device=xyz.device)
+        dist2 = torch.zeros((m, nsample), dtype=torch.float32, device=xyz.device)
+        knn_query = knn_query_cuda if xyz.is_cuda else knn_query_cpu
+        knn_query(m, nsample, xyz, new_xyz, offset.int(), new_offset.int(), idx, dist2)
         return idx, torch.sqrt(dist2)
 
 
@@ -52,9 +56,12 @@ class RandomBallQuery(Function):
                 torch.randperm(e_k - s_k, dtype=torch.int32, device=offset.device) + s_k
             )
         order = torch.cat(order, dim=0)
-        idx = torch.cuda.IntTensor(m, nsample).zero_()
-        dist2 = torch.cuda.FloatTensor(m, nsample).zero_()
-        random_ball_query_cuda(
+        idx = torch.zeros((m, nsample), dtype=torch.int32, device=xyz.device)
+        dist2 = torch.zeros((m, nsample), dtype=torch.float32, device=xyz.device)
+        random_ball_query = (
+            random_ball_query_cuda if xyz.is_cuda else random_ball_query_cpu
+        )
+        random_ball_query(
             m,
             nsample,
             min_radius,
@@ -91,9 +98,10 @@ class BallQuery(Function):
         assert min_radius < max_radius
 
         m = new_xyz.shape[0]
-        idx = torch.cuda.IntTensor(m, nsample).zero_()
-        dist2 = torch.cuda.FloatTensor(m, nsample).zero_()
-        ball_query_cuda(
+        idx = torch.zeros((m, nsample), dtype=torch.int32, device=xyz.device)
+        dist2 = torch.zeros((m, nsample), dtype=torch.float32, device=xyz.device)
+        ball_query = ball_query_cuda if xyz.is_cuda else ball_query_cpu
+        ball_query(
             m,
             nsample,
             min_radius,
@@ -1,7 +1,12 @@
 import torch
 from torch.autograd import Function
 
-from pointops._C import farthest_point_sampling_cuda
+from .cpu import farthest_point_sampling_cpu
+
+try:
+    from pointops._C import farthest_point_sampling_cuda
+except ImportError:  # built without CUDA, CPU backend only
+    farthest_point_sampling_cuda = None
 
 
 class FarthestPointSampling(Function):
@@ -12,16 +17,84 @@ class FarthestPointSampling(Function):
         output: idx: (m)
         """
         assert xyz.is_contiguous()
-        n, b, n_max = xyz.shape[0], offset.shape[0], offset[0]
-        for i in range(1, b):
-            n_max = max(offset[i] - offset[i - 1], n_max)
-        idx = torch.cuda.IntTensor(new_offset[b - 1].item()).zero_()
-        tmp = torch.cuda.FloatTensor(n).fill_(1e10)
-        farthest_point_sampling_cuda(
-            b, n_max, xyz, offset.int(), new_offset.int(), tmp, idx
+        n, b = xyz.shape[0], offset.shape[0]
+        # output size and largest batch with a single host sync
+        count = torch.diff(offset, prepend=offset.new_zeros(1))
+        m, n_max = torch.stack([new_offset[-1], count.max()]).tolist()
+        idx = torch.zeros(m, dtype=torch.int32, device=xyz.device)
+        tmp = torch.full((n,), 1e10, dtype=torch.float32, device=xyz.device)
+        farthest_point_sampling = (
+            farthest_point_sampling_cuda if xyz.is_cuda else farthest_point_sampling_cpu
         )
+        farthest_point_sampling(b, n_max, xyz, offset.int(), new_offset.int(), tmp, idx)
         del tmp
         return idx
 
 
 farthest_point_sampling = FarthestPointSampling.apply
+
+
+def _part1by2(x):
+    # spread the lower 16 bits of x to every third bit
+    x = x & 0xFFFF
+    x = (x | (x << 16)) & 0xFF0000FF
+    x = (x | (x << 8)) & 0x0F00F00F00F00F
+    x = (x | (x << 4)) & 0xC30C30C30C30C3
+    x = (x | (x << 2)) & 0x249249249249249
+    return x
+
+
+def bucket_farthest_point_sampling(xyz, offset, new_offset, bucket_size=512):
+    """
+    Approximate FPS: points of each batch are ordered along a z-order curve and cut
+    into spatially compact buckets of about bucket_size points (at least n / m, so
+    every bucket gets a sample), and FPS runs on all buckets in parallel with a
+    share of samples proportional to the bucket size. Costs about O(n * bucket_size
+    * m / n) instead of O(n * m); coverage degrades only near bucket borders.
+    input: coords: (n, 3), offset: (b), new_offset: (b)
+    output: idx: (m), sampled points of batch i stay in new_offset[i - 1]:new_offset[i]
+    """
+    assert xyz.is_contiguous()
+    n, b = xyz.shape[0], offset.shape[0]
+    offset, new_offset = offset.long(), new_offset.long()
+    count = torch.diff(offset, prepend=offset.new_zeros(1))
+    new_count = torch.diff(new_offset, prepend=new_offset.new_zeros(1))
+    start, new_start = offset - count, new_offset - new_count
+    batch = torch.repeat_interleave(
+        torch.arange(b, device=xyz.device), count, output_size=n
+    )
+
+    # z-order code on a 16 bit grid over each batch bound, batch index on top
+    index = batch.unsqueeze(-1).expand(-1, 3)
+    inf = torch.full((b, 3), float("inf"), device=xyz.device)
+    coord_min = inf.scatter_reduce(0, index, xyz, reduce="amin")
+    coord_max = (-inf).scatter_reduce(0, index, xyz, reduce="amax")
+    scale = 65535 / (coord_max - coord_min).clamp(min=1e-8)
+    grid = ((xyz - coord_min[batch]) * scale[batch]).long()
+    code = _part1by2(grid[:, 0]) | (_part1by2(grid[:, 1]) << 1)
+    code = code | (_part1by2(grid[:, 2]) << 2) | (batch << 48)
+    order = torch.argsort(code)
+
+    # k-th bucket of batch i covers [k * count_i // k_i, (k + 1) * count_i // k_i)
+    min_size = torch.div(
+        count + new_count - 1, new_count.clamp(min=1), rounding_mode="floor"
+    )
+    num_bucket = torch.div(
+        count, min_size.clamp(min=bucket_size), rounding_mode="floor"
+    )
+    num_bucket = num_bucket.clamp(min=1)
+    total = int(num_bucket.sum())
+    bucket_batch = torch.repeat_interleave(
+        torch.arange(b, device=xyz.device), num_bucket, output_size=total
+    )
+    k = torch.arange(total, device=xyz.device)
+    k = k - (torch.cumsum(num_bucket, 0) - num_bucket)[bucket_batch] + 1
+    bucket_end = k * count[bucket_batch] // num_bucket[bucket_batch]
+    bucket_new_end = bucket_end * new_count[bucket_batch] // count[bucket_batch]
+    bucket_offset = (start[bucket_batch] + bucket_end).int()
+    bucket_new_offset = (new_start[bucket_batch] + bucket_new_end).int()
+
+    idx = FarthestPointSampling.apply(
+        xyz[order].contiguous(), bucket_offset, bucket_new_offset
+    )
+    return order[idx.long()].int()
@@ -1,7 +1,12 @@
 import torch
 from torch.autograd import Function
 
-from pointops._C import subtraction_forward_cuda, subtraction_backward_cuda
+from .cpu import subtraction_forward_cpu, subtraction_backward_cpu
+
+try:
+    from pointops._C import subtraction_forward_cuda, subtraction_backward_cuda
+except ImportError:  # built without CUDA, CPU backend only
+    subtraction_forward_cuda = subtraction_backward_cuda = None
 
 
 class Subtraction(Function):
@@ -14,8 +19,11 @@ class Subtraction(Function):
         assert input1.is_contiguous() and input2.is_contiguous()
         n, c = input1.shape
         nsample = idx.shape[-1]
-        output = torch.cuda.FloatTensor(n, nsample, c).zero_()
-        subtraction_forward_cuda(n, nsample, c, input1, input2, idx, output)
+        output = torch.zeros((n, nsample, c), dtype=torch.float32, device=input1.device)
+        subtraction_forward = (
+            subtraction_forward_cuda if input1.is_cuda else subtraction_forward_cpu
+        )
+        subtraction_forward(n, nsample, c, input1, input2, idx, output)
         ctx.save_for_backward(idx)
         return output
 
@@ -27,11 +35,18 @@ class Subtraction(Function):
         """
         (idx,) = ctx.saved_tensors
         n, nsample, c = grad_output.shape
-        grad_input1 = torch.cuda.FloatTensor(n, c).zero_()
-        grad_input2 = torch.cuda.FloatTensor(n, c).zero_()
-        subtraction_backward_cuda(
-            n, nsample, c, idx, grad_output, grad_input1, grad_input2
+        grad_input1 = torch.zeros(
+            (n, c), dtype=torch.float32, device=grad_output.device
+        )
+        grad_input2 = torch.zeros(
+            (n, c), dtype=torch.float32, device=grad_output.device
+        )
+        subtraction_backward = (
+            subtraction_backward_cuda
+            if grad_output.is_cuda
+            else subtraction_backward_cpu
         )
+        subtraction_backward(n, nsample, c, idx, grad_output, grad_input1, grad_input2)
         return grad_input1, grad_input2, None
 
 
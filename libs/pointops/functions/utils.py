@@ -39,6 +39,30 @@ def ball_query_and_group(
     return grouping(idx, feat, xyz, new_xyz, with_xyz), idx
 
 
+def dilated_knn_index(idx, nsample, dilation, offset, new_offset):
+    """
+    Pick every (dilation + 1)-th of the 1 + (nsample - 1) * (dilation + 1) nearest
+    neighbours, batches with less points spread nsample over all their neighbours
+    (soft dilation). Tensor ops only, no host sync.
+    input: idx: (m, 1 + (nsample - 1) * (dilation + 1)), offset: (b), new_offset: (b)
+    output: idx: (m, nsample)
+    """
+    num_samples_total = 1 + (nsample - 1) * (dilation + 1)
+    count = torch.diff(offset, prepend=offset.new_zeros(1))
+    new_count = torch.diff(new_offset, prepend=new_offset.new_zeros(1))
+    soft_dilation = torch.where(
+        count < num_samples_total,
+        (count - 1).double() / max(nsample - 1, 1) - 1,
+        torch.full_like(count, dilation, dtype=torch.double),
+    )
+    column = torch.arange(nsample, device=offset.device).double()
+    column = ((soft_dilation.unsqueeze(1) + 1) * column).long()  # (b, nsample)
+    column = column.repeat_interleave(
+        new_count.long(), dim=0, output_size=idx.shape[0]
+    )  # (m, nsample)
+    return torch.gather(idx, 1, column)
+
+
 def query_and_group(
     nsample,
     xyz,
@@ -65,23 +89,9 @@ def query_and_group(
         idx_no_dilation, _ = knn_query(
             num_samples_total, xyz, offset, new_xyz, new_offset
         )  # (m, nsample * (d + 1))
-        idx = []
-        batch_end = offset.tolist()
-        batch_start = [0] + batch_end[:-1]
-        new_batch_end = new_offset.tolist()
-        new_batch_start = [0] + new_batch_end[:-1]
-        for i in range(offset.shape[0]):
-            if batch_end[i] - batch_start[i] < num_samples_total:
-                soft_dilation = (batch_end[i] - batch_start[i] - 1) / (nsample - 1) - 1
-            else:
-                soft_dilation = dilation
-            idx.append(
-                idx_no_dilation[
-                    new_batch_start[i] : new_batch_end[i],
-                    [int((soft_dilation + 1) * i) for i in range(nsample)],
-                ]
-            )
-        idx = torch.cat(idx, dim=0)
+        idx = dilated_knn_index(
+            idx_no_dilation, nsample, dilation, offset, new_offset
+        )  # (m, nsample)
 
     if not with_feat:
         return idx
@@ -100,21 +110,10 @@ def query_and_group(
 
 
 def offset2batch(offset):
-    return (
-        torch.cat(
-            [
-                (
-                    torch.tensor([i] * (o - offset[i - 1]))
-                    if i > 0
-                    else torch.tensor([i] * o)
-                )
-                for i, o in enumerate(offset)
-            ],
-            dim=0,
-        )
-        .long()
-        .to(offset.device)
-    )
+    bincount = torch.diff(offset, prepend=offset.new_zeros(1))
+    return torch.arange(
+        len(bincount), device=offset.device, dtype=torch.long
+    ).repeat_interleave(bincount)
 
 
 def batch2offset(batch):
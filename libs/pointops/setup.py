@@ -1,6 +1,6 @@
 import os
 from setuptools import setup
-from torch.utils.cpp_extension import BuildExtension, CUDAExtension
+from torch.utils.cpp_extension import BuildExtension, CUDAExtension, CUDA_HOME
 from distutils.sysconfig import get_config_vars
 
 (opt,) = get_config_vars("OPT")
@@ -16,18 +16,25 @@ sources = [
     if file.endswith(".cpp") or file.endswith(".cu")
 ]
 
+# without a CUDA toolkit only the pure python CPU backend (functions/cpu.py) is installed
+ext_modules = (
+    [
+        CUDAExtension(
+            name="pointops._C",
+            sources=sources,
+            extra_compile_args={"cxx": ["-g"], "nvcc": ["-O2"]},
+        )
+    ]
+    if CUDA_HOME is not None
+    else []
+)
+
 setup(
     name="pointops",
     version="1.0",
     install_requires=["torch", "numpy"],
     packages=["pointops"],
     package_dir={"pointops": "functions"},
-    ext_modules=[
-        CUDAExtension(
-            name="pointops._C",
-            sources=sources,
-            extra_compile_args={"cxx": ["-g"], "nvcc": ["-O2"]},
-        )
-    ],
+    ext_modules=ext_modules,
     cmdclass={"build_ext": BuildExtension},
 )
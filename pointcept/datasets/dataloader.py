@@ -1,5 +1,8 @@
+import time
+import itertools
 from functools import partial
 import weakref
+import numpy as np
 import torch
 import torch.utils.data
 
@@ -9,6 +12,14 @@ from pointcept.datasets import ConcatDataset
 from pointcept.utils.env import set_seed
 
 
+def worker_kwargs(num_workers, prefetch_factor=None):
+    # DataLoader worker arguments, prefetch_factor and persistent_workers need workers
+    kwargs = dict(num_workers=num_workers, persistent_workers=num_workers > 0)
+    if num_workers > 0 and prefetch_factor is not None:
+        kwargs["prefetch_factor"] = prefetch_factor
+    return kwargs
+
+
 class MultiDatasetDummySampler:
     def __init__(self):
         self.dataloader = None
@@ -33,6 +44,8 @@ class MultiDatasetDataloader:
         num_worker_per_gpu: int,
         mix_prob=0,
         seed=None,
+        prefetch_factor=None,
+        pin_memory=True,
     ):
         self.datasets = concat_dataset.datasets
         self.ratios = [dataset.loop for dataset in self.datasets]
@@ -67,13 +80,12 @@ class MultiDatasetDataloader:
                     dataset,
                     batch_size=batch_size_per_gpu,
                     shuffle=(sampler is None),
-                    num_workers=num_worker_per_gpu,
                     sampler=sampler,
                     collate_fn=partial(point_collate_fn, mix_prob=mix_prob),
-                    pin_memory=True,
+                    pin_memory=pin_memory,
                     worker_init_fn=init_fn,
                     drop_last=True,
-                    persistent_workers=True,
+                    **worker_kwargs(num_workers, prefetch_factor),
                 )
             )
         self.sampler = MultiDatasetDummySampler()
@@ -110,3 +122,130 @@ class MultiDatasetDataloader:
             + seed
         )
         set_seed(worker_seed)
+
+
+def benchmark_dataloader(
+    dataset,
+    batch_size,
+    num_workers,
+    prefetch_factor=None,
+    pin_memory=True,
+    num_batches=20,
+    warmup_batches=2,
+    mix_prob=0,
+):
+    """
+    Samples per second of a DataLoader over dataset with the training collate,
+    measured over num_batches after warmup_batches (worker start up excluded).
+    """
+    loader = torch.utils.data.DataLoader(
+        dataset,
+        batch_size=batch_size,
+        shuffle=True,
+        collate_fn=partial(point_collate_fn, mix_prob=mix_prob),
+        pin_memory=pin_memory and torch.cuda.is_available(),
+        drop_last=True,
+        **worker_kwargs(num_workers, prefetch_factor),
+    )
+    iterator = iter(loader)
+    count = 0
+    for _ in itertools.islice(iterator, warmup_batches):
+        pass
+    start = time.perf_counter()
+    for _ in itertools.islice(iterator, num_batches):
+        count += 1
+    elapsed = time.perf_counter() - start
+    return count * batch_size / elapsed if count > 0 else 0.0
+
+
+def tune_dataloader(
+    dataset,
+    batch_size,
+    num_workers=(2, 4, 8),
+    prefetch_factor=(2, 4),
+    pin_memory=(True,),
+    num_batches=20,
+    warmup_batches=2,
+    mix_prob=0,
+    tolerance=0.05,
+    logger=None,
+):
+    """
+    Sweep num_workers x prefetch_factor x pin_memory with benchmark_dataloader.
+    Return the recommended setting, the cheapest one (fewest workers, then smallest
+    prefetch) within tolerance of the best throughput, and all results.
+    """
+    results = []
+    for workers, prefetch, pin in itertools.product(
+        num_workers, prefetch_factor, pin_memory
+    ):
+        if workers == 0 and prefetch != prefetch_factor[0]:
+            continue  # prefetch_factor needs workers
+        throughput = benchmark_dataloader(
+            dataset,
+            batch_size,
+            workers,
+            prefetch_factor=prefetch if workers > 0 else None,
+            pin_memory=pin,
+            num_batches=num_batches,
+            warmup_batches=warmup_batches,
+            mix_prob=mix_prob,
+        )
+        setting = dict(num_workers=workers, prefetch_factor=prefetch, pin_memory=pin)
+        results.append((setting, throughput))
+        if logger is not None:
+            logger.info(
+                "num_workers {num_workers} prefetch_factor {prefetch_factor} "
+                "pin_memory {pin_memory}: {throughput:.2f} samples/s".format(
+                    throughput=throughput, **setting
+                )
+            )
+    best = max(throughput for _, throughput in results)
+    candidates = [
+        (setting, throughput)
+        for setting, throughput in results
+        if throughput >= best * (1 - tolerance)
+    ]
+    recommended = min(
+        candidates,
+        key=lambda x: (x[0]["num_workers"], x[0]["prefetch_factor"], -x[1]),
+    )[0]
+    return recommended, results
+
+
+def profile_transform(dataset, num_samples=16, seed=0):
+    """
+    Per transform latency (ms) and output point count on CPU, averaged over
+    num_samples of a DefaultDataset like dataset (get_data, then the transform
+    profiled with Compose.enable_profile).
+    """
+    if hasattr(dataset, "datasets"):
+        # ConcatDataset, profile the sub datasets
+        return {
+            f"{i}/{name}": value
+            for i, sub_dataset in enumerate(dataset.datasets)
+            for name, value in profile_transform(sub_dataset, num_samples, seed).items()
+        }
+    rng = np.random.default_rng(seed)
+    num_data = len(dataset.data_list)
+    indices = rng.choice(num_data, min(num_samples, num_data), replace=False)
+    load, points = 0.0, 0
+    dataset.transform.enable_profile(max_workers=0)
+    try:
+        for idx in indices:
+            start = time.perf_counter()
+            data_dict = dataset.get_data(int(idx))
+            load += time.perf_counter() - start
+            points += dataset.transform.num_points(data_dict)
+            dataset.transform(data_dict)
+        summary = dataset.transform.profile_summary()
+    finally:
+        dataset.transform.disable_profile()
+    stats = dict(
+        load=dict(latency=load / len(indices) * 1000, points=points / len(indices))
+    )
+    for value in summary:
+        stats[value["name"]] = dict(
+            latency=value["latency"], points=value["points_out"]
+        )
+    return stats
@@ -7,6 +7,7 @@ Please cite our work if the code is helpful to you.
 
 import os
 import glob
+import hashlib
 import numpy as np
 import torch
 from copy import deepcopy
@@ -14,9 +15,10 @@ from torch.utils.data import Dataset
 from collections.abc import Sequence
 
 from pointcept.utils.logger import get_root_logger
-from pointcept.utils.cache import shared_dict
+from pointcept.utils.cache import SceneCache
 
 from .builder import DATASETS, build_dataset
+from .storage import PackedSceneStore, cast_asset
 from .transform import Compose, TRANSFORMS
 
 
@@ -40,14 +42,25 @@ class DefaultDataset(Dataset):
         test_mode=False,
         test_cfg=None,
         cache=False,
+        storage="npy",
         ignore_index=-1,
         loop=1,
+        fuse_transform=False,
     ):
         super(DefaultDataset, self).__init__()
         self.data_root = data_root
         self.split = split
-        self.transform = Compose(transform)
-        self.cache = cache
+        # fuse consecutive geometric transforms (see Compose)
+        self.transform = Compose(transform, fuse=fuse_transform)
+        self.cache = self.build_cache(cache)
+        assert storage in ["npy", "packed"]
+        self.storage = storage
+        # packed store created by tools/pack_dataset.py
+        self.packed_store = (
+            PackedSceneStore(os.path.join(data_root, "packed"))
+            if storage == "packed"
+            else None
+        )
         self.ignore_index = ignore_index
         self.loop = (
             loop if not test_mode else 1
@@ -60,8 +73,12 @@ class DefaultDataset(Dataset):
             self.test_crop = (
                 TRANSFORMS.build(self.test_cfg.crop) if self.test_cfg.crop else None
             )
-            self.post_transform = Compose(self.test_cfg.post_transform)
-            self.aug_transform = [Compose(aug) for aug in self.test_cfg.aug_transform]
+            self.post_transform = Compose(
+                self.test_cfg.post_transform, fuse=fuse_transform
+            )
+            self.aug_transform = [
+                Compose(aug, fuse=fuse_transform) for aug in self.test_cfg.aug_transform
+            ]
 
         self.data_list = self.get_data_list()
         logger = get_root_logger()
@@ -73,50 +90,99 @@ class DefaultDataset(Dataset):
 
     def get_data_list(self):
         if isinstance(self.split, str):
-            data_list = glob.glob(os.path.join(self.data_root, self.split, "*"))
+            data_list = self.glob_data(os.path.join(self.data_root, self.split, "*"))
         elif isinstance(self.split, Sequence):
             data_list = []
             for split in self.split:
-                data_list += glob.glob(os.path.join(self.data_root, split, "*"))
+                data_list += self.glob_data(os.path.join(self.data_root, split, "*"))
         else:
             raise NotImplementedError
         return data_list
 
+    def glob_data(self, pattern):
+        """
+        glob.glob on the npy directory tree, or on scene keys of the packed store.
+        """
+        if self.storage == "packed":
+            pattern = os.path.relpath(pattern, self.data_root)
+            return [
+                os.path.join(self.data_root, key)
+                for key in self.packed_store.glob(pattern)
+            ]
+        return glob.glob(pattern)
+
+    def build_cache(self, cache):
+        """
+        cache: False, True (default SceneCache) or SceneCache kwargs, e.g.
+            cache=dict(backend="shm", budget="32G", policy="lru")
+        """
+        if not cache:
+            return None
+        cache = dict() if cache is True else dict(cache)
+        # datasets of the same type and data root share cached scenes across jobs
+        cache.setdefault(
+            "namespace",
+            "{}-{}".format(
+                self.__class__.__name__,
+                hashlib.md5(os.path.abspath(self.data_root).encode()).hexdigest()[:8],
+            ),
+        )
+        return SceneCache(**cache)
+
+    def load_assets(self, data_path):
+        key = os.path.relpath(data_path, self.data_root)
+        if self.cache is not None:
+            data_dict = self.cache.get(key)
+            if data_dict is not None:
+                return data_dict
+
+        if self.storage == "packed":
+            data_dict = self.packed_store.load(key, assets=self.VALID_ASSETS)
+        else:
+            data_dict = {}
+            assets = os.listdir(data_path)
+            for asset in assets:
+                if not asset.endswith(".npy"):
+                    continue
+                if asset[:-4] not in self.VALID_ASSETS:
+                    continue
+                data_dict[asset[:-4]] = np.load(os.path.join(data_path, asset))
+
+        if self.cache is not None:
+            # cache assets in the dtype consumed by get_data
+            data_dict = {k: cast_asset(k, v) for k, v in data_dict.items()}
+            self.cache.put(key, data_dict)
+        return data_dict
+
     def get_data(self, idx):
         data_path = self.data_list[idx % len(self.data_list)]
         name = self.get_data_name(idx)
-        if self.cache:
-            cache_name = f"pointcept-{name}"
-            return shared_dict(cache_name)
-
-        data_dict = {}
-        assets = os.listdir(data_path)
-        for asset in assets:
-            if not asset.endswith(".npy"):
-                continue
-            if asset[:-4] not in self.VALID_ASSETS:
-                continue
-            data_dict[asset[:-4]] = np.load(os.path.join(data_path, asset))
+        data_dict = self.load_assets(data_path)
         data_dict["name"] = name
 
+        # copy=False: assets from packed store or cache are already in target dtype
         if "coord" in data_dict.keys():
-            data_dict["coord"] = data_dict["coord"].astype(np.float32)
+            data_dict["coord"] = data_dict["coord"].astype(np.float32, copy=False)
 
         if "color" in data_dict.keys():
-            data_dict["color"] = data_dict["color"].astype(np.float32)
+            data_dict["color"] = data_dict["color"].astype(np.float32, copy=False)
 
         if "normal" in data_dict.keys():
-            data_dict["normal"] = data_dict["normal"].astype(np.float32)
+            data_dict["normal"] = data_dict["normal"].astype(np.float32, copy=False)
 
         if "segment" in data_dict.keys():
-            data_dict["segment"] = data_dict["segment"].reshape([-1]).astype(np.int32)
+            data_dict["segment"] = (
+                data_dict["segment"].reshape([-1]).astype(np.int32, copy=False)
+            )
         else:
             data_dict["segment"] = (
                 np.ones(data_dict["coord"].shape[0], dtype=np.int32) * -1
             )
 
         if "instance" in data_dict.keys():
-            data_dict["instance"] = data_dict["instance"].reshape([-1]).astype(np.int32)
+            data_dict["instance"] = (
+                data_dict["instance"].reshape([-1]).astype(np.int32, copy=False)
+            )
         else:
             data_dict["instance"] = (
                 np.ones(data_dict["coord"].shape[0], dtype=np.int32) * -1
@@ -126,6 +192,25 @@ class DefaultDataset(Dataset):
     def get_data_name(self, idx):
         return os.path.basename(self.data_list[idx % len(self.data_list)])
 
+    def get_data_size(self, idx):
+        """
+        Stored size (bytes) of a sample without loading it, the cost estimate used
+        to dispatch large test scenes first. 0 if unknown.
+        """
+        data_path = self.data_list[idx % len(self.data_list)]
+        if not isinstance(data_path, str):
+            return 0
+        if self.storage == "packed":
+            key = os.path.relpath(data_path, self.data_root).replace(os.path.sep, "/")
+            return self.packed_store.scenes[key]["length"]
+        if os.path.isdir(data_path):
+            return sum(
+                os.path.getsize(os.path.join(data_path, asset))
+                for asset in os.listdir(data_path)
+                if asset.endswith(".npy")
+            )
+        return os.path.getsize(data_path) if os.path.isfile(data_path) else 0
+
     def prepare_train_data(self, idx):
         # load data
         data_dict = self.get_data(idx)
@@ -201,11 +286,18 @@ class ConcatDataset(Dataset):
 
     def get_data(self, idx):
         dataset_idx, data_idx = self.data_list[idx % len(self.data_list)]
-        return self.datasets[dataset_idx][data_idx]
+        return self.datasets[int(dataset_idx)][data_idx]
 
     def get_data_name(self, idx):
         dataset_idx, data_idx = self.data_list[idx % len(self.data_list)]
-        return self.datasets[dataset_idx].get_data_name(data_idx)
+        return self.datasets[int(dataset_idx)].get_data_name(data_idx)
+
+    def get_data_size(self, idx):
+        dataset_idx, data_idx = self.data_list[idx % len(self.data_list)]
+        dataset = self.datasets[int(dataset_idx)]
+        return (
+            dataset.get_data_size(data_idx) if hasattr(dataset, "get_data_size") else 0
+        )
 
     def __getitem__(self, idx):
         return self.get_data(idx)
@@ -93,11 +93,13 @@ class ModelNetDataset(Dataset):
             data = np.loadtxt(data_path, delimiter=",").astype(np.float32)
             if self.num_point is not None:
                 if self.uniform_sampling:
+                    # CPU backend of pointops if CUDA is unavailable
+                    device = "cuda" if torch.cuda.is_available() else "cpu"
                     with torch.no_grad():
                         mask = pointops.farthest_point_sampling(
-                            torch.tensor(data).float().cuda(),
-                            torch.tensor([len(data)]).long().cuda(),
-                            torch.tensor([self.num_point]).long().cuda(),
+                            torch.tensor(data).float().to(device),
+                            torch.tensor([len(data)]).long().to(device),
+                            torch.tensor([self.num_point]).long().to(device),
                         )
                     data = data[mask.cpu()]
                 else:
@@ -0,0 +1,196 @@
+"""
+Packed Scene Storage
+
+A packed store keeps every scene of a processed dataset (data_root/split/scene/*.npy)
+in a few large shard files plus one json index. Assets are saved with the dtype
+expected by DefaultDataset.get_data and each scene is page aligned, so loading
+a scene is a single mmap call returning zero-copy (copy-on-write) numpy views.
+
+Author: Xiaoyang Wu (xiaoyang.wu.cs@gmail.com)
+Please cite our work if the code is helpful to you.
+"""
+
+import os
+import mmap
+import json
+import fnmatch
+import numpy as np
+
+INDEX_FILE = "index.json"
+SHARD_FILE = "shard_{:05d}.bin"
+VERSION = 1
+ALIGNMENT = max(4096, mmap.ALLOCATIONGRANULARITY)
+
+# dtype casting applied at packing time, aligned with DefaultDataset.get_data
+FLOAT_ASSETS = ("coord", "color", "normal")
+LABEL_ASSETS = ("segment", "instance")
+
+
+def cast_asset(name, value):
+    if name in FLOAT_ASSETS:
+        return value.astype(np.float32)
+    if name.startswith(LABEL_ASSETS):
+        if value.ndim == 2 and value.shape[1] == 1:
+            value = value.reshape([-1])
+        return value.astype(np.int32)
+    return value
+
+
+def _align(value, alignment=ALIGNMENT):
+    return (value + alignment - 1) // alignment * alignment
+
+
+class PackedSceneWriter(object):
+    """
+    Write scenes into a packed store, e.g.
+        with PackedSceneWriter("data/scannet/packed") as writer:
+            writer.write("train/scene0000_00", dict(coord=..., color=...))
+    """
+
+    def __init__(self, store_root, shard_size=16 * 1024**3):
+        self.store_root = store_root
+        self.shard_size = shard_size
+        self.shards = []
+        self.scenes = dict()
+        self._file = None
+        self._offset = 0
+        os.makedirs(store_root, exist_ok=True)
+
+    def _open_shard(self):
+        if self._file is not None:
+            self._file.close()
+        self.shards.append(SHARD_FILE.format(len(self.shards)))
+        self._file = open(os.path.join(self.store_root, self.shards[-1]), "wb")
+        self._offset = 0
+
+    def write(self, key, data_dict):
+        key = key.replace(os.path.sep, "/")
+        assert key not in self.scenes, f"Scene {key} is already packed."
+        assets = dict()
+        length = 0
+        for name, value in data_dict.items():
+            value = np.ascontiguousarray(cast_asset(name, value))
+            asset_offset = _align(length, 64)
+            assets[name] = (asset_offset, value)
+            length = asset_offset + value.nbytes
+
+        if self._file is None or (
+            self._offset > 0 and self._offset + length > self.shard_size
+        ):
+            self._open_shard()
+        # each scene starts at a page boundary so that it can be mapped on its own
+        offset = self._offset
+        record = dict(shard=len(self.shards) - 1, offset=offset, length=length)
+        record["assets"] = dict()
+        for name, (asset_offset, value) in assets.items():
+            self._file.seek(offset + asset_offset)
+            self._file.write(value.tobytes())
+            record["assets"][name] = dict(
+                offset=asset_offset, dtype=value.dtype.str, shape=list(value.shape)
+            )
+        self._offset = _align(offset + length)
+        self.scenes[key] = record
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        index = dict(
+            version=VERSION, alignment=ALIGNMENT, shards=self.shards, scenes=self.scenes
+        )
+        with open(os.path.join(self.store_root, INDEX_FILE + ".tmp"), "w") as f:
+            json.dump(index, f)
+        os.replace(
+            os.path.join(self.store_root, INDEX_FILE + ".tmp"),
+            os.path.join(self.store_root, INDEX_FILE),
+        )
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+class PackedSceneStore(object):
+    """
+    Read-only access to a packed store. Shard file descriptors are opened lazily
+    in each process (dataloader workers included) and are not pickled.
+    """
+
+    def __init__(self, store_root):
+        self.store_root = store_root
+        with open(os.path.join(store_root, INDEX_FILE), "r") as f:
+            index = json.load(f)
+        assert index["version"] == VERSION, "Unsupported packed store version."
+        assert index["alignment"] % mmap.ALLOCATIONGRANULARITY == 0
+        self.shards = index["shards"]
+        self.scenes = index["scenes"]
+        self._fds = dict()
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["_fds"] = dict()
+        return state
+
+    def __del__(self):
+        for fd in getattr(self, "_fds", dict()).values():
+            os.close(fd)
+        self._fds = dict()
+
+    def __contains__(self, key):
+        return key.replace(os.path.sep, "/") in self.scenes
+
+    def __len__(self):
+        return len(self.scenes)
+
+    def keys(self):
+        return list(self.scenes.keys())
+
+    def glob(self, pattern):
+        """
+        Match scene keys against a glob pattern relative to the store, the wildcard
+        does not cross path separators (same as glob.glob).
+        """
+        pattern = pattern.replace(os.path.sep, "/")
+        depth = pattern.count("/")
+        return [
+            key
+            for key in self.scenes.keys()
+            if key.count("/") == depth and fnmatch.fnmatchcase(key, pattern)
+        ]
+
+    def _get_fd(self, shard):
+        if shard not in self._fds:
+            self._fds[shard] = os.open(
+                os.path.join(self.store_root, self.shards[shard]), os.O_RDONLY
+            )
+        return self._fds[shard]
+
+    def load(self, key, assets=None):
+        """
+        Load a scene as a dict of numpy arrays. Arrays are copy-on-write views of the
+        mapped shard, in-place modification is allowed and never reaches the file.
+        """
+        record = self.scenes[key.replace(os.path.sep, "/")]
+        if record["length"] > 0:
+            buffer = mmap.mmap(
+                self._get_fd(record["shard"]),
+                record["length"],
+                offset=record["offset"],
+                access=mmap.ACCESS_COPY,
+            )
+        else:
+            buffer = bytearray()
+        data_dict = {}
+        for name, asset in record["assets"].items():
+            if assets is not None and name not in assets:
+                continue
+            dtype = np.dtype(asset["dtype"])
+            data_dict[name] = np.frombuffer(
+                buffer,
+                dtype=dtype,
+                count=int(np.prod(asset["shape"])),
+                offset=asset["offset"],
+            ).reshape(asset["shape"])
+        return data_dict
@@ -6,7 +6,6 @@ Please cite our work if the code is helpful to you.
 """
 
 import os
-import glob
 from collections.abc import Sequence
 
 from .defaults import DefaultDataset
@@ -17,13 +16,13 @@ from .builder import DATASETS
 class Structured3DDataset(DefaultDataset):
     def get_data_list(self):
         if isinstance(self.split, str):
-            data_list = glob.glob(
+            data_list = self.glob_data(
                 os.path.join(self.data_root, self.split, "scene_*/room_*")
             )
         elif isinstance(self.split, Sequence):
             data_list = []
             for split in self.split:
-                data_list += glob.glob(
+                data_list += self.glob_data(
                     os.path.join(self.data_root, split, "scene_*/room_*")
                 )
         else:
@@ -7,21 +7,176 @@ Author: Xiaoyang Wu (xiaoyang.wu.cs@gmail.com)
 Please cite our work if the code is helpful to you.
 """
 
+import time
 import random
 import numbers
 import scipy
 import scipy.ndimage
 import scipy.interpolate
 import scipy.stats
+import scipy.spatial
 import numpy as np
 import torch
 import copy
 from collections.abc import Sequence, Mapping
 
 from pointcept.utils.registry import Registry
+from .utils import SchemaDict
 
 TRANSFORMS = Registry("transforms")
 
+# per point attributes, kept in sync by point subsetting transforms
+POINT_KEYS = (
+    "coord",
+    "origin_coord",
+    "grid_coord",
+    "displacement",
+    "color",
+    "normal",
+    "strength",
+    "segment",
+    "instance",
+)
+
+
+class PointAttributes(object):
+    """
+    Per point attributes of a data dict (present POINT_KEYS by default, or the given
+    keys which must exist). Index operations (integer or boolean) are composed
+    lazily and all attributes are gathered once, e.g.
+        PointAttributes(data_dict).subset(idx_crop).subset(mask).apply()
+    """
+
+    def __init__(self, data_dict, keys=None):
+        if keys is None:
+            keys = [key for key in POINT_KEYS if key in data_dict.keys()]
+        else:
+            keys = [keys] if isinstance(keys, str) else list(keys)
+            for key in keys:
+                if key not in data_dict.keys():
+                    raise KeyError(f"{key} is not in data_dict.")
+        self.data_dict = data_dict
+        self.keys = keys
+        self.index = None
+
+    def __len__(self):
+        # number of points after the pending index operations
+        if self.index is not None:
+            return self.index.shape[0]
+        if len(self.keys) > 0:
+            return self.data_dict[self.keys[0]].shape[0]
+        return 0
+
+    def subset(self, index):
+        index = np.asarray(index)
+        if index.dtype == bool:
+            assert len(self) == 0 or index.shape == (len(self),)
+            index = np.flatnonzero(index)
+        self.index = index if self.index is None else self.index[index]
+        return self
+
+    def gather(self):
+        if self.index is None:
+            return {key: self.data_dict[key] for key in self.keys}
+        return {key: self.data_dict[key][self.index] for key in self.keys}
+
+    def apply(self):
+        self.data_dict.update(self.gather())
+        self.index = None
+        return self.data_dict
+
+
+class AffineCoord(object):
+    """
+    Accumulate geometric transforms of data_dict["coord"] (and "normal") into one
+    4x4 affine matrix plus an additive noise term, applied with a single matmul.
+    Transforms with a fuse_coord method update it in place of __call__, drawing
+    random numbers in the same order (see Compose with fuse=True).
+    """
+
+    def __init__(self, data_dict):
+        self.data_dict = data_dict
+        self.coord = data_dict["coord"]
+        self.coord_dtype = self.coord.dtype
+        self.normal_dtype = (
+            data_dict["normal"].dtype if "normal" in data_dict.keys() else None
+        )
+        self.matrix = np.eye(4)
+        self.normal_matrix = np.eye(3)
+        self.noise = None
+        self._bound = None  # (min, max) of self.coord
+
+    @property
+    def num_points(self):
+        return self.coord.shape[0]
+
+    def is_axis_aligned(self):
+        linear = self.matrix[:3, :3]
+        return np.count_nonzero(linear - np.diag(np.diag(linear))) == 0
+
+    def bound(self):
+        """
+        (min, max) of the current coord. Derived from the cached bound while the
+        accumulated transform is axis aligned (shift / scale / flip), otherwise the
+        transform is materialized first.
+        """
+        if self.noise is not None or not self.is_axis_aligned():
+            self.materialize()
+        if self._bound is None:
+            self._bound = (self.coord.min(axis=0), self.coord.max(axis=0))
+        scale, shift = np.diag(self.matrix[:3, :3]), self.matrix[:3, 3]
+        coord_min = self._bound[0] * scale + shift
+        coord_max = self._bound[1] * scale + shift
+        return np.minimum(coord_min, coord_max), np.maximum(coord_min, coord_max)
+
+    def materialize(self):
+        if self.noise is None and np.array_equal(self.matrix, np.eye(4)):
+            return
+        coord = np.dot(self.coord, np.transpose(self.matrix[:3, :3]))
+        coord += self.matrix[:3, 3]
+        if self.noise is not None:
+            coord += self.noise
+        self.coord = coord
+        self.matrix = np.eye(4)
+        self.noise = None
+        self._bound = None
+
+    def transform(self, linear, center=None, normal=False, promote=False):
+        """
+        coord <- (coord - center) @ linear.T + center, normal <- normal @ linear.T
+        if normal. promote results to float64 as np.dot in the unfused transforms.
+        """
+        affine = np.eye(4)
+        affine[:3, :3] = linear
+        if center is not None:
+            center = np.asarray(center, dtype=np.float64)
+            affine[:3, 3] = center - np.dot(linear, center)
+        self.matrix = np.dot(affine, self.matrix)
+        if self.noise is not None:
+            self.noise = np.dot(self.noise, np.transpose(linear))
+        if normal:
+            self.normal_matrix = np.dot(linear, self.normal_matrix)
+        if promote:
+            self.coord_dtype = np.promote_types(self.coord_dtype, np.float64)
+            if normal and self.normal_dtype is not None:
+                self.normal_dtype = np.promote_types(self.normal_dtype, np.float64)
+
+    def translate(self, shift):
+        self.matrix[:3, 3] += shift
+
+    def add_noise(self, noise):
+        self.noise = noise if self.noise is None else self.noise + noise
+
+    def apply(self):
+        self.materialize()
+        self.data_dict["coord"] = self.coord.astype(self.coord_dtype, copy=False)
+        if "normal" in self.data_dict.keys() and not np.array_equal(
+            self.normal_matrix, np.eye(3)
+        ):
+            normal = np.dot(self.data_dict["normal"], np.transpose(self.normal_matrix))
+            self.data_dict["normal"] = normal.astype(self.normal_dtype, copy=False)
+        return self.data_dict
+
 
 @TRANSFORMS.register_module()
 class Collect(object):
@@ -36,17 +191,21 @@ class Collect(object):
         self.kwargs = kwargs
 
     def __call__(self, data_dict):
-        data = dict()
+        # the schema tells collate_fn how to batch each key (see SchemaDict)
+        data = SchemaDict(schema=dict())
         if isinstance(self.keys, str):
             self.keys = [self.keys]
         for key in self.keys:
             data[key] = data_dict[key]
+            data.schema[key] = "cat"
         for key, value in self.offset_keys.items():
             data[key] = torch.tensor([data_dict[value].shape[0]])
+            data.schema[key] = "offset"
         for name, keys in self.kwargs.items():
             name = name.replace("_keys", "")
             assert isinstance(keys, Sequence)
             data[name] = torch.cat([data_dict[key].float() for key in keys], dim=1)
+            data.schema[name] = "cat"
         return data
 
 
@@ -137,6 +296,9 @@ class PositiveShift(object):
             data_dict["coord"] -= coord_min
         return data_dict
 
+    def fuse_coord(self, affine):
+        affine.translate(-affine.bound()[0])
+
 
 @TRANSFORMS.register_module()
 class CenterShift(object):
@@ -154,6 +316,14 @@ class CenterShift(object):
             data_dict["coord"] -= shift
         return data_dict
 
+    def fuse_coord(self, affine):
+        (x_min, y_min, z_min), (x_max, y_max, _) = affine.bound()
+        if self.apply_z:
+            shift = [(x_min + x_max) / 2, (y_min + y_max) / 2, z_min]
+        else:
+            shift = [(x_min + x_max) / 2, (y_min + y_max) / 2, 0]
+        affine.translate(-np.array(shift))
+
 
 @TRANSFORMS.register_module()
 class RandomShift(object):
@@ -168,6 +338,12 @@ class RandomShift(object):
             data_dict["coord"] += [shift_x, shift_y, shift_z]
         return data_dict
 
+    def fuse_coord(self, affine):
+        shift_x = np.random.uniform(self.shift[0][0], self.shift[0][1])
+        shift_y = np.random.uniform(self.shift[1][0], self.shift[1][1])
+        shift_z = np.random.uniform(self.shift[2][0], self.shift[2][1])
+        affine.translate([shift_x, shift_y, shift_z])
+
 
 @TRANSFORMS.register_module()
 class PointClip(object):
@@ -203,18 +379,7 @@ class RandomDropout(object):
                 mask = np.zeros_like(data_dict["segment"]).astype(bool)
                 mask[data_dict["sampled_index"]] = True
                 data_dict["sampled_index"] = np.where(mask[idx])[0]
-            if "coord" in data_dict.keys():
-                data_dict["coord"] = data_dict["coord"][idx]
-            if "color" in data_dict.keys():
-                data_dict["color"] = data_dict["color"][idx]
-            if "normal" in data_dict.keys():
-                data_dict["normal"] = data_dict["normal"][idx]
-            if "strength" in data_dict.keys():
-                data_dict["strength"] = data_dict["strength"][idx]
-            if "segment" in data_dict.keys():
-                data_dict["segment"] = data_dict["segment"][idx]
-            if "instance" in data_dict.keys():
-                data_dict["instance"] = data_dict["instance"][idx]
+            PointAttributes(data_dict).subset(idx).apply()
         return data_dict
 
 
@@ -227,19 +392,27 @@ class RandomRotate(object):
         self.p = p if not self.always_apply else 1
         self.center = center
 
-    def __call__(self, data_dict):
-        if random.random() > self.p:
-            return data_dict
-        angle = np.random.uniform(self.angle[0], self.angle[1]) * np.pi
+    @staticmethod
+    def get_rotation_matrix(angle, axis):
         rot_cos, rot_sin = np.cos(angle), np.sin(angle)
-        if self.axis == "x":
+        if axis == "x":
             rot_t = np.array([[1, 0, 0], [0, rot_cos, -rot_sin], [0, rot_sin, rot_cos]])
-        elif self.axis == "y":
+        elif axis == "y":
             rot_t = np.array([[rot_cos, 0, rot_sin], [0, 1, 0], [-rot_sin, 0, rot_cos]])
-        elif self.axis == "z":
+        elif axis == "z":
             rot_t = np.array([[rot_cos, -rot_sin, 0], [rot_sin, rot_cos, 0], [0, 0, 1]])
         else:
             raise NotImplementedError
+        return rot_t
+
+    def sample_angle(self):
+        return np.random.uniform(self.angle[0], self.angle[1]) * np.pi
+
+    def __call__(self, data_dict):
+        if random.random() > self.p:
+            return data_dict
+        angle = self.sample_angle()
+        rot_t = RandomRotate.get_rotation_matrix(angle, self.axis)
         if "coord" in data_dict.keys():
             if self.center is None:
                 x_min, y_min, z_min = data_dict["coord"].min(axis=0)
@@ -254,6 +427,17 @@ class RandomRotate(object):
             data_dict["normal"] = np.dot(data_dict["normal"], np.transpose(rot_t))
         return data_dict
 
+    def fuse_coord(self, affine):
+        if random.random() > self.p:
+            return
+        rot_t = RandomRotate.get_rotation_matrix(self.sample_angle(), self.axis)
+        if self.center is None:
+            coord_min, coord_max = affine.bound()
+            center = (coord_min + coord_max) / 2
+        else:
+            center = self.center
+        affine.transform(rot_t, center=center, normal=True, promote=True)
+
 
 @TRANSFORMS.register_module()
 class RandomRotateTargetAngle(object):
@@ -266,19 +450,14 @@ class RandomRotateTargetAngle(object):
         self.p = p if not self.always_apply else 1
         self.center = center
 
+    def sample_angle(self):
+        return np.random.choice(self.angle) * np.pi
+
     def __call__(self, data_dict):
         if random.random() > self.p:
             return data_dict
-        angle = np.random.choice(self.angle) * np.pi
-        rot_cos, rot_sin = np.cos(angle), np.sin(angle)
-        if self.axis == "x":
-            rot_t = np.array([[1, 0, 0], [0, rot_cos, -rot_sin], [0, rot_sin, rot_cos]])
-        elif self.axis == "y":
-            rot_t = np.array([[rot_cos, 0, rot_sin], [0, 1, 0], [-rot_sin, 0, rot_cos]])
-        elif self.axis == "z":
-            rot_t = np.array([[rot_cos, -rot_sin, 0], [rot_sin, rot_cos, 0], [0, 0, 1]])
-        else:
-            raise NotImplementedError
+        angle = self.sample_angle()
+        rot_t = RandomRotate.get_rotation_matrix(angle, self.axis)
         if "coord" in data_dict.keys():
             if self.center is None:
                 x_min, y_min, z_min = data_dict["coord"].min(axis=0)
@@ -293,6 +472,17 @@ class RandomRotateTargetAngle(object):
             data_dict["normal"] = np.dot(data_dict["normal"], np.transpose(rot_t))
         return data_dict
 
+    def fuse_coord(self, affine):
+        if random.random() > self.p:
+            return
+        rot_t = RandomRotate.get_rotation_matrix(self.sample_angle(), self.axis)
+        if self.center is None:
+            coord_min, coord_max = affine.bound()
+            center = (coord_min + coord_max) / 2
+        else:
+            center = self.center
+        affine.transform(rot_t, center=center, normal=True, promote=True)
+
 
 @TRANSFORMS.register_module()
 class RandomScale(object):
@@ -308,6 +498,12 @@ class RandomScale(object):
             data_dict["coord"] *= scale
         return data_dict
 
+    def fuse_coord(self, affine):
+        scale = np.random.uniform(
+            self.scale[0], self.scale[1], 3 if self.anisotropic else 1
+        )
+        affine.transform(np.diag(np.ones(3) * scale))
+
 
 @TRANSFORMS.register_module()
 class RandomFlip(object):
@@ -327,6 +523,14 @@ class RandomFlip(object):
                 data_dict["normal"][:, 1] = -data_dict["normal"][:, 1]
         return data_dict
 
+    def fuse_coord(self, affine):
+        flip = np.ones(3)
+        if np.random.rand() < self.p:
+            flip[0] = -1
+        if np.random.rand() < self.p:
+            flip[1] = -1
+        affine.transform(np.diag(flip), normal=True)
+
 
 @TRANSFORMS.register_module()
 class RandomJitter(object):
@@ -345,6 +549,14 @@ class RandomJitter(object):
             data_dict["coord"] += jitter
         return data_dict
 
+    def fuse_coord(self, affine):
+        jitter = np.clip(
+            self.sigma * np.random.randn(affine.num_points, 3),
+            -self.clip,
+            self.clip,
+        )
+        affine.add_noise(jitter)
+
 
 @TRANSFORMS.register_module()
 class ClipGaussianJitter(object):
@@ -397,7 +609,13 @@ class ChromaticTranslation(object):
     def __call__(self, data_dict):
         if "color" in data_dict.keys() and np.random.rand() < self.p:
             tr = (np.random.rand(1, 3) - 0.5) * 255 * 2 * self.ratio
-            data_dict["color"][:, :3] = np.clip(tr + data_dict["color"][:, :3], 0, 255)
+            color = data_dict["color"][:, :3]
+            if np.issubdtype(color.dtype, np.floating):
+                # in place, integer colors would wrap around before the clip
+                np.add(color, tr, out=color, casting="unsafe")
+                np.clip(color, 0, 255, out=color)
+            else:
+                data_dict["color"][:, :3] = np.clip(tr + color, 0, 255)
         return data_dict
 
 
@@ -411,9 +629,13 @@ class ChromaticJitter(object):
         if "color" in data_dict.keys() and np.random.rand() < self.p:
             noise = np.random.randn(data_dict["color"].shape[0], 3)
             noise *= self.std * 255
-            data_dict["color"][:, :3] = np.clip(
-                noise + data_dict["color"][:, :3], 0, 255
-            )
+            color = data_dict["color"][:, :3]
+            if np.issubdtype(color.dtype, np.floating):
+                # in place, integer colors would wrap around before the clip
+                np.add(color, noise, out=color, casting="unsafe")
+                np.clip(color, 0, 255, out=color)
+            else:
+                data_dict["color"][:, :3] = np.clip(noise + color, 0, 255)
         return data_dict
 
 
@@ -846,37 +1068,57 @@ class GridSample(object):
                         displacement * data_dict["normal"], axis=-1, keepdims=True
                     )
                 data_dict["displacement"] = displacement[idx_unique]
-            for key in self.keys:
-                data_dict[key] = data_dict[key][idx_unique]
+            PointAttributes(data_dict, keys=self.keys).subset(idx_unique).apply()
             return data_dict
 
         elif self.mode == "test":  # test mode
+            # index matrix (count.max(), num_voxel), row i selects the (i % count)-th
+            # point of each voxel, all parts are gathered at once and returned as views
+            idx_start = np.cumsum(np.insert(count, 0, 0)[0:-1])
+            idx_select = idx_start + np.arange(count.max())[:, None] % count
+            idx_parts = idx_sort[idx_select]
+            part_dict = dict()
+            if self.return_inverse:
+                data_dict["inverse"] = np.zeros_like(inverse)
+                data_dict["inverse"][idx_sort] = inverse
+            if self.return_grid_coord:
+                part_dict["grid_coord"] = grid_coord[idx_parts]
+            if self.return_displacement:
+                displacement = (
+                    scaled_coord - grid_coord - 0.5
+                )  # [0, 1] -> [-0.5, 0.5] displacement to center
+                if self.project_displacement:
+                    displacement = np.sum(
+                        displacement * data_dict["normal"], axis=-1, keepdims=True
+                    )
+                part_dict["displacement"] = displacement[idx_parts]
+            data_keys = [
+                key
+                for key in data_dict.keys()
+                if not (self.return_displacement and key == "displacement")
+            ]
+            part_dict.update(
+                PointAttributes(
+                    data_dict, keys=[k for k in data_keys if k in self.keys]
+                )
+                .subset(idx_parts)
+                .gather()
+            )
+
             data_part_list = []
-            for i in range(count.max()):
-                idx_select = np.cumsum(np.insert(count, 0, 0)[0:-1]) + i % count
-                idx_part = idx_sort[idx_select]
-                data_part = dict(index=idx_part)
-                if self.return_inverse:
-                    data_dict["inverse"] = np.zeros_like(inverse)
-                    data_dict["inverse"][idx_sort] = inverse
+            for i in range(idx_parts.shape[0]):
+                data_part = dict(index=idx_parts[i])
                 if self.return_grid_coord:
-                    data_part["grid_coord"] = grid_coord[idx_part]
+                    data_part["grid_coord"] = part_dict["grid_coord"][i]
                 if self.return_min_coord:
                     data_part["min_coord"] = min_coord.reshape([1, 3])
-                if self.return_displacement:
-                    displacement = (
-                        scaled_coord - grid_coord - 0.5
-                    )  # [0, 1] -> [-0.5, 0.5] displacement to center
-                    if self.project_displacement:
-                        displacement = np.sum(
-                            displacement * data_dict["normal"], axis=-1, keepdims=True
-                        )
-                    data_dict["displacement"] = displacement[idx_part]
-                for key in data_dict.keys():
+                for key in data_keys:
                     if key in self.keys:
-                        data_part[key] = data_dict[key][idx_part]
+                        data_part[key] = part_dict[key][i]
                     else:
                         data_part[key] = data_dict[key]
+                if self.return_displacement:
+                    data_part["displacement"] = part_dict["displacement"][i]
                 data_part_list.append(data_part)
             return data_part_list
         else:
@@ -927,6 +1169,37 @@ class SphereCrop(object):
         assert mode in ["random", "center", "all"]
         self.mode = mode
 
+    @staticmethod
+    def knn_crop(coord, center_idx, k, tree=None, radius=None):
+        """
+        Return the k nearest points to coord[center_idx] sorted by squared distance
+        (computed in coord precision, same selection as a full argsort) and the
+        search radius to start from for the next query.
+        """
+        center = coord[center_idx]
+        if tree is None:
+            candidate = None
+            dist2 = np.sum(np.square(coord - center), 1)
+        else:
+            if radius is None:
+                radius = tree.query(center, k=k)[0][-1] * 1.1
+            while True:
+                candidate = np.asarray(
+                    tree.query_ball_point(center, radius, return_sorted=False),
+                    dtype=np.int64,
+                )
+                if candidate.shape[0] >= k:
+                    dist2 = np.sum(np.square(coord[candidate] - center), 1)
+                    select = np.argpartition(dist2, k - 1)[:k]
+                    # the k-th neighbor must be strictly inside the ball
+                    if dist2[select].max() < radius**2 * (1 - 1e-5):
+                        break
+                radius = radius * 1.5 + 1e-6
+        select = np.argpartition(dist2, k - 1)[:k]
+        select = select[np.argsort(dist2[select], kind="stable")]
+        idx_crop = select if candidate is None else candidate[select]
+        return idx_crop, dist2[select], np.sqrt(dist2[select[-1]]) * 1.1
+
     def __call__(self, data_dict):
         point_max = (
             int(self.sample_rate * data_dict["coord"].shape[0])
@@ -936,39 +1209,31 @@ class SphereCrop(object):
 
         assert "coord" in data_dict.keys()
         if self.mode == "all":
-            # TODO: Optimize
             if "index" not in data_dict.keys():
                 data_dict["index"] = np.arange(data_dict["coord"].shape[0])
             data_part_list = []
             # coord_list, color_list, dist2_list, idx_list, offset_list = [], [], [], [], []
             if data_dict["coord"].shape[0] > point_max:
-                coord_p, idx_uni = np.random.rand(
-                    data_dict["coord"].shape[0]
-                ) * 1e-3, np.array([])
-                while idx_uni.size != data_dict["index"].shape[0]:
+                coord = data_dict["coord"]
+                coord_p = np.random.rand(coord.shape[0]) * 1e-3
+                covered = np.zeros(coord.shape[0], dtype=bool)
+                # scenes split into many crops query a kd-tree built once, otherwise
+                # a single linear pass over the scene is cheaper than building it
+                tree, radius = None, None
+                if coord.shape[0] > 16 * point_max:
+                    tree = scipy.spatial.cKDTree(
+                        coord, balanced_tree=False, compact_nodes=False
+                    )
+                while not covered.all():
                     init_idx = np.argmin(coord_p)
-                    dist2 = np.sum(
-                        np.power(data_dict["coord"] - data_dict["coord"][init_idx], 2),
-                        1,
+                    idx_crop, dist2, radius = self.knn_crop(
+                        coord, init_idx, point_max, tree, radius
+                    )
+
+                    data_crop_dict = (
+                        PointAttributes(data_dict).subset(idx_crop).gather()
                     )
-                    idx_crop = np.argsort(dist2)[:point_max]
-
-                    data_crop_dict = dict()
-                    if "coord" in data_dict.keys():
-                        data_crop_dict["coord"] = data_dict["coord"][idx_crop]
-                    if "grid_coord" in data_dict.keys():
-                        data_crop_dict["grid_coord"] = data_dict["grid_coord"][idx_crop]
-                    if "normal" in data_dict.keys():
-                        data_crop_dict["normal"] = data_dict["normal"][idx_crop]
-                    if "color" in data_dict.keys():
-                        data_crop_dict["color"] = data_dict["color"][idx_crop]
-                    if "displacement" in data_dict.keys():
-                        data_crop_dict["displacement"] = data_dict["displacement"][
-                            idx_crop
-                        ]
-                    if "strength" in data_dict.keys():
-                        data_crop_dict["strength"] = data_dict["strength"][idx_crop]
-                    data_crop_dict["weight"] = dist2[idx_crop]
+                    data_crop_dict["weight"] = dist2
                     data_crop_dict["index"] = data_dict["index"][idx_crop]
                     data_part_list.append(data_crop_dict)
 
@@ -976,9 +1241,7 @@ class SphereCrop(object):
                         1 - data_crop_dict["weight"] / np.max(data_crop_dict["weight"])
                     )
                     coord_p[idx_crop] += delta
-                    idx_uni = np.unique(
-                        np.concatenate((idx_uni, data_crop_dict["index"]))
-                    )
+                    covered[idx_crop] = True
             else:
                 data_crop_dict = data_dict.copy()
                 data_crop_dict["weight"] = np.zeros(data_dict["coord"].shape[0])
@@ -998,24 +1261,7 @@ class SphereCrop(object):
             idx_crop = np.argsort(np.sum(np.square(data_dict["coord"] - center), 1))[
                 :point_max
             ]
-            if "coord" in data_dict.keys():
-                data_dict["coord"] = data_dict["coord"][idx_crop]
-            if "origin_coord" in data_dict.keys():
-                data_dict["origin_coord"] = data_dict["origin_coord"][idx_crop]
-            if "grid_coord" in data_dict.keys():
-                data_dict["grid_coord"] = data_dict["grid_coord"][idx_crop]
-            if "color" in data_dict.keys():
-                data_dict["color"] = data_dict["color"][idx_crop]
-            if "normal" in data_dict.keys():
-                data_dict["normal"] = data_dict["normal"][idx_crop]
-            if "segment" in data_dict.keys():
-                data_dict["segment"] = data_dict["segment"][idx_crop]
-            if "instance" in data_dict.keys():
-                data_dict["instance"] = data_dict["instance"][idx_crop]
-            if "displacement" in data_dict.keys():
-                data_dict["displacement"] = data_dict["displacement"][idx_crop]
-            if "strength" in data_dict.keys():
-                data_dict["strength"] = data_dict["strength"][idx_crop]
+            PointAttributes(data_dict).subset(idx_crop).apply()
         return data_dict
 
 
@@ -1025,20 +1271,7 @@ class ShufflePoint(object):
         assert "coord" in data_dict.keys()
         shuffle_index = np.arange(data_dict["coord"].shape[0])
         np.random.shuffle(shuffle_index)
-        if "coord" in data_dict.keys():
-            data_dict["coord"] = data_dict["coord"][shuffle_index]
-        if "grid_coord" in data_dict.keys():
-            data_dict["grid_coord"] = data_dict["grid_coord"][shuffle_index]
-        if "displacement" in data_dict.keys():
-            data_dict["displacement"] = data_dict["displacement"][shuffle_index]
-        if "color" in data_dict.keys():
-            data_dict["color"] = data_dict["color"][shuffle_index]
-        if "normal" in data_dict.keys():
-            data_dict["normal"] = data_dict["normal"][shuffle_index]
-        if "segment" in data_dict.keys():
-            data_dict["segment"] = data_dict["segment"][shuffle_index]
-        if "instance" in data_dict.keys():
-            data_dict["instance"] = data_dict["instance"][shuffle_index]
+        PointAttributes(data_dict).subset(shuffle_index).apply()
         return data_dict
 
 
@@ -1048,18 +1281,7 @@ class CropBoundary(object):
         assert "segment" in data_dict
         segment = data_dict["segment"].flatten()
         mask = (segment != 0) * (segment != 1)
-        if "coord" in data_dict.keys():
-            data_dict["coord"] = data_dict["coord"][mask]
-        if "grid_coord" in data_dict.keys():
-            data_dict["grid_coord"] = data_dict["grid_coord"][mask]
-        if "color" in data_dict.keys():
-            data_dict["color"] = data_dict["color"][mask]
-        if "normal" in data_dict.keys():
-            data_dict["normal"] = data_dict["normal"][mask]
-        if "segment" in data_dict.keys():
-            data_dict["segment"] = data_dict["segment"][mask]
-        if "instance" in data_dict.keys():
-            data_dict["instance"] = data_dict["instance"][mask]
+        PointAttributes(data_dict).subset(mask).apply()
         return data_dict
 
 
@@ -1136,13 +1358,123 @@ class InstanceParser(object):
 
 
 class Compose(object):
-    def __init__(self, cfg=None):
+    def __init__(self, cfg=None, fuse=False):
         self.cfg = cfg if cfg is not None else []
         self.transforms = []
         for t_cfg in self.cfg:
             self.transforms.append(TRANSFORMS.build(t_cfg))
+        # with fuse, runs of consecutive geometric transforms (with fuse_coord) are
+        # folded into one affine matrix + noise (see AffineCoord)
+        self.fuse = fuse
+        self.segments = []
+        for t in self.transforms:
+            if (
+                len(self.segments) > 0
+                and hasattr(t, "fuse_coord")
+                and hasattr(self.segments[-1][-1], "fuse_coord")
+            ):
+                self.segments[-1].append(t)
+            else:
+                self.segments.append([t])
+        # per transform counters, see enable_profile
+        self.profile_names = None
+        self.profile_stats = None
 
     def __call__(self, data_dict):
-        for t in self.transforms:
+        if self.profile_stats is not None:
+            return self.profile_call(data_dict)
+        if not self.fuse:
+            for t in self.transforms:
+                data_dict = t(data_dict)
+            return data_dict
+        for segment in self.segments:
+            data_dict = self.apply_segment(segment, data_dict)
+        return data_dict
+
+    @staticmethod
+    def apply_segment(segment, data_dict):
+        if (
+            len(segment) > 1
+            and isinstance(data_dict, Mapping)
+            and "coord" in data_dict.keys()
+        ):
+            affine = AffineCoord(data_dict)
+            for t in segment:
+                t.fuse_coord(affine)
+            return affine.apply()
+        for t in segment:
             data_dict = t(data_dict)
         return data_dict
+
+    @property
+    def steps(self):
+        # unit of profiling, a transform or a fused segment
+        return self.segments if self.fuse else [[t] for t in self.transforms]
+
+    def enable_profile(self, max_workers=64):
+        """
+        Record the wall time and input / output point count of each transform (each
+        fused segment with fuse). Counters are in shared memory, one row per
+        dataloader worker and one for the main process, so enable it before the
+        workers start; the main process reads all of them with profile_summary.
+        """
+        self.profile_names = [
+            f"{i}_" + "+".join(t.__class__.__name__ for t in step)
+            for i, step in enumerate(self.steps)
+        ]
+        # (slot, step, [count, seconds, points in, points out])
+        self.profile_stats = torch.zeros(
+            (max_workers + 1, len(self.profile_names), 4), dtype=torch.float64
+        ).share_memory_()
+
+    def disable_profile(self):
+        self.profile_names = None
+        self.profile_stats = None
+
+    @staticmethod
+    def num_points(data_dict):
+        if isinstance(data_dict, Mapping) and "coord" in data_dict.keys():
+            return len(data_dict["coord"])
+        return 0
+
+    def profile_call(self, data_dict):
+        worker_info = torch.utils.data.get_worker_info()
+        num_slots = len(self.profile_stats) - 1
+        slot = worker_info.id % num_slots if worker_info is not None else num_slots
+        stats = self.profile_stats[slot]
+        for i, step in enumerate(self.steps):
+            points = self.num_points(data_dict)
+            start = time.perf_counter()
+            data_dict = self.apply_segment(step, data_dict)
+            elapsed = time.perf_counter() - start
+            stats[i] += torch.tensor(
+                [1, elapsed, points, self.num_points(data_dict)], dtype=torch.float64
+            )
+        return data_dict
+
+    def profile_summary(self, reset=False):
+        """
+        Per transform stats over all workers (calls, mean / total ms, mean points in
+        and out), sorted by total time.
+        """
+        if self.profile_stats is None:
+            return []
+        stats = self.profile_stats.sum(dim=0)
+        if reset:
+            self.profile_stats.zero_()
+        summary = []
+        for name, (count, seconds, points_in, points_out) in zip(
+            self.profile_names, stats.tolist()
+        ):
+            calls = max(count, 1)
+            summary.append(
+                dict(
+                    name=name,
+                    count=int(count),
+                    total=seconds * 1000,
+                    latency=seconds / calls * 1000,
+                    points_in=points_in / calls,
+                    points_out=points_out / calls,
+                )
+            )
+        return sorted(summary, key=lambda x: -x["total"])
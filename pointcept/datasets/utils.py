@@ -12,6 +12,62 @@ import torch
 from torch.utils.data.dataloader import default_collate
 
 
+class SchemaDict(dict):
+    """
+    Dict carrying a collate schema {key: kind}, returned by Collect. Kind "cat"
+    concatenates the key along the first dim, kind "offset" turns per sample
+    lengths into cumulative offsets. Consumers other than collate_fn see a dict.
+    """
+
+    def __init__(self, *args, schema=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.schema = schema
+
+
+def _new_buffer(elem, shape):
+    if torch.utils.data.get_worker_info() is not None:
+        # in a worker, allocate in shared memory to avoid a copy when the batch is
+        # sent back to the main process (same as default_collate)
+        numel = int(np.prod(shape))
+        storage = elem._typed_storage()._new_shared(numel, device=elem.device)
+        return elem.new(storage).view(shape)
+    # pinning is left to the DataLoader (pin_memory=True)
+    return torch.empty(shape, dtype=elem.dtype)
+
+
+def schema_collate_fn(batch):
+    """
+    collate function for samples collected with a schema (see Collect), each key
+    is copied once into a buffer allocated with the total size of the batch.
+    Keys whose samples do not fit the schema go through collate_fn.
+    """
+    schema = batch[0].schema
+    collated = dict()
+    for key in batch[0].keys():
+        samples = [data[key] for data in batch]
+        kind = schema.get(key)
+        if kind == "offset":
+            lengths = torch.cat(samples)
+            collated[key] = torch.cumsum(lengths, dim=0)
+        elif (
+            kind == "cat"
+            and all(isinstance(sample, torch.Tensor) for sample in samples)
+            and all(sample.dim() > 0 for sample in samples)
+            and all(sample.dtype == samples[0].dtype for sample in samples)
+            and all(sample.shape[1:] == samples[0].shape[1:] for sample in samples)
+            and all(not sample.is_cuda for sample in samples)
+        ):
+            shape = (sum(sample.shape[0] for sample in samples),) + tuple(
+                samples[0].shape[1:]
+            )
+            collated[key] = torch.cat(samples, out=_new_buffer(samples[0], shape))
+        else:
+            collated[key] = collate_fn(samples)
+            if "offset" in key:
+                collated[key] = torch.cumsum(collated[key], dim=0)
+    return collated
+
+
 def collate_fn(batch):
     """
     collate function for point cloud which support dict and list,
@@ -20,6 +76,18 @@ def collate_fn(batch):
     if not isinstance(batch, Sequence):
         raise TypeError(f"{batch.dtype} is not supported.")
 
+    if (
+        isinstance(batch[0], SchemaDict)
+        and batch[0].schema is not None
+        and all(
+            isinstance(data, SchemaDict)
+            and data.schema == batch[0].schema
+            and data.keys() == batch[0].keys()
+            for data in batch
+        )
+    ):
+        return schema_collate_fn(batch)
+
     if isinstance(batch[0], torch.Tensor):
         return torch.cat(list(batch))
     elif isinstance(batch[0], str):
@@ -7,7 +7,6 @@ Please cite our work if the code is helpful to you.
 
 import os
 import numpy as np
-import glob
 
 from .builder import DATASETS
 from .defaults import DefaultDataset
@@ -40,7 +39,7 @@ class WaymoDataset(DefaultDataset):
             self.split = [self.split]
         data_list = []
         for split in self.split:
-            data_list += glob.glob(os.path.join(self.data_root, split, "*", "*"))
+            data_list += self.glob_data(os.path.join(self.data_root, split, "*", "*"))
         return data_list
 
     @staticmethod
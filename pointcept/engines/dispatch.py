@@ -0,0 +1,148 @@
+"""
+Test Dispatch
+
+Dynamic scheduling of test scenes across ranks: scenes are handed out largest first
+from a counter shared through the torch.distributed store (or a FileStore on a
+shared file system), a rank claims the next scene when it is done with the
+previous one, so ranks finish together on test sets with scenes of very different
+size. Completed scenes are recorded in a progress manifest (one jsonl file per rank,
+appended per scene) and skipped on resume before any data loading.
+
+Author: Xiaoyang Wu (xiaoyang.wu.cs@gmail.com)
+Please cite our work if the code is helpful to you.
+"""
+
+import os
+import json
+import glob
+import uuid
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import torch.distributed as dist
+
+import pointcept.utils.comm as comm
+
+
+class SceneQueue(object):
+    """
+    Shared queue of dataset indices, every rank must build it (collective) with the
+    same order. backend: "store" (default store of the process group) or "file"
+    (FileStore at path, on a file system shared by all machines).
+    """
+
+    def __init__(self, order, backend="store", path=None):
+        assert backend in ["store", "file"]
+        self.order = list(order)
+        self.store = None
+        self.count = 0
+        if comm.get_world_size() > 1:
+            # key unique to this run, a store may outlive it
+            token = comm.all_gather(uuid.uuid4().hex)[0]
+            self.key = f"scene_queue/{token}"
+            if backend == "store":
+                self.store = dist.distributed_c10d._get_default_store()
+            else:
+                self.store = dist.FileStore(f"{path}.{token}", comm.get_world_size())
+
+    def claim(self):
+        if self.store is not None:
+            i = self.store.add(self.key, 1) - 1
+        else:
+            i, self.count = self.count, self.count + 1
+        return self.order[i] if i < len(self.order) else None
+
+    def __iter__(self):
+        while True:
+            idx = self.claim()
+            if idx is None:
+                return
+            yield idx
+
+    def __len__(self):
+        return len(self.order)
+
+
+def prefetch(dataset, indices, num_prefetch=1):
+    """
+    Yield (idx, dataset[idx]) for an iterable of indices, loading up to num_prefetch
+    scenes ahead on background threads (indices are claimed when loading starts).
+    """
+    if num_prefetch <= 0:
+        for idx in indices:
+            yield idx, dataset[idx]
+        return
+    with ThreadPoolExecutor(max_workers=num_prefetch) as executor:
+        pending = deque()
+        for idx in indices:
+            pending.append((idx, executor.submit(dataset.__getitem__, idx)))
+            if len(pending) > num_prefetch:
+                idx, future = pending.popleft()
+                yield idx, future.result()
+        while pending:
+            idx, future = pending.popleft()
+            yield idx, future.result()
+
+
+class ProgressManifest(object):
+    """
+    Record of completed scenes (name -> json serializable record) of a rank,
+    appended to root/progress_{rank}.jsonl one line per scene (flushed and synced),
+    so a scene costs one short write. A truncated last line (crash while writing)
+    is skipped on read and cut before appending. Records of previous runs are kept.
+    """
+
+    def __init__(self, root, rank=None):
+        rank = comm.get_rank() if rank is None else rank
+        self.path = os.path.join(root, f"progress_{rank}.jsonl")
+        self.lock = threading.Lock()
+        self.records = self.read(self.path)
+        self.file = open(self.path, "ab")
+        # drop a partial last line, the next record starts on a new line
+        self.file.truncate(self.complete_size(self.path))
+
+    @staticmethod
+    def complete_size(path):
+        # size of the file up to the end of its last complete line
+        with open(path, "rb") as f:
+            content = f.read()
+        return content.rfind(b"\n") + 1
+
+    @staticmethod
+    def read(path):
+        records = dict()
+        if not os.path.isfile(path):
+            return records
+        with open(path, "rb") as f:
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break  # truncated by a crash
+                item = json.loads(line)
+                records[item["name"]] = item["record"]
+        return records
+
+    @classmethod
+    def read_all(cls, root):
+        # completed scenes of all ranks (of any previous world size)
+        records = dict()
+        for path in sorted(glob.glob(os.path.join(root, "progress_*.jsonl"))):
+            records.update(cls.read(path))
+        return records
+
+    def update(self, name, record):
+        # thread safe, called by writer threads
+        line = json.dumps(dict(name=name, record=record)) + "\n"
+        with self.lock:
+            self.records[name] = record
+            self.file.write(line.encode())
+            self.file.flush()
+            os.fsync(self.file.fileno())
+
+    def close(self):
+        self.file.close()
+
+    def __contains__(self, name):
+        return name in self.records
+
+    def __len__(self):
+        return len(self.records)
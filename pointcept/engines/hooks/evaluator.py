@@ -7,12 +7,10 @@ Please cite our work if the code is helpful to you.
 
 import numpy as np
 import torch
-import torch.distributed as dist
 import pointops
-from uuid import uuid4
 
 import pointcept.utils.comm as comm
-from pointcept.utils.misc import intersection_and_union_gpu
+from pointcept.utils.misc import ConfusionMatrix
 
 from .default import HookBase
 from .builder import HOOKS
@@ -27,6 +25,10 @@ class ClsEvaluator(HookBase):
     def eval(self):
         self.trainer.logger.info(">>>>>>>>>>>>>>>> Start Evaluation >>>>>>>>>>>>>>>>")
         self.trainer.model.eval()
+        # accumulated on device, reduced over ranks once after the loop
+        metric = ConfusionMatrix(
+            self.trainer.cfg.data.num_classes, self.trainer.cfg.data.ignore_index
+        )
         for i, input_dict in enumerate(self.trainer.val_loader):
             for key in input_dict.keys():
                 if isinstance(input_dict[key], torch.Tensor):
@@ -37,25 +39,7 @@ class ClsEvaluator(HookBase):
             loss = output_dict["loss"]
             pred = output.max(1)[1]
             label = input_dict["category"]
-            intersection, union, target = intersection_and_union_gpu(
-                pred,
-                label,
-                self.trainer.cfg.data.num_classes,
-                self.trainer.cfg.data.ignore_index,
-            )
-            if comm.get_world_size() > 1:
-                dist.all_reduce(intersection), dist.all_reduce(union), dist.all_reduce(
-                    target
-                )
-            intersection, union, target = (
-                intersection.cpu().numpy(),
-                union.cpu().numpy(),
-                target.cpu().numpy(),
-            )
-            # Here there is no need to sync since sync happened in dist.all_reduce
-            self.trainer.storage.put_scalar("val_intersection", intersection)
-            self.trainer.storage.put_scalar("val_union", union)
-            self.trainer.storage.put_scalar("val_target", target)
+            metric.update(pred, label)
             self.trainer.storage.put_scalar("val_loss", loss.item())
             self.trainer.logger.info(
                 "Test: [{iter}/{max_iter}] "
@@ -64,14 +48,10 @@ class ClsEvaluator(HookBase):
                 )
             )
         loss_avg = self.trainer.storage.history("val_loss").avg
-        intersection = self.trainer.storage.history("val_intersection").total
-        union = self.trainer.storage.history("val_union").total
-        target = self.trainer.storage.history("val_target").total
-        iou_class = intersection / (union + 1e-10)
-        acc_class = intersection / (target + 1e-10)
-        m_iou = np.mean(iou_class)
-        m_acc = np.mean(acc_class)
-        all_acc = sum(intersection) / (sum(target) + 1e-10)
+        metric.sync()
+        summary = metric.summary()
+        iou_class, acc_class = summary["iou_class"], summary["acc_class"]
+        m_iou, m_acc, all_acc = summary["m_iou"], summary["m_acc"], summary["all_acc"]
         self.trainer.logger.info(
             "Val result: mIoU/mAcc/allAcc {:.4f}/{:.4f}/{:.4f}.".format(
                 m_iou, m_acc, all_acc
@@ -111,6 +91,10 @@ class SemSegEvaluator(HookBase):
     def eval(self):
         self.trainer.logger.info(">>>>>>>>>>>>>>>> Start Evaluation >>>>>>>>>>>>>>>>")
         self.trainer.model.eval()
+        # accumulated on device, reduced over ranks once after the loop
+        metric = ConfusionMatrix(
+            self.trainer.cfg.data.num_classes, self.trainer.cfg.data.ignore_index
+        )
         for i, input_dict in enumerate(self.trainer.val_loader):
             for key in input_dict.keys():
                 if isinstance(input_dict[key], torch.Tensor):
@@ -131,25 +115,7 @@ class SemSegEvaluator(HookBase):
                 )
                 pred = pred[idx.flatten().long()]
                 segment = input_dict["origin_segment"]
-            intersection, union, target = intersection_and_union_gpu(
-                pred,
-                segment,
-                self.trainer.cfg.data.num_classes,
-                self.trainer.cfg.data.ignore_index,
-            )
-            if comm.get_world_size() > 1:
-                dist.all_reduce(intersection), dist.all_reduce(union), dist.all_reduce(
-                    target
-                )
-            intersection, union, target = (
-                intersection.cpu().numpy(),
-                union.cpu().numpy(),
-                target.cpu().numpy(),
-            )
-            # Here there is no need to sync since sync happened in dist.all_reduce
-            self.trainer.storage.put_scalar("val_intersection", intersection)
-            self.trainer.storage.put_scalar("val_union", union)
-            self.trainer.storage.put_scalar("val_target", target)
+            metric.update(pred, segment)
             self.trainer.storage.put_scalar("val_loss", loss.item())
             info = "Test: [{iter}/{max_iter}] ".format(
                 iter=i + 1, max_iter=len(self.trainer.val_loader)
@@ -163,14 +129,10 @@ class SemSegEvaluator(HookBase):
                 )
             )
         loss_avg = self.trainer.storage.history("val_loss").avg
-        intersection = self.trainer.storage.history("val_intersection").total
-        union = self.trainer.storage.history("val_union").total
-        target = self.trainer.storage.history("val_target").total
-        iou_class = intersection / (union + 1e-10)
-        acc_class = intersection / (target + 1e-10)
-        m_iou = np.mean(iou_class)
-        m_acc = np.mean(acc_class)
-        all_acc = sum(intersection) / (sum(target) + 1e-10)
+        metric.sync()
+        summary = metric.summary()
+        iou_class, acc_class = summary["iou_class"], summary["acc_class"]
+        m_iou, m_acc, all_acc = summary["m_iou"], summary["m_acc"], summary["all_acc"]
         self.trainer.logger.info(
             "Val result: mIoU/mAcc/allAcc {:.4f}/{:.4f}/{:.4f}.".format(
                 m_iou, m_acc, all_acc
@@ -227,77 +189,176 @@ class InsSegEvaluator(HookBase):
     def associate_instances(self, pred, segment, instance):
         segment = segment.cpu().numpy()
         instance = instance.cpu().numpy()
-        void_mask = np.in1d(segment, self.segment_ignore_index)
-
-        assert (
-            pred["pred_classes"].shape[0]
-            == pred["pred_scores"].shape[0]
-            == pred["pred_masks"].shape[0]
-        )
-        assert pred["pred_masks"].shape[1] == segment.shape[0] == instance.shape[0]
+        void_mask = np.isin(segment, self.segment_ignore_index)
+        pred_classes = np.asarray(pred["pred_classes"]).reshape(-1).astype(np.int64)
+        pred_scores = np.asarray(pred["pred_scores"]).reshape(-1)
+        if "pred_masks" in pred.keys():
+            # dense masks (num_pred, n)
+            pred_masks = np.asarray(pred["pred_masks"])
+            assert pred_masks.shape[1] == segment.shape[0] == instance.shape[0]
+            num_pred = pred_masks.shape[0]
+            pred_idx, point_idx = np.nonzero(pred_masks)
+        else:
+            # sparse masks (CSR): point index of each pred concatenated, and offset
+            point_idx = np.asarray(pred["pred_masks_idx"]).reshape(-1).astype(np.int64)
+            offset = np.asarray(pred["pred_masks_offset"]).reshape(-1).astype(np.int64)
+            assert segment.shape[0] == instance.shape[0]
+            num_pred = offset.shape[0] - 1
+            pred_idx = np.repeat(np.arange(num_pred), np.diff(offset))
+        assert pred_classes.shape[0] == pred_scores.shape[0] == num_pred
         # get gt instances
-        gt_instances = dict()
-        for i in range(self.trainer.cfg.data.num_classes):
-            if i not in self.segment_ignore_index:
-                gt_instances[self.trainer.cfg.data.names[i]] = []
-        instance_ids, idx, counts = np.unique(
-            instance, return_index=True, return_counts=True
+        instance_ids, idx, inverse, counts = np.unique(
+            instance, return_index=True, return_inverse=True, return_counts=True
         )
         segment_ids = segment[idx]
-        for i in range(len(instance_ids)):
-            if instance_ids[i] == self.instance_ignore_index:
-                continue
-            if segment_ids[i] in self.segment_ignore_index:
-                continue
-            gt_inst = dict()
-            gt_inst["instance_id"] = instance_ids[i]
-            gt_inst["segment_id"] = segment_ids[i]
-            gt_inst["dist_conf"] = 0.0
-            gt_inst["med_dist"] = -1.0
-            gt_inst["vert_count"] = counts[i]
-            gt_inst["matched_pred"] = []
-            gt_instances[self.trainer.cfg.data.names[segment_ids[i]]].append(gt_inst)
-
-        # get pred instances and associate with gt
-        pred_instances = dict()
-        for i in range(self.trainer.cfg.data.num_classes):
-            if i not in self.segment_ignore_index:
-                pred_instances[self.trainer.cfg.data.names[i]] = []
-        instance_id = 0
-        for i in range(len(pred["pred_classes"])):
-            if pred["pred_classes"][i] in self.segment_ignore_index:
-                continue
-            pred_inst = dict()
-            pred_inst["uuid"] = uuid4()
-            pred_inst["instance_id"] = instance_id
-            pred_inst["segment_id"] = pred["pred_classes"][i]
-            pred_inst["confidence"] = pred["pred_scores"][i]
-            pred_inst["mask"] = np.not_equal(pred["pred_masks"][i], 0)
-            pred_inst["vert_count"] = np.count_nonzero(pred_inst["mask"])
-            pred_inst["void_intersection"] = np.count_nonzero(
-                np.logical_and(void_mask, pred_inst["mask"])
+        gt_valid = np.logical_not(
+            np.logical_or(
+                instance_ids == self.instance_ignore_index,
+                np.isin(segment_ids, self.segment_ignore_index),
             )
-            if pred_inst["vert_count"] < self.min_region_sizes:
-                continue  # skip if empty
-            segment_name = self.trainer.cfg.data.names[pred_inst["segment_id"]]
-            matched_gt = []
-            for gt_idx, gt_inst in enumerate(gt_instances[segment_name]):
-                intersection = np.count_nonzero(
-                    np.logical_and(
-                        instance == gt_inst["instance_id"], pred_inst["mask"]
-                    )
-                )
-                if intersection > 0:
-                    gt_inst_ = gt_inst.copy()
-                    pred_inst_ = pred_inst.copy()
-                    gt_inst_["intersection"] = intersection
-                    pred_inst_["intersection"] = intersection
-                    matched_gt.append(gt_inst_)
-                    gt_inst["matched_pred"].append(pred_inst_)
-            pred_inst["matched_gt"] = matched_gt
-            pred_instances[segment_name].append(pred_inst)
-            instance_id += 1
-        return gt_instances, pred_instances
+        )
+        num_gt = np.count_nonzero(gt_valid)
+        gt_instances = dict(
+            segment_id=segment_ids[gt_valid].astype(np.int64),
+            vert_count=counts[gt_valid],
+            med_dist=np.full(num_gt, -1.0),
+            dist_conf=np.zeros(num_gt),
+        )
+        # point -> gt instance index, num_gt for points without valid gt instance
+        point_gt = np.full(instance_ids.shape[0], num_gt, dtype=np.int64)
+        point_gt[gt_valid] = np.arange(num_gt)
+        point_gt = point_gt[inverse.reshape(-1)]
+
+        # get pred instances and associate with gt by counting (pred, gt) pairs
+        vert_count = np.bincount(pred_idx, minlength=num_pred)
+        void_intersection = np.bincount(
+            pred_idx[void_mask[point_idx]], minlength=num_pred
+        )
+        intersection = np.bincount(
+            pred_idx * (num_gt + 1) + point_gt[point_idx],
+            minlength=num_pred * (num_gt + 1),
+        ).reshape(num_pred, num_gt + 1)[:, :num_gt]
+        pred_valid = np.logical_and(
+            np.logical_not(np.isin(pred_classes, self.segment_ignore_index)),
+            vert_count >= self.min_region_sizes,
+        )
+        pred_instances = dict(
+            segment_id=pred_classes[pred_valid],
+            confidence=pred_scores[pred_valid],
+            vert_count=vert_count[pred_valid],
+            void_intersection=void_intersection[pred_valid],
+        )
+        return gt_instances, pred_instances, intersection[pred_valid]
+
+    @staticmethod
+    def map_sparse_masks(pred_masks_idx, pred_masks_offset, idx, num_points):
+        """
+        Sparse version of pred_masks[:, idx], i.e. map masks on points to masks on
+        origin points, where idx is the point (< num_points) of each origin point.
+        """
+        pred_masks_idx = pred_masks_idx.long()
+        pred_masks_count = torch.diff(pred_masks_offset.long())
+        # origin points of each point (CSR)
+        origin_idx = torch.argsort(idx, stable=True)
+        origin_count = torch.bincount(idx, minlength=num_points)
+        origin_start = torch.cumsum(origin_count, dim=0) - origin_count
+        # expand each point of each mask to its origin points
+        count = origin_count[pred_masks_idx]
+        start = origin_start[pred_masks_idx] - (torch.cumsum(count, dim=0) - count)
+        origin_pred_masks_idx = origin_idx[
+            torch.arange(int(count.sum())) + torch.repeat_interleave(start, count)
+        ]
+        origin_pred_masks_count = torch.zeros_like(pred_masks_count).index_add_(
+            0,
+            torch.repeat_interleave(
+                torch.arange(len(pred_masks_count)), pred_masks_count
+            ),
+            count,
+        )
+        return dict(
+            pred_masks_idx=origin_pred_masks_idx,
+            pred_masks_offset=torch.nn.functional.pad(
+                torch.cumsum(origin_pred_masks_count, dim=0), (1, 0)
+            ),
+        )
+
+    @staticmethod
+    def match_instances(overlap, confidence, gt_valid, overlap_th):
+        """
+        Greedy matching of one scene and one class, following the ScanNet
+        benchmark: each gt is matched to its first unvisited pred (in pred order)
+        with overlap > overlap_th, other unvisited preds passing the threshold
+        are false positives scored with the lower confidence.
+        Return y_true, y_score, hard_false_negatives and the matched pred mask.
+        """
+        num_pred = overlap.shape[0]
+        pred_visited = np.zeros(num_pred, dtype=bool)
+        match_score, dup_score = [], []
+        hard_false_negatives = 0
+        candidate = overlap > overlap_th
+        for gti in np.nonzero(gt_valid)[0]:
+            pred_ids = np.nonzero(candidate[:, gti] & ~pred_visited)[0]
+            if len(pred_ids) == 0:
+                hard_false_negatives += 1
+                continue
+            pred_visited[pred_ids[0]] = True
+            score = confidence[pred_ids]
+            score_max = np.maximum.accumulate(score)
+            match_score.append(score_max[-1])
+            # the prediction with the lower score is a false positive
+            dup_score.append(np.minimum(score_max[:-1], score[1:]))
+        y_true = np.concatenate(
+            [np.ones(len(match_score))] + [np.zeros(len(s)) for s in dup_score]
+        )
+        y_score = np.concatenate([np.array(match_score, dtype=float)] + dup_score)
+        return y_true, y_score, hard_false_negatives
+
+    @staticmethod
+    def average_precision(y_true, y_score, hard_false_negatives):
+        # sorting and cumsum
+        score_arg_sort = np.argsort(y_score)
+        y_score_sorted = y_score[score_arg_sort]
+        y_true_sorted = y_true[score_arg_sort]
+        y_true_sorted_cumsum = np.cumsum(y_true_sorted)
+
+        # unique thresholds
+        thresholds, unique_indices = np.unique(y_score_sorted, return_index=True)
+        num_prec_recall = len(unique_indices) + 1
+
+        # prepare precision recall
+        num_examples = len(y_score_sorted)
+        # https://github.com/ScanNet/ScanNet/pull/26
+        # all predictions are non-matched but also all of them are ignored and not counted as FP
+        # y_true_sorted_cumsum is empty
+        # num_true_examples = y_true_sorted_cumsum[-1]
+        num_true_examples = (
+            y_true_sorted_cumsum[-1] if len(y_true_sorted_cumsum) > 0 else 0
+        )
+        precision = np.zeros(num_prec_recall)
+        recall = np.zeros(num_prec_recall)
+
+        # deal with the first point
+        y_true_sorted_cumsum = np.append(y_true_sorted_cumsum, 0)
+        # deal with remaining
+        cumsum = y_true_sorted_cumsum[unique_indices - 1]
+        tp = num_true_examples - cumsum
+        fp = num_examples - unique_indices - tp
+        fn = cumsum + hard_false_negatives
+        precision[:-1] = tp / (tp + fp)
+        recall[:-1] = tp / (tp + fn)
+
+        # first point in curve is artificial
+        precision[-1] = 1.0
+        recall[-1] = 0.0
+
+        # compute average of precision-recall curve
+        recall_for_conv = np.copy(recall)
+        recall_for_conv = np.append(recall_for_conv[0], recall_for_conv)
+        recall_for_conv = np.append(recall_for_conv, 0.0)
+
+        stepWidths = np.convolve(recall_for_conv, [-0.5, 0, 0.5], "valid")
+        # integrate is now simply a dot product
+        return np.dot(precision, stepWidths)
 
     def evaluate_matches(self, scenes):
         overlaps = self.overlaps
@@ -312,170 +373,77 @@ class InsSegEvaluator(HookBase):
         for di, (min_region_size, distance_thresh, distance_conf) in enumerate(
             zip(min_region_sizes, dist_threshes, dist_confs)
         ):
-            for oi, overlap_th in enumerate(overlaps):
-                pred_visited = {}
+            for li, label_name in enumerate(self.valid_class_names):
+                segment_id = self.trainer.cfg.data.names.index(label_name)
+                # per scene overlap of (pred, gt) of the current class
+                class_scenes = []
+                has_gt = False
+                has_pred = False
                 for scene in scenes:
-                    for _ in scene["pred"]:
-                        for label_name in self.valid_class_names:
-                            for p in scene["pred"][label_name]:
-                                if "uuid" in p:
-                                    pred_visited[p["uuid"]] = False
-                for li, label_name in enumerate(self.valid_class_names):
-                    y_true = np.empty(0)
-                    y_score = np.empty(0)
+                    gt, pred = scene["gt"], scene["pred"]
+                    gt_mask = gt["segment_id"] == segment_id
+                    pred_mask = pred["segment_id"] == segment_id
+                    gt_vert_count = gt["vert_count"][gt_mask]
+                    pred_vert_count = pred["vert_count"][pred_mask]
+                    intersection = scene["intersection"][pred_mask][:, gt_mask]
+                    # filter groups in ground truth
+                    gt_valid = (
+                        (gt_vert_count >= min_region_size)
+                        & (gt["med_dist"][gt_mask] <= distance_thresh)
+                        & (gt["dist_conf"][gt_mask] >= distance_conf)
+                    )
+                    if gt_valid.any():
+                        has_gt = True
+                    if pred_mask.any():
+                        has_pred = True
+                    overlap = intersection / (
+                        gt_vert_count[None, :] + pred_vert_count[:, None] - intersection
+                    ).astype(float)
+                    # ignored points: void and small ground truth instances
+                    num_ignore = pred["void_intersection"][pred_mask] + np.sum(
+                        intersection[:, ~gt_valid], axis=1
+                    )
+                    proportion_ignore = num_ignore / pred_vert_count.astype(float)
+                    class_scenes.append(
+                        (
+                            overlap,
+                            pred["confidence"][pred_mask],
+                            gt_valid,
+                            proportion_ignore,
+                        )
+                    )
+
+                for oi, overlap_th in enumerate(overlaps):
+                    y_true = []
+                    y_score = []
                     hard_false_negatives = 0
-                    has_gt = False
-                    has_pred = False
-                    for scene in scenes:
-                        pred_instances = scene["pred"][label_name]
-                        gt_instances = scene["gt"][label_name]
-                        # filter groups in ground truth
-                        gt_instances = [
-                            gt
-                            for gt in gt_instances
-                            if gt["vert_count"] >= min_region_size
-                            and gt["med_dist"] <= distance_thresh
-                            and gt["dist_conf"] >= distance_conf
-                        ]
-                        if gt_instances:
-                            has_gt = True
-                        if pred_instances:
-                            has_pred = True
-
-                        cur_true = np.ones(len(gt_instances))
-                        cur_score = np.ones(len(gt_instances)) * (-float("inf"))
-                        cur_match = np.zeros(len(gt_instances), dtype=bool)
+                    for (
+                        overlap,
+                        confidence,
+                        gt_valid,
+                        proportion_ignore,
+                    ) in class_scenes:
                         # collect matches
-                        for gti, gt in enumerate(gt_instances):
-                            found_match = False
-                            for pred in gt["matched_pred"]:
-                                # greedy assignments
-                                if pred_visited[pred["uuid"]]:
-                                    continue
-                                overlap = float(pred["intersection"]) / (
-                                    gt["vert_count"]
-                                    + pred["vert_count"]
-                                    - pred["intersection"]
-                                )
-                                if overlap > overlap_th:
-                                    confidence = pred["confidence"]
-                                    # if already have a prediction for this gt,
-                                    # the prediction with the lower score is automatically a false positive
-                                    if cur_match[gti]:
-                                        max_score = max(cur_score[gti], confidence)
-                                        min_score = min(cur_score[gti], confidence)
-                                        cur_score[gti] = max_score
-                                        # append false positive
-                                        cur_true = np.append(cur_true, 0)
-                                        cur_score = np.append(cur_score, min_score)
-                                        cur_match = np.append(cur_match, True)
-                                    # otherwise set score
-                                    else:
-                                        found_match = True
-                                        cur_match[gti] = True
-                                        cur_score[gti] = confidence
-                                        pred_visited[pred["uuid"]] = True
-                            if not found_match:
-                                hard_false_negatives += 1
-                        # remove non-matched ground truth instances
-                        cur_true = cur_true[cur_match]
-                        cur_score = cur_score[cur_match]
-
+                        cur_true, cur_score, cur_false_negatives = self.match_instances(
+                            overlap, confidence, gt_valid, overlap_th
+                        )
+                        hard_false_negatives += cur_false_negatives
                         # collect non-matched predictions as false positive
-                        for pred in pred_instances:
-                            found_gt = False
-                            for gt in pred["matched_gt"]:
-                                overlap = float(gt["intersection"]) / (
-                                    gt["vert_count"]
-                                    + pred["vert_count"]
-                                    - gt["intersection"]
-                                )
-                                if overlap > overlap_th:
-                                    found_gt = True
-                                    break
-                            if not found_gt:
-                                num_ignore = pred["void_intersection"]
-                                for gt in pred["matched_gt"]:
-                                    if gt["segment_id"] in self.segment_ignore_index:
-                                        num_ignore += gt["intersection"]
-                                    # small ground truth instances
-                                    if (
-                                        gt["vert_count"] < min_region_size
-                                        or gt["med_dist"] > distance_thresh
-                                        or gt["dist_conf"] < distance_conf
-                                    ):
-                                        num_ignore += gt["intersection"]
-                                proportion_ignore = (
-                                    float(num_ignore) / pred["vert_count"]
-                                )
-                                # if not ignored append false positive
-                                if proportion_ignore <= overlap_th:
-                                    cur_true = np.append(cur_true, 0)
-                                    confidence = pred["confidence"]
-                                    cur_score = np.append(cur_score, confidence)
-
-                        # append to overall results
-                        y_true = np.append(y_true, cur_true)
-                        y_score = np.append(y_score, cur_score)
+                        found_gt = np.any(overlap > overlap_th, axis=1)
+                        # if not ignored append false positive
+                        false_positive = np.logical_and(
+                            ~found_gt, proportion_ignore <= overlap_th
+                        )
+                        y_true += [cur_true, np.zeros(np.count_nonzero(false_positive))]
+                        y_score += [cur_score, confidence[false_positive]]
 
                     # compute average precision
                     if has_gt and has_pred:
-                        # compute precision recall curve first
-
-                        # sorting and cumsum
-                        score_arg_sort = np.argsort(y_score)
-                        y_score_sorted = y_score[score_arg_sort]
-                        y_true_sorted = y_true[score_arg_sort]
-                        y_true_sorted_cumsum = np.cumsum(y_true_sorted)
-
-                        # unique thresholds
-                        (thresholds, unique_indices) = np.unique(
-                            y_score_sorted, return_index=True
-                        )
-                        num_prec_recall = len(unique_indices) + 1
-
-                        # prepare precision recall
-                        num_examples = len(y_score_sorted)
-                        # https://github.com/ScanNet/ScanNet/pull/26
-                        # all predictions are non-matched but also all of them are ignored and not counted as FP
-                        # y_true_sorted_cumsum is empty
-                        # num_true_examples = y_true_sorted_cumsum[-1]
-                        num_true_examples = (
-                            y_true_sorted_cumsum[-1]
-                            if len(y_true_sorted_cumsum) > 0
-                            else 0
+                        ap_current = self.average_precision(
+                            np.concatenate(y_true).astype(float),
+                            np.concatenate(y_score).astype(float),
+                            hard_false_negatives,
                         )
-                        precision = np.zeros(num_prec_recall)
-                        recall = np.zeros(num_prec_recall)
-
-                        # deal with the first point
-                        y_true_sorted_cumsum = np.append(y_true_sorted_cumsum, 0)
-                        # deal with remaining
-                        for idx_res, idx_scores in enumerate(unique_indices):
-                            cumsum = y_true_sorted_cumsum[idx_scores - 1]
-                            tp = num_true_examples - cumsum
-                            fp = num_examples - idx_scores - tp
-                            fn = cumsum + hard_false_negatives
-                            p = float(tp) / (tp + fp)
-                            r = float(tp) / (tp + fn)
-                            precision[idx_res] = p
-                            recall[idx_res] = r
-
-                        # first point in curve is artificial
-                        precision[-1] = 1.0
-                        recall[-1] = 0.0
-
-                        # compute average of precision-recall curve
-                        recall_for_conv = np.copy(recall)
-                        recall_for_conv = np.append(recall_for_conv[0], recall_for_conv)
-                        recall_for_conv = np.append(recall_for_conv, 0.0)
-
-                        stepWidths = np.convolve(
-                            recall_for_conv, [-0.5, 0, 0.5], "valid"
-                        )
-                        # integrate is now simply a dot product
-                        ap_current = np.dot(precision, stepWidths)
-
                     elif has_gt:
                         ap_current = 0.0
                     else:
@@ -531,14 +499,26 @@ class InsSegEvaluator(HookBase):
                     input_dict["origin_offset"].int(),
                 )
                 idx = idx.cpu().flatten().long()
-                output_dict["pred_masks"] = output_dict["pred_masks"][:, idx]
+                if "pred_masks" in output_dict.keys():
+                    output_dict["pred_masks"] = output_dict["pred_masks"][:, idx]
+                else:
+                    output_dict.update(
+                        self.map_sparse_masks(
+                            output_dict["pred_masks_idx"],
+                            output_dict["pred_masks_offset"],
+                            idx,
+                            input_dict["coord"].shape[0],
+                        )
+                    )
                 segment = input_dict["origin_segment"]
                 instance = input_dict["origin_instance"]
 
-            gt_instances, pred_instance = self.associate_instances(
+            gt_instances, pred_instance, intersection = self.associate_instances(
                 output_dict, segment, instance
             )
-            scenes.append(dict(gt=gt_instances, pred=pred_instance))
+            scenes.append(
+                dict(gt=gt_instances, pred=pred_instance, intersection=intersection)
+            )
 
             self.trainer.storage.put_scalar("val_loss", loss.item())
             self.trainer.logger.info(
@@ -8,21 +8,35 @@ Please cite our work if the code is helpful to you.
 import sys
 import glob
 import os
-import shutil
 import time
+import numpy as np
 import torch
 import torch.utils.data
-from collections import OrderedDict
+from collections import deque
 
 if sys.version_info >= (3, 10):
     from collections.abc import Sequence
 else:
     from collections import Sequence
 from pointcept.utils.timer import Timer
+from pointcept.utils.misc import AsyncWriter
+from pointcept.utils.checkpoint import (
+    MANIFEST_VERSION,
+    to_cpu,
+    state_size,
+    partition,
+    save_file,
+    link_file,
+    is_manifest,
+    shard_paths,
+    mmap_load,
+    CheckpointReader,
+    convert_state_dict,
+)
 from pointcept.utils.comm import is_main_process, synchronize, get_world_size
-from pointcept.utils.cache import shared_dict
 import pointcept.utils.comm as comm
 from pointcept.engines.test import TESTERS
+from pointcept.datasets.transform import Compose
 
 from .default import HookBase
 from .builder import HOOKS
@@ -144,63 +158,178 @@ class InformationWriter(HookBase):
 
 @HOOKS.register_module()
 class CheckpointSaver(HookBase):
-    def __init__(self, save_freq=None):
+    """
+    Save model_last.pth after each epoch, model_best.pth and epoch_N.pth are hard
+    links to it. The state is copied to CPU on the training thread and written by a
+    background thread (async_save=False writes inline), an error of the background
+    write is raised on the training thread at the next epoch.
+
+    With shard=True and more than one process, every rank writes part of the model
+    and optimizer state to model/shards/epoch_N_rank_R.pth, and the main process
+    saves model_last.pth as a manifest of the shards once all of them exist (the
+    save path has to be shared by all machines, so sharding is off by default and
+    the main process saves the full state), see pointcept.utils.checkpoint.
+    Shards no longer referenced by a checkpoint are removed. max_keep_epoch keeps
+    the latest max_keep_epoch epoch_N.pth only (None keeps all).
+    """
+
+    def __init__(
+        self,
+        save_freq=None,
+        shard=False,
+        async_save=True,
+        max_keep_epoch=None,
+        timeout=1800,
+    ):
         self.save_freq = save_freq  # None or int, None indicate only save model last
+        self.shard = shard
+        self.max_keep_epoch = max_keep_epoch
+        self.timeout = timeout  # seconds the main process waits for other shards
+        # at most one checkpoint in flight, the next save waits for it
+        self.writer = AsyncWriter(num_workers=1 if async_save else 0, max_pending=1)
 
-    def after_epoch(self):
+    def before_train(self):
+        # shards left by an interrupted run would be taken for the shards of a resumed
+        # epoch, remove shards not referenced by a checkpoint
         if is_main_process():
-            is_best = False
-            if self.trainer.cfg.evaluate:
-                current_metric_value = self.trainer.comm_info["current_metric_value"]
-                current_metric_name = self.trainer.comm_info["current_metric_name"]
-                if current_metric_value > self.trainer.best_metric_value:
-                    self.trainer.best_metric_value = current_metric_value
-                    is_best = True
-                    self.trainer.logger.info(
-                        "Best validation {} updated to: {:.4f}".format(
-                            current_metric_name, current_metric_value
-                        )
-                    )
+            model_path = os.path.join(self.trainer.cfg.save_path, "model")
+            self.remove_shards(model_path, epoch=None)
+        synchronize()
+
+    def after_epoch(self):
+        # surface a failed write (e.g. timeout waiting for shards) of the last epoch
+        self.writer.check()
+        is_best = False
+        if is_main_process() and self.trainer.cfg.evaluate:
+            current_metric_value = self.trainer.comm_info["current_metric_value"]
+            current_metric_name = self.trainer.comm_info["current_metric_name"]
+            if current_metric_value > self.trainer.best_metric_value:
+                self.trainer.best_metric_value = current_metric_value
+                is_best = True
                 self.trainer.logger.info(
-                    "Currently Best {}: {:.4f}".format(
-                        current_metric_name, self.trainer.best_metric_value
+                    "Best validation {} updated to: {:.4f}".format(
+                        current_metric_name, current_metric_value
                     )
                 )
+            self.trainer.logger.info(
+                "Currently Best {}: {:.4f}".format(
+                    current_metric_name, self.trainer.best_metric_value
+                )
+            )
 
+        num_shards = get_world_size() if self.shard else 1
+        rank = comm.get_rank()
+        if rank >= num_shards:
+            return
+        epoch = self.trainer.epoch + 1
+        if is_main_process():
             filename = os.path.join(
                 self.trainer.cfg.save_path, "model", "model_last.pth"
             )
             self.trainer.logger.info("Saving checkpoint to: " + filename)
-            torch.save(
-                {
-                    "epoch": self.trainer.epoch + 1,
-                    "state_dict": self.trainer.model.state_dict(),
-                    "optimizer": self.trainer.optimizer.state_dict(),
-                    "scheduler": self.trainer.scheduler.state_dict(),
-                    "scaler": (
-                        self.trainer.scaler.state_dict()
-                        if self.trainer.cfg.enable_amp
-                        else None
-                    ),
-                    "best_metric_value": self.trainer.best_metric_value,
-                },
-                filename + ".tmp",
+        state = self.snapshot(epoch, rank, num_shards)
+        self.writer.submit(self.write, state, epoch, is_best, rank, num_shards)
+
+    def after_train(self):
+        self.writer.flush()
+        self.writer.close()
+        synchronize()
+
+    def snapshot(self, epoch, rank, num_shards):
+        model = self.trainer.model.state_dict()
+        optimizer = self.trainer.optimizer.state_dict()
+        meta = dict(
+            epoch=epoch,
+            scheduler=self.trainer.scheduler.state_dict(),
+            scaler=(
+                self.trainer.scaler.state_dict()
+                if self.trainer.cfg.enable_amp
+                else None
+            ),
+            best_metric_value=self.trainer.best_metric_value,
+        )
+        if num_shards == 1:
+            return to_cpu(dict(state_dict=model, optimizer=optimizer, **meta))
+        # model and optimizer state entries balanced by size, same split on all ranks
+        entries = [("state_dict", key, value) for key, value in model.items()]
+        entries += [
+            ("optimizer_state", key, value) for key, value in optimizer["state"].items()
+        ]
+        owner = partition([state_size(entry[2]) for entry in entries], num_shards)
+        state = dict(state_dict={}, optimizer_state={})
+        for (group, key, value), part in zip(entries, owner):
+            if part == rank:
+                state[group][key] = to_cpu(value)
+        if rank == 0:
+            state.update(
+                to_cpu(meta),
+                state_dict_keys=list(model.keys()),
+                optimizer_param_groups=to_cpu(optimizer["param_groups"]),
             )
-            os.replace(filename + ".tmp", filename)
-            if is_best:
-                shutil.copyfile(
-                    filename,
-                    os.path.join(self.trainer.cfg.save_path, "model", "model_best.pth"),
-                )
-            if self.save_freq and (self.trainer.epoch + 1) % self.save_freq == 0:
-                shutil.copyfile(
-                    filename,
-                    os.path.join(
-                        self.trainer.cfg.save_path,
-                        "model",
-                        f"epoch_{self.trainer.epoch + 1}.pth",
-                    ),
-                )
+        return state
+
+    def write(self, state, epoch, is_best, rank, num_shards):
+        model_path = os.path.join(self.trainer.cfg.save_path, "model")
+        shard_path = os.path.join(model_path, "shards")
+        os.makedirs(shard_path, exist_ok=True)
+        if num_shards == 1:
+            filename = os.path.join(shard_path, f"epoch_{epoch}.pth")
+            save_file(state, filename)
+        else:
+            shards = [f"epoch_{epoch}_rank_{r}.pth" for r in range(num_shards)]
+            save_file(state, os.path.join(shard_path, shards[rank]))
+            if rank != 0:
+                return
+            start = time.time()
+            while not all(
+                os.path.isfile(os.path.join(shard_path, shard)) for shard in shards
+            ):
+                if time.time() - start > self.timeout:
+                    raise RuntimeError(f"Timeout waiting for shards of epoch {epoch}")
+                time.sleep(1)
+            filename = os.path.join(shard_path, f"epoch_{epoch}.pth")
+            save_file(
+                dict(
+                    version=MANIFEST_VERSION,
+                    epoch=epoch,
+                    best_metric_value=state["best_metric_value"],
+                    shards=[os.path.join("shards", shard) for shard in shards],
+                ),
+                filename,
+            )
+        link_file(filename, os.path.join(model_path, "model_last.pth"))
+        if is_best:
+            link_file(filename, os.path.join(model_path, "model_best.pth"))
+        if self.save_freq and epoch % self.save_freq == 0:
+            link_file(filename, os.path.join(model_path, f"epoch_{epoch}.pth"))
+        # the links keep the file
+        os.remove(filename)
+        self.retain(model_path, epoch)
+
+    def retain(self, model_path, epoch):
+        if self.max_keep_epoch is not None:
+            checkpoints = sorted(
+                glob.glob(os.path.join(model_path, "epoch_*.pth")),
+                key=lambda path: int(os.path.basename(path)[6:-4]),
+            )
+            for path in checkpoints[: -self.max_keep_epoch or None]:
+                os.remove(path)
+        self.remove_shards(model_path, epoch)
+
+    @staticmethod
+    def remove_shards(model_path, epoch=None):
+        # remove shards not referenced by any checkpoint, of epochs before epoch
+        referenced = set()
+        for path in glob.glob(os.path.join(model_path, "*.pth")):
+            checkpoint = mmap_load(path)
+            if is_manifest(checkpoint):
+                referenced.update(shard_paths(path, checkpoint))
+        for path in glob.glob(os.path.join(model_path, "shards", "epoch_*_rank_*.pth")):
+            shard_epoch = int(os.path.basename(path).split("_")[1])
+            if epoch is not None and shard_epoch >= epoch:
+                continue
+            if os.path.abspath(path) not in referenced:
+                os.remove(path)
 
 
 @HOOKS.register_module()
@@ -214,24 +343,18 @@ class CheckpointLoader(HookBase):
         self.trainer.logger.info("=> Loading checkpoint & weight ...")
         if self.trainer.cfg.weight and os.path.isfile(self.trainer.cfg.weight):
             self.trainer.logger.info(f"Loading weight at: {self.trainer.cfg.weight}")
-            checkpoint = torch.load(
-                self.trainer.cfg.weight,
-                map_location=lambda storage, loc: storage.cuda(),
-            )
+            # memory-mapped, tensors are read when copied to the parameters
+            checkpoint = CheckpointReader(self.trainer.cfg.weight)
             self.trainer.logger.info(
                 f"Loading layer weights with keyword: {self.keywords}, "
                 f"replace keyword with: {self.replacement}"
             )
-            weight = OrderedDict()
-            for key, value in checkpoint["state_dict"].items():
-                if not key.startswith("module."):
-                    key = "module." + key  # xxx.xxx -> module.xxx.xxx
-                # Now all keys contain "module." no matter DDP or not.
-                if self.keywords in key:
-                    key = key.replace(self.keywords, self.replacement)
-                if comm.get_world_size() == 1:
-                    key = key[7:]  # module.xxx.xxx -> xxx.xxx
-                weight[key] = value
+            weight = convert_state_dict(
+                checkpoint.state_dict(),
+                ddp=comm.get_world_size() > 1,
+                keywords=self.keywords,
+                replacement=self.replacement,
+            )
             load_state_info = self.trainer.model.load_state_dict(
                 weight, strict=self.strict
             )
@@ -242,7 +365,7 @@ class CheckpointLoader(HookBase):
                 )
                 self.trainer.start_epoch = checkpoint["epoch"]
                 self.trainer.best_metric_value = checkpoint["best_metric_value"]
-                self.trainer.optimizer.load_state_dict(checkpoint["optimizer"])
+                self.trainer.optimizer.load_state_dict(checkpoint.optimizer())
                 self.trainer.scheduler.load_state_dict(checkpoint["scheduler"])
                 if self.trainer.cfg.enable_amp:
                     self.trainer.scaler.load_state_dict(checkpoint["scaler"])
@@ -261,9 +384,7 @@ class PreciseEvaluator(HookBase):
         )
         torch.cuda.empty_cache()
         cfg = self.trainer.cfg
-        tester = TESTERS.build(
-            dict(type=cfg.test.type, cfg=cfg, model=self.trainer.model)
-        )
+        tester = TESTERS.build(dict(**cfg.test, cfg=cfg, model=self.trainer.model))
         if self.test_last:
             self.trainer.logger.info("=> Testing on model_last ...")
         else:
@@ -271,45 +392,134 @@ class PreciseEvaluator(HookBase):
             best_path = os.path.join(
                 self.trainer.cfg.save_path, "model", "model_best.pth"
             )
-            checkpoint = torch.load(best_path)
-            state_dict = checkpoint["state_dict"]
+            state_dict = CheckpointReader(best_path).state_dict()
             tester.model.load_state_dict(state_dict, strict=True)
         tester.test()
 
 
 @HOOKS.register_module()
 class DataCacheOperator(HookBase):
-    def __init__(self, data_root, split):
-        self.data_root = data_root
-        self.split = split
-        self.data_list = self.get_data_list()
-
-    def get_data_list(self):
-        if isinstance(self.split, str):
-            data_list = glob.glob(os.path.join(self.data_root, self.split))
-        elif isinstance(self.split, Sequence):
-            data_list = []
-            for split in self.split:
-                data_list += glob.glob(os.path.join(self.data_root, split))
-        else:
-            raise NotImplementedError
-        return data_list
+    """
+    Work with dataset built with cache (see SceneCache), optionally warm up the
+    cache of train dataset before training and record hit / miss / eviction
+    counters of the cache after each epoch.
+    """
+
+    def __init__(self, warm_up=False):
+        self.warm_up = warm_up
 
-    def get_cache_name(self, data_path):
-        data_name = data_path.replace(os.path.dirname(self.data_root), "")
-        return "pointcept" + data_name.replace(os.path.sep, "-")
+    @staticmethod
+    def get_caches(loader):
+        # (dataset, cache) of the loader, or of each MultiDatasetDataloader sub dataset
+        if loader is None:
+            return []
+        datasets = [loader.dataset] if hasattr(loader, "dataset") else loader.datasets
+        return [
+            (dataset, dataset.cache)
+            for dataset in datasets
+            if getattr(dataset, "cache", None) is not None
+        ]
 
     def before_train(self):
-        self.trainer.logger.info(
-            f"=> Caching dataset: {self.data_root}, split: {self.split} ..."
+        caches = self.get_caches(self.trainer.train_loader)
+        if len(caches) == 0:
+            self.trainer.logger.info("=> Train dataset is not cached.")
+            return
+        if self.warm_up:
+            for dataset, cache in caches:
+                self.trainer.logger.info(
+                    f"=> Warming up dataset cache: {cache.namespace}"
+                )
+                # each rank warms up part of the data list, shared backends are reused
+                for i in range(
+                    comm.get_rank(), len(dataset.data_list), get_world_size()
+                ):
+                    dataset.get_data(i)
+            synchronize()
+
+    def after_epoch(self):
+        for split, loader in [
+            ("train", self.trainer.train_loader),
+            ("val", self.trainer.val_loader),
+        ]:
+            caches = self.get_caches(loader)
+            for i, (_, cache) in enumerate(caches):
+                name = f"{split}{i}" if len(caches) > 1 else split
+                stats = cache.stats()
+                for key, value in stats.items():
+                    self.trainer.storage.put_scalar(f"{name}_cache_{key}", value)
+                self.trainer.logger.info(
+                    "Cache ({name}): hit {hit} miss {miss} eviction {eviction} "
+                    "hit rate {hit_rate:.4f} usage {usage_gb:.2f}G".format(
+                        name=name, usage_gb=stats["usage"] / 1024**3, **stats
+                    )
+                )
+                if self.trainer.writer is not None:
+                    for key, value in stats.items():
+                        self.trainer.writer.add_scalar(
+                            f"cache_{name}/{key}", value, self.trainer.epoch + 1
+                        )
+
+
+@HOOKS.register_module()
+class TransformProfiler(HookBase):
+    """
+    Record the wall time and input / output point count of each transform of the
+    train dataset (Compose.enable_profile) across dataloader workers, and write a
+    summary sorted by total time to the logger, EventStorage (transform_*, ms) and
+    TensorBoard (transform/*) after each epoch. Put it before hooks iterating the
+    train loader in before_train, workers started earlier are not recorded.
+    """
+
+    def __init__(self, max_workers=64, row_limit=30):
+        self.max_workers = max_workers
+        self.row_limit = row_limit
+        self.composes = []
+
+    @staticmethod
+    def get_composes(loader):
+        # a copy, the list of MultiDatasetDataloader is the one of its ConcatDataset
+        datasets = (
+            [loader.dataset] if hasattr(loader, "dataset") else list(loader.datasets)
         )
-        if is_main_process():
-            dataset = self.trainer.train_loader.dataset
-            for i in range(len(dataset)):
-                data_dict = dataset[i]
-                name = data_dict["name"]
-                shared_dict(f"Pointcept-{name}", data_dict)
-        synchronize()
+        composes = []
+        while len(datasets) > 0:
+            dataset = datasets.pop(0)
+            if hasattr(dataset, "datasets"):
+                datasets += list(dataset.datasets)  # ConcatDataset
+            elif isinstance(getattr(dataset, "transform", None), Compose):
+                composes.append(dataset.transform)
+        return composes
+
+    def before_train(self):
+        self.composes = self.get_composes(self.trainer.train_loader)
+        for compose in self.composes:
+            compose.enable_profile(self.max_workers)
+
+    def after_epoch(self):
+        for i, compose in enumerate(self.composes):
+            summary = compose.profile_summary(reset=True)
+            summary = [value for value in summary if value["count"] > 0]
+            prefix = f"{i}/" if len(self.composes) > 1 else ""
+            total = sum(value["total"] for value in summary) + 1e-10
+            info = "Transform profile{}:".format(f" ({i})" if prefix else "")
+            for value in summary[: self.row_limit]:
+                info += (
+                    "\n{name:<40} {latency:8.2f} ms ({percent:5.1f}%) x {count} "
+                    "points {points_in:.0f} -> {points_out:.0f}".format(
+                        percent=value["total"] / total * 100, **value
+                    )
+                )
+            self.trainer.logger.info(info)
+            for value in summary:
+                name = prefix + value["name"]
+                self.trainer.storage.put_scalar(
+                    f"transform_{name}", value["latency"], n=value["count"]
+                )
+                if self.trainer.writer is not None:
+                    self.trainer.writer.add_scalar(
+                        f"transform/{name}", value["latency"], self.trainer.epoch + 1
+                    )
 
 
 @HOOKS.register_module()
@@ -462,3 +672,226 @@ class RuntimeProfilerV2(HookBase):
 
         if self.interrupt:
             sys.exit(0)
+
+
+class StepMarker(HookBase):
+    # first / last hook of the trainer, marks the boundaries of the step hooks
+    def __init__(self, profiler, position):
+        self.profiler = profiler
+        self.position = position
+
+    def before_step(self):
+        if self.position == "first":
+            self.profiler.begin_step()
+        elif self.profiler.sampled:
+            self.profiler.mark("run_start")
+
+    def after_step(self):
+        if self.position == "last":
+            self.profiler.end_step()
+        elif self.profiler.sampled:
+            self.profiler.mark("run_end")
+
+
+@HOOKS.register_module()
+class StepProfiler(HookBase):
+    """
+    Always-on sampling profiler. Every interval steps, the step is split into stages:
+    data (wait for the loader), h2d (copy of the input, done by this hook), forward
+    of each top-level module of the model, loss (rest of the model forward, e.g.
+    criteria), backward, optimizer (step, scheduler) and hooks (before_step and
+    after_step of all hooks). Stages are timed with CUDA events when CUDA is
+    available and perf counters otherwise, and put to EventStorage (profile_*) and
+    TensorBoard (profile/*) in ms. p50 / p95 / p99 of the step latency over the last
+    window steps are logged every epoch. Other steps only read a perf counter.
+    """
+
+    def __init__(
+        self, interval=100, window=1000, percentiles=(50, 95, 99), warmup_iter=2
+    ):
+        self.interval = interval
+        self.percentiles = percentiles
+        self.warmup_iter = warmup_iter
+        self.latency = deque(maxlen=window)  # ms, rolling
+        self.cuda = False
+        self.step = 0
+        self.step_start = None
+        self.last_end = None
+        self.sampled = False
+        self.handles = []
+        self.marks = {}
+        self.intervals = {}
+        self.forwarding = False
+
+    def before_train(self):
+        self.cuda = torch.cuda.is_available()
+        # wrap all hooks (the list is replaced, the running loop is not affected)
+        self.trainer.hooks = (
+            [StepMarker(self, "first")]
+            + list(self.trainer.hooks)
+            + [StepMarker(self, "last")]
+        )
+
+    def before_epoch(self):
+        # the first wait of an epoch includes starting the loader workers
+        self.last_end = None
+
+    def mark(self, name):
+        if self.cuda:
+            event = torch.cuda.Event(enable_timing=True)
+            event.record()
+            self.marks[name] = event
+        else:
+            self.marks[name] = time.perf_counter()
+
+    def elapsed(self, start, end):
+        if start not in self.marks or end not in self.marks:
+            return 0.0
+        start, end = self.marks[start], self.marks[end]
+        if self.cuda:
+            return start.elapsed_time(end)
+        return (end - start) * 1000
+
+    def begin_step(self):
+        self.step_start = time.perf_counter()
+        self.step += 1
+        self.sampled = self.step > self.warmup_iter and self.step % self.interval == 0
+        if not self.sampled:
+            return
+        self.marks, self.intervals = {}, {}
+        self.mark("step_start")
+        model = self.trainer.model
+        module = model.module if hasattr(model, "module") else model
+        self.handles = [
+            model.register_forward_pre_hook(self.forward_hook("forward_start")),
+            model.register_forward_hook(self.forward_hook("forward_end")),
+        ]
+        for name, child in module.named_children():
+            self.handles += [
+                child.register_forward_pre_hook(self.module_hook(name, True)),
+                child.register_forward_hook(self.module_hook(name, False)),
+            ]
+        if hasattr(self.trainer.optimizer, "register_step_pre_hook"):
+            self.handles.append(
+                self.trainer.optimizer.register_step_pre_hook(
+                    lambda *args: self.mark("optimizer_start")
+                )
+            )
+
+    def forward_hook(self, name):
+        def hook(*args):
+            self.forwarding = name == "forward_start"
+            self.mark(name)
+
+        return hook
+
+    def module_hook(self, name, start):
+        # modules re-run in backward (checkpointing) are not forward
+        def hook(*args):
+            if not self.forwarding:
+                return
+            self.mark(f"forward_{name}_" + ("start" if start else "end"))
+            if not start:
+                self.intervals.setdefault(name, []).append(
+                    (
+                        self.marks[f"forward_{name}_start"],
+                        self.marks[f"forward_{name}_end"],
+                    )
+                )
+
+        return hook
+
+    def before_step(self):
+        if not self.sampled:
+            return
+        self.mark("h2d_start")
+        if self.cuda:
+            input_dict = self.trainer.comm_info["input_dict"]
+            for key in input_dict.keys():
+                if isinstance(input_dict[key], torch.Tensor):
+                    input_dict[key] = input_dict[key].cuda(non_blocking=True)
+        self.mark("h2d_end")
+
+    def end_step(self):
+        step_end = time.perf_counter()
+        data = None
+        if self.last_end is not None and self.step > self.warmup_iter:
+            data = (self.step_start - self.last_end) * 1000
+            self.latency.append((step_end - self.last_end) * 1000)
+        self.last_end = step_end
+        if not self.sampled:
+            return
+        self.mark("step_end")
+        self.sampled = False
+        for handle in self.handles:
+            handle.remove()
+        self.handles = []
+        if self.cuda:
+            self.marks["step_end"].synchronize()
+        stages = self.stages(data)
+        global_iter = self.trainer.epoch * len(self.trainer.train_loader) + (
+            self.trainer.comm_info["iter"] + 1
+        )
+        for key, value in stages.items():
+            self.trainer.storage.put_scalar(f"profile_{key}", value)
+        if self.trainer.writer is not None:
+            for key, value in stages.items():
+                self.trainer.writer.add_scalar(f"profile/{key}", value, global_iter)
+            for p, value in self.latency_percentiles().items():
+                self.trainer.writer.add_scalar(f"profile/step_{p}", value, global_iter)
+
+    def stages(self, data=None):
+        h2d = self.elapsed("h2d_start", "h2d_end")
+        h2d += self.elapsed("run_start", "forward_start")
+        stages = dict(h2d=h2d)
+        if data is not None:
+            stages["data"] = data
+        forward = self.elapsed("forward_start", "forward_end")
+        for name, intervals in self.intervals.items():
+            if self.cuda:
+                stages[f"forward_{name}"] = sum(s.elapsed_time(e) for s, e in intervals)
+            else:
+                stages[f"forward_{name}"] = sum(e - s for s, e in intervals) * 1000
+            forward -= stages[f"forward_{name}"]
+        stages["loss"] = max(forward, 0.0)
+        if "optimizer_start" in self.marks:
+            stages["backward"] = self.elapsed("forward_end", "optimizer_start")
+            stages["optimizer"] = self.elapsed("optimizer_start", "run_end")
+        else:
+            # optimizer step skipped (amp) or no step hook (torch < 2.0)
+            stages["backward"] = self.elapsed("forward_end", "run_end")
+            stages["optimizer"] = 0.0
+        stages["hooks"] = (
+            self.elapsed("step_start", "run_start")
+            - self.elapsed("h2d_start", "h2d_end")
+            + self.elapsed("run_end", "step_end")
+        )
+        stages["step"] = sum(stages.values())
+        return stages
+
+    def latency_percentiles(self):
+        if len(self.latency) == 0:
+            return {}
+        values = np.percentile(np.array(self.latency), self.percentiles)
+        return {f"p{p}": value for p, value in zip(self.percentiles, values)}
+
+    def after_epoch(self):
+        percentiles = self.latency_percentiles()
+        info = "Profile: step latency (last {} steps) ".format(len(self.latency))
+        info += " ".join(f"{p} {value:.1f}" for p, value in percentiles.items())
+        histories = {
+            key[len("profile_") :]: history.avg
+            for key, history in self.trainer.storage.histories().items()
+            if key.startswith("profile_") and history.count > 0
+        }
+        if len(histories) > 0:
+            info += " ms, sampled stages (avg ms): " + " ".join(
+                f"{key} {value:.1f}"
+                for key, value in sorted(histories.items(), key=lambda x: -x[1])
+            )
+        self.trainer.logger.info(info)
+        if self.trainer.writer is not None:
+            for p, value in percentiles.items():
+                self.trainer.writer.add_scalar(
+                    f"profile_epoch/step_{p}", value, self.trainer.epoch + 1
+                )
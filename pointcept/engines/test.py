@@ -8,13 +8,12 @@ Please cite our work if the code is helpful to you.
 import os
 import time
 import numpy as np
-from collections import OrderedDict
 import torch
-import torch.distributed as dist
 import torch.nn.functional as F
 import torch.utils.data
 
 from .defaults import create_ddp_model
+from .dispatch import SceneQueue, ProgressManifest, prefetch
 import pointcept.utils.comm as comm
 from pointcept.datasets import build_dataset, collate_fn
 from pointcept.models import build_model
@@ -22,11 +21,11 @@ from pointcept.utils.logger import get_root_logger
 from pointcept.utils.registry import Registry
 from pointcept.utils.misc import (
     AverageMeter,
-    intersection_and_union,
-    intersection_and_union_gpu,
+    ConfusionMatrix,
     make_dirs,
+    AsyncWriter,
 )
-
+from pointcept.utils.checkpoint import CheckpointReader, convert_state_dict
 
 TESTERS = Registry("testers")
 
@@ -66,16 +65,11 @@ class TesterBase:
         )
         if os.path.isfile(self.cfg.weight):
             self.logger.info(f"Loading weight at: {self.cfg.weight}")
-            checkpoint = torch.load(self.cfg.weight)
-            weight = OrderedDict()
-            for key, value in checkpoint["state_dict"].items():
-                if key.startswith("module."):
-                    if comm.get_world_size() == 1:
-                        key = key[7:]  # module.xxx.xxx -> xxx.xxx
-                else:
-                    if comm.get_world_size() > 1:
-                        key = "module." + key  # xxx.xxx -> module.xxx.xxx
-                weight[key] = value
+            # only the weights are read, from the memory-mapped checkpoint
+            checkpoint = CheckpointReader(self.cfg.weight)
+            weight = convert_state_dict(
+                checkpoint.state_dict(), ddp=comm.get_world_size() > 1
+            )
             model.load_state_dict(weight, strict=True)
             self.logger.info(
                 "=> Loaded weight '{}' (epoch {})".format(
@@ -103,6 +97,12 @@ class TesterBase:
         )
         return test_loader
 
+    def is_repeated(self, idx):
+        # DistributedSampler pads the last round with repeated samples, which are
+        # counted once by skipping them in the metric of the rank
+        rank, world_size = comm.get_rank(), comm.get_world_size()
+        return idx * world_size + rank >= len(self.test_loader.dataset)
+
     def test(self):
         raise NotImplementedError
 
@@ -113,15 +113,109 @@ class TesterBase:
 
 @TESTERS.register_module()
 class SemSegTester(TesterBase):
+    def __init__(
+        self,
+        fragment_batch_size=1,
+        fragment_point_budget=None,
+        num_writer=2,
+        dispatch="static",
+        queue_backend="store",
+        num_prefetch=1,
+        **kwargs,
+    ):
+        super().__init__(**kwargs)
+        # fragments (voxelize / crop / aug) of a scene are packed into one forward
+        # with up to fragment_batch_size fragments and fragment_point_budget points
+        self.fragment_batch_size = fragment_batch_size
+        self.fragment_point_budget = fragment_point_budget
+        # background threads writing predictions and submission files
+        self.num_writer = num_writer
+        # static: DistributedSampler split of the test loader, dynamic: scenes
+        # claimed largest first from a shared queue ("store" or "file" backed, see
+        # engines/dispatch.py) and loaded num_prefetch ahead, resumed from the
+        # progress manifest without loading completed scenes
+        assert dispatch in ["static", "dynamic"]
+        self.dispatch = dispatch
+        self.queue_backend = queue_backend
+        self.num_prefetch = num_prefetch
+
+    @staticmethod
+    def build_label_lut(label_map):
+        # dict label mapping -> lookup table, negative keys (ignore) are skipped
+        lut = np.zeros(max(label_map.keys()) + 1, dtype=np.int64)
+        for key, value in label_map.items():
+            if key >= 0:
+                lut[key] = value
+        return lut
+
+    def build_scene_queue(self, save_path, metric):
+        # scenes not completed by previous runs, largest first, decided on the main
+        # process which also restores the confusion of completed scenes
+        dataset = self.test_loader.dataset
+        order = None
+        if comm.is_main_process():
+            completed = ProgressManifest.read_all(save_path)
+            for record in completed.values():
+                confusion = torch.tensor(record["confusion"], dtype=torch.long)
+                confusion = confusion.reshape(-1, 3)
+                matrix = torch.zeros_like(metric.matrix)
+                matrix[confusion[:, 0], confusion[:, 1]] = confusion[:, 2]
+                metric.accumulate(matrix)
+            order = [
+                i
+                for i in range(len(dataset))
+                if dataset.get_data_name(i) not in completed
+            ]
+            if hasattr(dataset, "get_data_size"):
+                order = sorted(order, key=dataset.get_data_size, reverse=True)
+            get_root_logger().info(
+                "Skip {} completed scenes, dispatch {} scenes.".format(
+                    len(dataset) - len(order), len(order)
+                )
+            )
+        order = comm.all_gather(order)[0]
+        return SceneQueue(
+            order, backend=self.queue_backend, path=os.path.join(save_path, "queue")
+        )
+
+    @staticmethod
+    def write_scene(jobs, manifest=None, name=None, record=None):
+        for fn, args, kwargs in jobs:
+            fn(*args, **kwargs)
+        if manifest is not None:
+            manifest.update(name, record)
+
+    @staticmethod
+    def save_pred(path, pred):
+        # written to a temporary file and renamed, resume never loads a partial file
+        with open(path + ".tmp", "wb") as f:
+            np.save(f, pred)
+        os.replace(path + ".tmp", path)
+
+    def pack_fragment(self, fragment_list):
+        batch_list, start, num_points = [], 0, 0
+        for i, fragment in enumerate(fragment_list):
+            num_points += fragment["index"].shape[0]
+            if i > start and (
+                i - start >= self.fragment_batch_size
+                or (
+                    self.fragment_point_budget is not None
+                    and num_points > self.fragment_point_budget
+                )
+            ):
+                batch_list.append((start, i))
+                start, num_points = i, fragment["index"].shape[0]
+        if len(fragment_list) > 0:
+            batch_list.append((start, len(fragment_list)))
+        return batch_list
+
     def test(self):
         assert self.test_loader.batch_size == 1
         logger = get_root_logger()
         logger.info(">>>>>>>>>>>>>>>> Start Evaluation >>>>>>>>>>>>>>>>")
 
         batch_time = AverageMeter()
-        intersection_meter = AverageMeter()
-        union_meter = AverageMeter()
-        target_meter = AverageMeter()
+        metric = ConfusionMatrix(self.cfg.data.num_classes, self.cfg.data.ignore_index)
         self.model.eval()
 
         save_path = os.path.join(self.cfg.save_path, "result")
@@ -155,12 +249,32 @@ class SemSegTester(TesterBase):
                 os.path.join(save_path, "submit", "test", "submission.json"), "w"
             ) as f:
                 json.dump(submission, f, indent=4)
+        if self.cfg.data.test.type == "SemanticKITTIDataset":
+            learning_map_inv_lut = self.build_label_lut(
+                self.test_loader.dataset.learning_map_inv
+            )
         comm.synchronize()
-        record = {}
+        writer = AsyncWriter(num_workers=self.num_writer)
+        if self.dispatch == "dynamic":
+            manifest = ProgressManifest(save_path)
+            queue = self.build_scene_queue(save_path, metric)
+            loader = prefetch(self.test_loader.dataset, queue, self.num_prefetch)
+            scenes = (data_dict for _, data_dict in loader)
+            num_scenes = len(queue)
+        else:
+            manifest = None
+            # current assume batch size is 1
+            scenes = (data_dict[0] for data_dict in self.test_loader)
+            num_scenes = len(self.test_loader)
+        # writes of a scene, run in order on a writer thread by write_scene
+        jobs = []
+
+        def add_job(fn, *args, **kwargs):
+            jobs.append((fn, args, kwargs))
+
         # fragment inference
-        for idx, data_dict in enumerate(self.test_loader):
+        for idx, data_dict in enumerate(scenes):
             end = time.time()
-            data_dict = data_dict[0]  # current assume batch size is 1
             fragment_list = data_dict.pop("fragment_list")
             segment = data_dict.pop("segment")
             data_name = data_dict.pop("name")
@@ -168,7 +282,7 @@ class SemSegTester(TesterBase):
             if os.path.isfile(pred_save_path):
                 logger.info(
                     "{}/{}: {}, loaded pred and label.".format(
-                        idx + 1, len(self.test_loader), data_name
+                        idx + 1, num_scenes, data_name
                     )
                 )
                 pred = np.load(pred_save_path)
@@ -176,11 +290,8 @@ class SemSegTester(TesterBase):
                     segment = data_dict["origin_segment"]
             else:
                 pred = torch.zeros((segment.size, self.cfg.data.num_classes)).cuda()
-                for i in range(len(fragment_list)):
-                    fragment_batch_size = 1
-                    s_i, e_i = i * fragment_batch_size, min(
-                        (i + 1) * fragment_batch_size, len(fragment_list)
-                    )
+                batch_list = self.pack_fragment(fragment_list)
+                for i, (s_i, e_i) in enumerate(batch_list):
                     input_dict = collate_fn(fragment_list[s_i:e_i])
                     for key in input_dict.keys():
                         if isinstance(input_dict[key], torch.Tensor):
@@ -191,18 +302,18 @@ class SemSegTester(TesterBase):
                         pred_part = F.softmax(pred_part, -1)
                         if self.cfg.empty_cache:
                             torch.cuda.empty_cache()
-                        bs = 0
-                        for be in input_dict["offset"]:
-                            pred[idx_part[bs:be], :] += pred_part[bs:be]
-                            bs = be
+                        pred.index_add_(0, idx_part, pred_part.to(pred.dtype))
 
                     logger.info(
-                        "Test: {}/{}-{data_name}, Batch: {batch_idx}/{batch_num}".format(
+                        "Test: {}/{}-{data_name}, Batch: {batch_idx}/{batch_num}, "
+                        "Fragment: {e_i}/{fragment_num}".format(
                             idx + 1,
-                            len(self.test_loader),
+                            num_scenes,
                             data_name=data_name,
                             batch_idx=i,
-                            batch_num=len(fragment_list),
+                            batch_num=len(batch_list),
+                            e_i=e_i,
+                            fragment_num=len(fragment_list),
                         )
                     )
                 if self.cfg.data.test.type == "ScanNetPPDataset":
@@ -213,18 +324,20 @@ class SemSegTester(TesterBase):
                     assert "inverse" in data_dict.keys()
                     pred = pred[data_dict["inverse"]]
                     segment = data_dict["origin_segment"]
-                np.save(pred_save_path, pred)
+                add_job(self.save_pred, pred_save_path, pred)
             if (
                 self.cfg.data.test.type == "ScanNetDataset"
                 or self.cfg.data.test.type == "ScanNet200Dataset"
             ):
-                np.savetxt(
+                add_job(
+                    np.savetxt,
                     os.path.join(save_path, "submit", "{}.txt".format(data_name)),
                     self.test_loader.dataset.class2id[pred].reshape([-1, 1]),
                     fmt="%d",
                 )
             elif self.cfg.data.test.type == "ScanNetPPDataset":
-                np.savetxt(
+                add_job(
+                    np.savetxt,
                     os.path.join(save_path, "submit", "{}.txt".format(data_name)),
                     pred.astype(np.int32),
                     delimiter=",",
@@ -240,11 +353,9 @@ class SemSegTester(TesterBase):
                     ),
                     exist_ok=True,
                 )
-                submit = pred.astype(np.uint32)
-                submit = np.vectorize(
-                    self.test_loader.dataset.learning_map_inv.__getitem__
-                )(submit).astype(np.uint32)
-                submit.tofile(
+                submit = learning_map_inv_lut[pred].astype(np.uint32)
+                add_job(
+                    submit.tofile,
                     os.path.join(
                         save_path,
                         "submit",
@@ -252,36 +363,32 @@ class SemSegTester(TesterBase):
                         sequence_name,
                         "predictions",
                         f"{frame_name}.label",
-                    )
+                    ),
                 )
             elif self.cfg.data.test.type == "NuScenesDataset":
-                np.array(pred + 1).astype(np.uint8).tofile(
+                add_job(
+                    np.array(pred + 1).astype(np.uint8).tofile,
                     os.path.join(
                         save_path,
                         "submit",
                         "lidarseg",
                         "test",
                         "{}_lidarseg.bin".format(data_name),
-                    )
+                    ),
                 )
 
-            intersection, union, target = intersection_and_union(
-                pred, segment, self.cfg.data.num_classes, self.cfg.data.ignore_index
-            )
-            intersection_meter.update(intersection)
-            union_meter.update(union)
-            target_meter.update(target)
-            record[data_name] = dict(
-                intersection=intersection, union=union, target=target
-            )
-
-            mask = union != 0
-            iou_class = intersection / (union + 1e-10)
-            iou = np.mean(iou_class[mask])
-            acc = sum(intersection) / (sum(target) + 1e-10)
-
-            m_iou = np.mean(intersection_meter.sum / (union_meter.sum + 1e-10))
-            m_acc = np.mean(intersection_meter.sum / (target_meter.sum + 1e-10))
+            matrix = metric.compute(pred, segment)
+            if manifest is not None or not self.is_repeated(idx):
+                metric.accumulate(matrix)
+            # recorded as completed (with its confusion) once its files are written
+            t, p = torch.nonzero(matrix, as_tuple=True)
+            record = dict(confusion=torch.stack([t, p, matrix[t, p]], 1).tolist())
+            writer.submit(self.write_scene, list(jobs), manifest, data_name, record)
+            jobs.clear()
+            scene, total = metric.summary(matrix), metric.summary()
+            iou = np.mean(scene["iou_class"][scene["union"] != 0])
+            acc = scene["all_acc"]
+            m_iou, m_acc = total["m_iou"], total["m_acc"]
 
             batch_time.update(time.time() - end)
             logger.info(
@@ -291,7 +398,7 @@ class SemSegTester(TesterBase):
                 "mIoU {iou:.4f} ({m_iou:.4f})".format(
                     data_name,
                     idx + 1,
-                    len(self.test_loader),
+                    num_scenes,
                     segment.size,
                     batch_time=batch_time,
                     acc=acc,
@@ -301,33 +408,30 @@ class SemSegTester(TesterBase):
                 )
             )
 
+        logger.info("Flushing ...")
+        writer.flush()
+        writer.close()
+        if manifest is not None:
+            manifest.close()
         logger.info("Syncing ...")
         comm.synchronize()
-        record_sync = comm.gather(record, dst=0)
+        metric.sync()
 
         if comm.is_main_process():
-            record = {}
-            for _ in range(len(record_sync)):
-                r = record_sync.pop()
-                record.update(r)
-                del r
-            intersection = np.sum(
-                [meters["intersection"] for _, meters in record.items()], axis=0
-            )
-            union = np.sum([meters["union"] for _, meters in record.items()], axis=0)
-            target = np.sum([meters["target"] for _, meters in record.items()], axis=0)
-
+            summary = metric.summary()
             if self.cfg.data.test.type == "S3DISDataset":
                 torch.save(
-                    dict(intersection=intersection, union=union, target=target),
+                    dict(
+                        intersection=summary["intersection"],
+                        union=summary["union"],
+                        target=summary["target"],
+                    ),
                     os.path.join(save_path, f"{self.test_loader.dataset.split}.pth"),
                 )
 
-            iou_class = intersection / (union + 1e-10)
-            accuracy_class = intersection / (target + 1e-10)
-            mIoU = np.mean(iou_class)
-            mAcc = np.mean(accuracy_class)
-            allAcc = sum(intersection) / (sum(target) + 1e-10)
+            iou_class = summary["iou_class"]
+            accuracy_class = summary["acc_class"]
+            mIoU, mAcc, allAcc = summary["m_iou"], summary["m_acc"], summary["all_acc"]
 
             logger.info(
                 "Val result: mIoU/mAcc/allAcc {:.4f}/{:.4f}/{:.4f}".format(
@@ -356,9 +460,7 @@ class ClsTester(TesterBase):
         logger = get_root_logger()
         logger.info(">>>>>>>>>>>>>>>> Start Evaluation >>>>>>>>>>>>>>>>")
         batch_time = AverageMeter()
-        intersection_meter = AverageMeter()
-        union_meter = AverageMeter()
-        target_meter = AverageMeter()
+        metric = ConfusionMatrix(self.cfg.data.num_classes, self.cfg.data.ignore_index)
         self.model.eval()
 
         for i, input_dict in enumerate(self.test_loader):
@@ -371,23 +473,8 @@ class ClsTester(TesterBase):
             output = output_dict["cls_logits"]
             pred = output.max(1)[1]
             label = input_dict["category"]
-            intersection, union, target = intersection_and_union_gpu(
-                pred, label, self.cfg.data.num_classes, self.cfg.data.ignore_index
-            )
-            if comm.get_world_size() > 1:
-                dist.all_reduce(intersection), dist.all_reduce(union), dist.all_reduce(
-                    target
-                )
-            intersection, union, target = (
-                intersection.cpu().numpy(),
-                union.cpu().numpy(),
-                target.cpu().numpy(),
-            )
-            intersection_meter.update(intersection), union_meter.update(
-                union
-            ), target_meter.update(target)
-
-            accuracy = sum(intersection_meter.val) / (sum(target_meter.val) + 1e-10)
+            # accuracy of the batch on this rank, ranks are reduced once at the end
+            accuracy = metric.summary(metric.update(pred, label))["all_acc"]
             batch_time.update(time.time() - end)
 
             logger.info(
@@ -401,11 +488,10 @@ class ClsTester(TesterBase):
                 )
             )
 
-        iou_class = intersection_meter.sum / (union_meter.sum + 1e-10)
-        accuracy_class = intersection_meter.sum / (target_meter.sum + 1e-10)
-        mIoU = np.mean(iou_class)
-        mAcc = np.mean(accuracy_class)
-        allAcc = sum(intersection_meter.sum) / (sum(target_meter.sum) + 1e-10)
+        metric.sync()
+        summary = metric.summary()
+        iou_class, accuracy_class = summary["iou_class"], summary["acc_class"]
+        mIoU, mAcc, allAcc = summary["m_iou"], summary["m_acc"], summary["all_acc"]
         logger.info(
             "Val result: mIoU/mAcc/allAcc {:.4f}/{:.4f}/{:.4f}.".format(
                 mIoU, mAcc, allAcc
@@ -461,9 +547,7 @@ class ClsVotingTester(TesterBase):
     def test_once(self):
         logger = get_root_logger()
         batch_time = AverageMeter()
-        intersection_meter = AverageMeter()
-        target_meter = AverageMeter()
-        record = {}
+        metric = ConfusionMatrix(self.cfg.data.num_classes, self.cfg.data.ignore_index)
         self.model.eval()
 
         for idx, data_dict in enumerate(self.test_loader):
@@ -489,14 +573,11 @@ class ClsVotingTester(TesterBase):
                     0, keepdim=True
                 )
             pred = pred.max(1)[1].cpu().numpy()
-            intersection, union, target = intersection_and_union(
-                pred, category, self.cfg.data.num_classes, self.cfg.data.ignore_index
-            )
-            intersection_meter.update(intersection)
-            target_meter.update(target)
-            record[data_name] = dict(intersection=intersection, target=target)
-            acc = sum(intersection) / (sum(target) + 1e-10)
-            m_acc = np.mean(intersection_meter.sum / (target_meter.sum + 1e-10))
+            matrix = metric.compute(pred, category)
+            if not self.is_repeated(idx):
+                metric.accumulate(matrix)
+            acc = metric.summary(matrix)["all_acc"]
+            m_acc = metric.summary()["m_acc"]
             batch_time.update(time.time() - end)
             logger.info(
                 "Test: {} [{}/{}] "
@@ -513,21 +594,12 @@ class ClsVotingTester(TesterBase):
 
         logger.info("Syncing ...")
         comm.synchronize()
-        record_sync = comm.gather(record, dst=0)
+        metric.sync()
 
         if comm.is_main_process():
-            record = {}
-            for _ in range(len(record_sync)):
-                r = record_sync.pop()
-                record.update(r)
-                del r
-            intersection = np.sum(
-                [meters["intersection"] for _, meters in record.items()], axis=0
-            )
-            target = np.sum([meters["target"] for _, meters in record.items()], axis=0)
-            accuracy_class = intersection / (target + 1e-10)
-            mAcc = np.mean(accuracy_class)
-            allAcc = sum(intersection) / (sum(target) + 1e-10)
+            summary = metric.summary()
+            accuracy_class = summary["acc_class"]
+            mAcc, allAcc = summary["m_acc"], summary["all_acc"]
 
             logger.info("Val result: mAcc/allAcc {:.4f}/{:.4f}".format(mAcc, allAcc))
             for i in range(self.cfg.data.num_classes):
@@ -556,6 +628,7 @@ class PartSegTester(TesterBase):
 
         num_categories = len(self.test_loader.dataset.categories)
         iou_category, iou_count = np.zeros(num_categories), np.zeros(num_categories)
+        metric = ConfusionMatrix(self.cfg.data.num_classes)
         self.model.eval()
 
         save_path = os.path.join(
@@ -599,14 +672,11 @@ class PartSegTester(TesterBase):
             category_index = data_dict_list[0]["cls_token"]
             category = self.test_loader.dataset.categories[category_index]
             parts_idx = self.test_loader.dataset.category2part[category]
-            parts_iou = np.zeros(len(parts_idx))
-            for j, part in enumerate(parts_idx):
-                if (np.sum(label == part) == 0) and (np.sum(pred == part) == 0):
-                    parts_iou[j] = 1.0
-                else:
-                    i = (label == part) & (pred == part)
-                    u = (label == part) | (pred == part)
-                    parts_iou[j] = np.sum(i) / (np.sum(u) + 1e-10)
+            # part absent from both label and prediction counts as iou 1
+            shape = metric.summary(metric.update(pred, label))
+            parts_iou = np.where(
+                shape["union"][parts_idx] == 0, 1.0, shape["iou_class"][parts_idx]
+            )
             iou_category[category_index] += parts_iou.mean()
             iou_count[category_index] += 1
 
@@ -23,6 +23,7 @@ from .defaults import create_ddp_model, worker_init_fn
 from .hooks import HookBase, build_hooks
 import pointcept.utils.comm as comm
 from pointcept.datasets import build_dataset, point_collate_fn, collate_fn
+from pointcept.datasets.dataloader import worker_kwargs, tune_dataloader
 from pointcept.models import build_model
 from pointcept.utils.logger import get_root_logger
 from pointcept.utils.optimizer import build_optimizer
@@ -235,8 +236,35 @@ class Trainer(TrainerBase):
         self.logger.info(f"Tensorboard writer logging dir: {self.cfg.save_path}")
         return writer
 
+    def tune_train_loader(self, train_data):
+        self.logger.info("=> Tuning train dataloader ...")
+        tune_cfg = dict(self.cfg.tune_dataloader)
+        if "num_workers" not in tune_cfg:
+            # powers of 2 up to the configured workers per gpu
+            max_workers = self.cfg.num_worker_per_gpu
+            num_workers = [2**i for i in range(max_workers.bit_length())]
+            tune_cfg["num_workers"] = sorted({*num_workers, max_workers})
+        setting, _ = tune_dataloader(
+            train_data,
+            self.cfg.batch_size_per_gpu,
+            mix_prob=self.cfg.mix_prob,
+            logger=self.logger,
+            **tune_cfg,
+        )
+        # ranks are benchmarked concurrently, as in training, and use the same setting
+        setting = comm.all_gather(setting)[0]
+        self.logger.info(
+            "Train dataloader: num_workers {num_workers} prefetch_factor "
+            "{prefetch_factor} pin_memory {pin_memory}".format(**setting)
+        )
+        self.cfg.num_worker_per_gpu = setting["num_workers"]
+        self.cfg.prefetch_factor = setting["prefetch_factor"]
+        self.cfg.pin_memory = setting["pin_memory"]
+
     def build_train_loader(self):
         train_data = build_dataset(self.cfg.data.train)
+        if self.cfg.tune_dataloader is not None:
+            self.tune_train_loader(train_data)
 
         if comm.get_world_size() > 1:
             train_sampler = torch.utils.data.distributed.DistributedSampler(train_data)
@@ -258,13 +286,12 @@ class Trainer(TrainerBase):
             train_data,
             batch_size=self.cfg.batch_size_per_gpu,
             shuffle=(train_sampler is None),
-            num_workers=self.cfg.num_worker_per_gpu,
             sampler=train_sampler,
             collate_fn=partial(point_collate_fn, mix_prob=self.cfg.mix_prob),
-            pin_memory=True,
+            pin_memory=self.cfg.pin_memory,
             worker_init_fn=init_fn,
             drop_last=True,
-            persistent_workers=True,
+            **worker_kwargs(self.cfg.num_worker_per_gpu, self.cfg.prefetch_factor),
         )
         return train_loader
 
@@ -307,12 +334,16 @@ class MultiDatasetTrainer(Trainer):
         from pointcept.datasets import MultiDatasetDataloader
 
         train_data = build_dataset(self.cfg.data.train)
+        if self.cfg.tune_dataloader is not None:
+            self.tune_train_loader(train_data)
         train_loader = MultiDatasetDataloader(
             train_data,
             self.cfg.batch_size_per_gpu,
             self.cfg.num_worker_per_gpu,
             self.cfg.mix_prob,
             self.cfg.seed,
+            prefetch_factor=self.cfg.prefetch_factor,
+            pin_memory=self.cfg.pin_memory,
         )
         self.comm_info["iter_per_epoch"] = len(train_loader)
         return train_loader
@@ -9,6 +9,7 @@ from functools import partial
 import torch
 import torch.nn as nn
 import torch.nn.functional as F
+import torch_scatter
 
 try:
     from pointgroup_ops import ballquery_batch_p, bfs_cluster
@@ -112,7 +113,7 @@ class PointGroup(nn.Module):
             )
 
             if mask.sum() == 0:
-                proposals_idx = torch.zeros(0).int()
+                proposals_idx = torch.zeros((0, 2)).int()
                 proposals_offset = torch.zeros(1).int()
             else:
                 center_pred_ = center_pred[mask]
@@ -137,38 +138,31 @@ class PointGroup(nn.Module):
                     mask.nonzero().view(-1)[proposals_idx[:, 1].long()].int()
                 )
 
-            # get proposal
-            proposals_pred = torch.zeros(
-                (proposals_offset.shape[0] - 1, center_pred.shape[0]), dtype=torch.int
-            )
-            proposals_pred[proposals_idx[:, 0].long(), proposals_idx[:, 1].long()] = 1
-            instance_pred = segment_pred[
-                proposals_idx[:, 1][proposals_offset[:-1].long()].long()
-            ]
-            proposals_point_num = proposals_pred.sum(1)
+            # get proposal, kept sparse as point index of each proposal (CSR)
+            proposals_idx = proposals_idx.to(logit_pred.device).long()
+            proposals_offset = proposals_offset.to(logit_pred.device).long()
+            instance_pred = segment_pred[proposals_idx[proposals_offset[:-1], 1]]
+            proposals_point_num = torch.diff(proposals_offset)
             proposals_mask = proposals_point_num > self.cluster_propose_points
-            proposals_pred = proposals_pred[proposals_mask]
+            proposals_idx = proposals_idx[proposals_mask[proposals_idx[:, 0]], 1]
+            proposals_point_num = proposals_point_num[proposals_mask]
+            proposals_offset = nn.functional.pad(
+                torch.cumsum(proposals_point_num, dim=0), (1, 0)
+            )
             instance_pred = instance_pred[proposals_mask]
 
-            pred_scores = []
-            pred_classes = []
-            pred_masks = proposals_pred.detach().cpu()
-            for proposal_id in range(len(proposals_pred)):
-                segment_ = proposals_pred[proposal_id]
-                confidence_ = logit_pred[
-                    segment_.bool(), instance_pred[proposal_id]
-                ].mean()
-                object_ = instance_pred[proposal_id]
-                pred_scores.append(confidence_)
-                pred_classes.append(object_)
-            if len(pred_scores) > 0:
-                pred_scores = torch.stack(pred_scores).cpu()
-                pred_classes = torch.stack(pred_classes).cpu()
-            else:
-                pred_scores = torch.tensor([])
-                pred_classes = torch.tensor([])
+            # confidence: mean probability of the proposal class over its points
+            pred_scores = torch_scatter.segment_csr(
+                logit_pred[
+                    proposals_idx,
+                    instance_pred.repeat_interleave(proposals_point_num),
+                ],
+                proposals_offset,
+                reduce="mean",
+            )
 
-            return_dict["pred_scores"] = pred_scores
-            return_dict["pred_masks"] = pred_masks
-            return_dict["pred_classes"] = pred_classes
+            return_dict["pred_scores"] = pred_scores.detach().cpu()
+            return_dict["pred_masks_idx"] = proposals_idx.cpu()
+            return_dict["pred_masks_offset"] = proposals_offset.cpu()
+            return_dict["pred_classes"] = instance_pred.cpu()
         return return_dict
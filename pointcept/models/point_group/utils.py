@@ -1,47 +1,5 @@
 import torch
-from torch.autograd import Function
-import pointgroup_ops
-
-
-class BallQueryBatchP(Function):
-    @staticmethod
-    def forward(ctx, coords, batch_idxs, batch_offsets, radius, meanActive):
-        """
-        :param ctx:
-        :param coords: (n, 3) float
-        :param batch_idxs: (n) int
-        :param batch_offsets: (B+1) int
-        :param radius: float
-        :param meanActive: int
-        :return: idx (nActive), int
-        :return: start_len (n, 2), int
-        """
-
-        n = coords.size(0)
-
-        assert coords.is_contiguous() and coords.is_cuda
-        assert batch_idxs.is_contiguous() and batch_idxs.is_cuda
-        assert batch_offsets.is_contiguous() and batch_offsets.is_cuda
-
-        while True:
-            idx = torch.cuda.IntTensor(n * meanActive).zero_()
-            start_len = torch.cuda.IntTensor(n, 2).zero_()
-            nActive = pointgroup_ops.ballquery_batch_p(
-                coords, batch_idxs, batch_offsets, idx, start_len, n, meanActive, radius
-            )
-            if nActive <= n * meanActive:
-                break
-            meanActive = int(nActive // n + 1)
-        idx = idx[:nActive]
-
-        return idx, start_len
-
-    @staticmethod
-    def backward(ctx, a=None, b=None):
-        return None, None, None
-
-
-ballquery_batch_p = BallQueryBatchP.apply
+from pointgroup_ops import ballquery_batch_p, bfs_cluster
 
 
 class Clustering:
@@ -72,19 +30,20 @@ class Clustering:
         # colors = np.array(create_color_palette())[labels.cpu()]
         # write_triangle_mesh(vertices, colors, None, 'semantics.ply')
 
-        # scatter
-        proposals_pred = torch.zeros(
-            (proposals_offset.shape[0] - 1, vertices.shape[0]), dtype=torch.int
-        )  # (nProposal, N), int, cuda
-        proposals_pred[proposals_idx[:, 0].long(), proposals_idx[:, 1].long()] = 1
-        labels = labels[proposals_idx[:, 1][proposals_offset[:-1].long()].long()]
+        # keep proposals sparse (CSR): point index of each proposal and offset
+        proposals_idx = proposals_idx.long()
+        proposals_offset = proposals_offset.long()
+        labels = labels[proposals_idx[proposals_offset[:-1], 1].to(labels.device)]
 
-        proposals_pointnum = proposals_pred.sum(1)
+        proposals_pointnum = torch.diff(proposals_offset)
         npoint_mask = proposals_pointnum > self.propose_points
 
-        proposals_pred = proposals_pred[npoint_mask]
-        labels = labels[npoint_mask]
-        return proposals_pred, labels
+        proposals_idx = proposals_idx[npoint_mask[proposals_idx[:, 0]], 1]
+        proposals_offset = torch.nn.functional.pad(
+            torch.cumsum(proposals_pointnum[npoint_mask], dim=0), (1, 0)
+        )
+        labels = labels[npoint_mask.to(labels.device)]
+        return proposals_idx, proposals_offset, labels
 
     def cluster_(self, vertices, labels):
         """
@@ -107,7 +66,9 @@ class Clustering:
             return torch.zeros((0, 2)).int(), torch.zeros(1).int()
 
         batch_idxs_ = batch_idxs[object_idxs].int()
-        batch_offsets_ = torch.FloatTensor([0, object_idxs.shape[0]]).int().cuda()
+        batch_offsets_ = torch.tensor(
+            [0, object_idxs.shape[0]], dtype=torch.int, device=vertices.device
+        )
 
         idx, start_len = ballquery_batch_p(
             vertices_, batch_idxs_, batch_offsets_, self.thresh, self.closed_points
@@ -120,57 +81,21 @@ class Clustering:
         return proposals_idx, proposals_offset
 
     def get_instances(self, vertices, scores):
-        proposals_pred, labels = self.cluster(vertices, scores)
+        # sparse instances: point indices of each proposal, scatter them where a
+        # dense mask is needed, i.e. mask = np.zeros(num_points); mask[point_idx] = 1
+        proposals_idx, proposals_offset, labels = self.cluster(vertices, scores)
+        proposals_idx = proposals_idx.to(scores.device)
         instances = {}
-        for proposal_id in range(len(proposals_pred)):
-            clusters_i = proposals_pred[proposal_id]
-            score = scores[clusters_i.bool(), labels[proposal_id]]
+        for proposal_id in range(len(labels)):
+            clusters_i = proposals_idx[
+                proposals_offset[proposal_id] : proposals_offset[proposal_id + 1]
+            ]
+            score = scores[clusters_i, labels[proposal_id]]
             score = self.score_func(score)
             instances[proposal_id] = {}
             instances[proposal_id]["conf"] = score.cpu().numpy()
             instances[proposal_id]["label_id"] = self.class_mapping.cpu()[
                 labels[proposal_id]
             ]
-            instances[proposal_id]["pred_mask"] = clusters_i.cpu().numpy()
+            instances[proposal_id]["point_idx"] = clusters_i.cpu().numpy()
         return instances
-
-
-class BFSCluster(Function):
-    @staticmethod
-    def forward(ctx, semantic_label, ball_query_idxs, start_len, threshold):
-        """
-        :param ctx:
-        :param semantic_label: (N), int
-        :param ball_query_idxs: (nActive), int
-        :param start_len: (N, 2), int
-        :return: cluster_idxs:  int (sumNPoint, 2), dim 0 for cluster_id, dim 1 for corresponding point idxs in N
-        :return: cluster_offsets: int (nCluster + 1)
-        """
-
-        N = start_len.size(0)
-
-        assert semantic_label.is_contiguous()
-        assert ball_query_idxs.is_contiguous()
-        assert start_len.is_contiguous()
-
-        cluster_idxs = semantic_label.new()
-        cluster_offsets = semantic_label.new()
-
-        pointgroup_ops.bfs_cluster(
-            semantic_label,
-            ball_query_idxs,
-            start_len,
-            cluster_idxs,
-            cluster_offsets,
-            N,
-            threshold,
-        )
-
-        return cluster_idxs, cluster_offsets
-
-    @staticmethod
-    def backward(ctx, a=None):
-        return None
-
-
-bfs_cluster = BFSCluster.apply
@@ -15,9 +15,18 @@ from pointcept.models.builder import MODELS
 
 
 class PointTransformerCls(nn.Module):
-    def __init__(self, block, blocks, in_channels=6, num_classes=40):
+    def __init__(
+        self,
+        block,
+        blocks,
+        in_channels=6,
+        num_classes=40,
+        sampling="fps",
+        bucket_size=512,
+    ):
         super().__init__()
         self.in_channels = in_channels
+        self.sampling, self.bucket_size = sampling, bucket_size
         self.in_planes, planes = in_channels, [32, 64, 128, 256, 512]
         fpn_planes, fpnhead_planes, share_planes = 128, 64, 8
         stride, nsample = [1, 4, 4, 4, 4], [8, 16, 16, 16, 16]
@@ -75,7 +84,14 @@ class PointTransformerCls(nn.Module):
 
     def _make_enc(self, block, planes, blocks, share_planes=8, stride=1, nsample=16):
         layers = [
-            TransitionDown(self.in_planes, planes * block.expansion, stride, nsample)
+            TransitionDown(
+                self.in_planes,
+                planes * block.expansion,
+                stride,
+                nsample,
+                sampling=self.sampling,
+                bucket_size=self.bucket_size,
+            )
         ]
         self.in_planes = planes * block.expansion
         for _ in range(1, blocks):
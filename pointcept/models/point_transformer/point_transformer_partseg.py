@@ -79,9 +79,22 @@ class PointTransformerLayer(nn.Module):
 
 
 class TransitionDown(nn.Module):
-    def __init__(self, in_planes, out_planes, stride=1, nsample=16):
+    def __init__(
+        self,
+        in_planes,
+        out_planes,
+        stride=1,
+        nsample=16,
+        sampling="fps",
+        bucket_size=512,
+    ):
         super().__init__()
         self.stride, self.nsample = stride, nsample
+        # "fps": exact farthest point sampling,
+        # "bucket_fps": approximate FPS within spatial buckets of ~bucket_size points
+        assert sampling in ["fps", "bucket_fps"]
+        self.sampling = sampling
+        self.bucket_size = bucket_size
         if stride != 1:
             self.linear = nn.Linear(3 + in_planes, out_planes, bias=False)
             self.pool = nn.MaxPool1d(nsample)
@@ -93,12 +106,14 @@ class TransitionDown(nn.Module):
     def forward(self, pxo):
         p, x, o = pxo  # (n, 3), (n, c), (b)
         if self.stride != 1:
-            n_o, count = [o[0].item() // self.stride], o[0].item() // self.stride
-            for i in range(1, o.shape[0]):
-                count += (o[i].item() - o[i - 1].item()) // self.stride
-                n_o.append(count)
-            n_o = torch.cuda.IntTensor(n_o)
-            idx = pointops.farthest_point_sampling(p, o, n_o)  # (m)
+            count = torch.diff(o, prepend=o.new_zeros(1))
+            n_o = torch.cumsum(count // self.stride, dim=0).int()
+            if self.sampling == "bucket_fps":
+                idx = pointops.bucket_farthest_point_sampling(
+                    p, o, n_o, self.bucket_size
+                )  # (m)
+            else:
+                idx = pointops.farthest_point_sampling(p, o, n_o)  # (m)
             n_p = p[idx.long(), :]  # (m, 3)
             x, _ = pointops.knn_query_and_group(
                 x,
@@ -215,10 +230,18 @@ class Bottleneck(nn.Module):
 
 class PointTransformerSeg(nn.Module):
     def __init__(
-        self, block, blocks, in_channels=6, num_classes=50, num_shape_classes=None
+        self,
+        block,
+        blocks,
+        in_channels=6,
+        num_classes=50,
+        num_shape_classes=None,
+        sampling="fps",
+        bucket_size=512,
     ):
         super().__init__()
         self.in_channels = in_channels
+        self.sampling, self.bucket_size = sampling, bucket_size
         self.num_classes = num_classes
         self.num_shape_classes = num_shape_classes
         self.in_planes, planes = in_channels, [32, 64, 128, 256, 512]
@@ -294,7 +317,14 @@ class PointTransformerSeg(nn.Module):
 
     def _make_enc(self, block, planes, blocks, share_planes=8, stride=1, nsample=16):
         layers = [
-            TransitionDown(self.in_planes, planes * block.expansion, stride, nsample)
+            TransitionDown(
+                self.in_planes,
+                planes * block.expansion,
+                stride,
+                nsample,
+                sampling=self.sampling,
+                bucket_size=self.bucket_size,
+            )
         ]
         self.in_planes = planes * block.expansion
         for _ in range(blocks):
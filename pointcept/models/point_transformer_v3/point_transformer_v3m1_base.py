@@ -23,6 +23,12 @@ from pointcept.models.point_prompt_training import PDNorm
 from pointcept.models.builder import MODELS
 from pointcept.models.utils.misc import offset2bincount
 from pointcept.models.utils.structure import Point
+from pointcept.models.utils.serialization import (
+    shift_code,
+    unique_code,
+    pool_order,
+    SerializationCache,
+)
 from pointcept.models.modules import PointModule, PointSequential
 
 
@@ -48,6 +54,20 @@ class RPE(torch.nn.Module):
         return out
 
 
+def segment_arange(start, count, size, step=1):
+    """
+    Concat torch.arange(start[i], start[i] + count[i] * step, step) of all segments,
+    size is the sum of count. Built with a cumsum, without syncing count to host.
+    """
+    seg_start = torch.cumsum(count, dim=0) - count
+    delta = start - step * seg_start
+    delta[1:] -= delta[:-1].clone()
+    index = torch.full((size + 1,), step, dtype=torch.long, device=start.device)
+    index[0] = 0
+    index.index_add_(0, seg_start, delta)
+    return torch.cumsum(index, dim=0, out=index)[:size]
+
+
 class SerializedAttention(PointModule):
     def __init__(
         self,
@@ -113,67 +133,55 @@ class SerializedAttention(PointModule):
 
     @torch.no_grad()
     def get_padding_and_inverse(self, point):
-        pad_key = "pad"
-        unpad_key = "unpad"
-        cu_seqlens_key = "cu_seqlens_key"
+        # the plan only depends on offset and patch size, blocks of a stage share it
+        pad_key = f"pad_{self.patch_size}"
+        unpad_key = f"unpad_{self.patch_size}"
+        cu_seqlens_key = f"cu_seqlens_{self.patch_size}"
         if (
             pad_key not in point.keys()
             or unpad_key not in point.keys()
             or cu_seqlens_key not in point.keys()
         ):
+            K = self.patch_size
             offset = point.offset
+            num_points = point.feat.shape[0]
             bincount = offset2bincount(offset)
-            bincount_pad = (
-                torch.div(
-                    bincount + self.patch_size - 1,
-                    self.patch_size,
-                    rounding_mode="trunc",
-                )
-                * self.patch_size
-            )
+            bincount_pad = torch.div(bincount + K - 1, K, rounding_mode="trunc") * K
             # only pad point when num of points larger than patch_size
-            mask_pad = bincount > self.patch_size
+            mask_pad = bincount > K
             bincount_pad = ~mask_pad * bincount + mask_pad * bincount_pad
-            _offset = nn.functional.pad(offset, (1, 0))
-            _offset_pad = nn.functional.pad(torch.cumsum(bincount_pad, dim=0), (1, 0))
-            pad = torch.arange(_offset_pad[-1], device=offset.device)
-            unpad = torch.arange(_offset[-1], device=offset.device)
-            cu_seqlens = []
-            for i in range(len(offset)):
-                unpad[_offset[i] : _offset[i + 1]] += _offset_pad[i] - _offset[i]
-                if bincount[i] != bincount_pad[i]:
-                    pad[
-                        _offset_pad[i + 1]
-                        - self.patch_size
-                        + (bincount[i] % self.patch_size) : _offset_pad[i + 1]
-                    ] = pad[
-                        _offset_pad[i + 1]
-                        - 2 * self.patch_size
-                        + (bincount[i] % self.patch_size) : _offset_pad[i + 1]
-                        - self.patch_size
-                    ]
-                pad[_offset_pad[i] : _offset_pad[i + 1]] -= _offset_pad[i] - _offset[i]
-                cu_seqlens.append(
-                    torch.arange(
-                        _offset_pad[i],
-                        _offset_pad[i + 1],
-                        step=self.patch_size,
-                        dtype=torch.int32,
-                        device=offset.device,
-                    )
-                )
+            num_patch = torch.div(bincount_pad + K - 1, K, rounding_mode="trunc")
+            offset_pad = torch.cumsum(bincount_pad, dim=0)
+            # the only host sync: num of padded points and num of patches
+            num_points_pad, num_patches = torch.stack(
+                [offset_pad[-1], num_patch.sum()]
+            ).tolist()
+            _offset = offset - bincount
+            _offset_pad = offset_pad - bincount_pad
+            # unpad: point -> padded point
+            unpad = segment_arange(_offset_pad, bincount, num_points)
+            # pad: padded point -> point, padding at the tail of a batch repeats
+            # the points of the previous patch
+            pad = segment_arange(
+                torch.stack([_offset, _offset + bincount - K], dim=1).flatten(),
+                torch.stack([bincount, bincount_pad - bincount], dim=1).flatten(),
+                num_points_pad,
+            )
+            # cu_seqlens: start of each patch, ends with num of padded points
+            cu_seqlens = segment_arange(_offset_pad, num_patch, num_patches, step=K)
+            cu_seqlens = torch.cat([cu_seqlens, offset_pad[-1:]]).int()
+
             point[pad_key] = pad
             point[unpad_key] = unpad
-            point[cu_seqlens_key] = nn.functional.pad(
-                torch.concat(cu_seqlens), (0, 1), value=_offset_pad[-1]
-            )
+            point[cu_seqlens_key] = cu_seqlens
         return point[pad_key], point[unpad_key], point[cu_seqlens_key]
 
     def forward(self, point):
         if not self.enable_flash:
-            self.patch_size = min(
-                offset2bincount(point.offset).min().tolist(), self.patch_size_max
-            )
+            # min batch size is synced once per point and shared by the blocks
+            if "bincount_min" not in point.keys():
+                point["bincount_min"] = offset2bincount(point.offset).min().tolist()
+            self.patch_size = min(point["bincount_min"], self.patch_size_max)
 
         H = self.num_heads
         K = self.patch_size
@@ -381,13 +389,10 @@ class SerializedPooling(PointModule):
             point.keys()
         ), "Run point.serialization() point cloud before SerializedPooling"
 
-        code = point.serialized_code >> pooling_depth * 3
-        code_, cluster, counts = torch.unique(
-            code[0],
-            sorted=True,
-            return_inverse=True,
-            return_counts=True,
-        )
+        # code >> pooling_depth * 3 (code might be split as two words for deep grid)
+        code = shift_code(point.serialized_code, pooling_depth)
+        # unique code, cluster and counts, taking the sorted order of the code
+        code_, cluster, counts = unique_code(code[0], point.serialized_order[0])
         # indices of point sorted by cluster, for torch_scatter.segment_csr
         _, indices = torch.sort(cluster)
         # index pointer for sorted point, for torch_scatter.segment_csr
@@ -395,14 +400,13 @@ class SerializedPooling(PointModule):
         # head_indices of each cluster, for reduce attr e.g. code, batch
         head_indices = indices[idx_ptr[:-1]]
         # generate down code, order, inverse
+        # (pooled code keep the order of point, no need to sort again)
         code = code[:, head_indices]
-        order = torch.argsort(code)
-        inverse = torch.zeros_like(order).scatter_(
+        order = pool_order(point.serialized_order, cluster)
+        inverse = torch.empty_like(order).scatter_(
             dim=1,
             index=order,
-            src=torch.arange(0, code.shape[1], device=order.device).repeat(
-                code.shape[0], 1
-            ),
+            src=torch.arange(0, code.shape[1], device=order.device).expand_as(order),
         )
 
         if self.shuffle_orders:
@@ -549,12 +553,17 @@ class PointTransformerV3(PointModule):
         pdnorm_adaptive=False,
         pdnorm_affine=True,
         pdnorm_conditions=("ScanNet", "S3DIS", "Structured3D"),
+        serialization_cache=0,
     ):
         super().__init__()
         self.num_stages = len(enc_depths)
         self.order = [order] if isinstance(order, str) else order
         self.cls_mode = cls_mode
         self.shuffle_orders = shuffle_orders
+        # reuse serialization of repeated grid_coord (e.g. test time augmentation)
+        self.serialization_cache = (
+            SerializationCache(serialization_cache) if serialization_cache > 0 else None
+        )
 
         assert self.num_stages == len(stride) + 1
         assert self.num_stages == len(enc_depths)
@@ -698,7 +707,11 @@ class PointTransformerV3(PointModule):
 
     def forward(self, data_dict):
         point = Point(data_dict)
-        point.serialization(order=self.order, shuffle_orders=self.shuffle_orders)
+        point.serialization(
+            order=self.order,
+            shuffle_orders=self.shuffle_orders,
+            cache=self.serialization_cache,
+        )
         point.sparsify()
 
         point = self.embedding(point)
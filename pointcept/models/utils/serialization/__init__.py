@@ -1,6 +1,12 @@
 from .default import (
     encode,
     decode,
+    encode_orders,
+    sort_code,
+    shift_code,
+    unique_code,
+    pool_order,
+    SerializationCache,
     z_order_encode,
     z_order_decode,
     hilbert_encode,
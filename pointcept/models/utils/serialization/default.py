@@ -1,9 +1,18 @@
 import torch
+from collections import OrderedDict
 from .z_order import xyz2key as z_order_encode_
 from .z_order import key2xyz as z_order_decode_
-from .hilbert import encode as hilbert_encode_
 from .hilbert import decode as hilbert_decode_
 
+# bits of x, y, z in an interleaved (z-order or transposed hilbert) key
+Z_MASK = 0x1249249249249249
+Y_MASK = Z_MASK << 1
+X_MASK = Z_MASK << 2
+# codes deeper than SPLIT_DEPTH (or with too many batches for 63 bits) are handled as
+# two int64 words: code >> 48 and code & LOW_MASK, i.e. the last SPLIT_DEPTH levels
+SPLIT_DEPTH = 16
+LOW_MASK = (1 << SPLIT_DEPTH * 3) - 1
+
 
 @torch.inference_mode()
 def encode(grid_coord, batch=None, depth=16, order="z"):
@@ -24,6 +33,196 @@ def encode(grid_coord, batch=None, depth=16, order="z"):
     return code
 
 
+@torch.inference_mode()
+def encode_orders(grid_coord, batch=None, depth=16, orders=("z",), split=False):
+    """
+    Serialization codes (k, n) of all orders in one pass, same as stacking encode of
+    each order. A "-trans" order encodes the same bits with x and y swapped, so z-trans
+    is a bit swap of the z code and both hilbert orders are encoded as one batch.
+
+    Depth up to 2 * SPLIT_DEPTH is supported by encoding the levels as two words.
+    If split, return split codes (k, n, 2) as [code >> 48, code & LOW_MASK] (compare
+    lexicographically), which hold codes longer than 63 bits (deep or large batch).
+    """
+    assert set(orders).issubset({"z", "z-trans", "hilbert", "hilbert-trans"})
+    assert depth <= SPLIT_DEPTH * 2
+    code = {}
+    if "z" in orders or "z-trans" in orders:
+        code["z"] = interleave(*grid_coord.long().unbind(1), depth=depth)
+        code["z-trans"] = [swap_xy(word) for word in code["z"]]
+    if "hilbert" in orders or "hilbert-trans" in orders:
+        hilbert_orders = [order for order in orders if order.startswith("hilbert")]
+        hilbert_coord = [
+            grid_coord[:, [1, 0, 2]] if order == "hilbert-trans" else grid_coord
+            for order in hilbert_orders
+        ]
+        x = hilbert_transpose(torch.cat(hilbert_coord), depth=depth)
+        hilbert_code = [
+            word.split(len(grid_coord)) for word in interleave(*x, depth=depth)
+        ]
+        code.update(zip(hilbert_orders, zip(*hilbert_code)))
+    high = torch.stack([code[order][0] for order in orders])
+    low = torch.stack([code[order][1] for order in orders])
+    if batch is not None:
+        # batch << depth * 3 | code
+        batch = batch.long()
+        shift = depth * 3 - SPLIT_DEPTH * 3
+        high |= batch << shift if shift >= 0 else batch >> -shift
+        if shift < 0:
+            low |= batch << depth * 3 & LOW_MASK
+    if split:
+        return torch.stack([high, low], dim=-1)
+    # caller makes sure depth * 3 + bit length of batch <= 63
+    return high << SPLIT_DEPTH * 3 | low
+
+
+def interleave(x, y, z, depth=16):
+    """
+    Interleave bits of coordinates as z-order with LUT of z_order.xyz2key, return
+    (high, low) words, the low word holds the last SPLIT_DEPTH levels.
+    """
+    if depth <= SPLIT_DEPTH:
+        low = z_order_encode_(x, y, z, b=None, depth=depth)
+        return torch.zeros_like(low), low
+    mask = (1 << SPLIT_DEPTH) - 1
+    low = z_order_encode_(x & mask, y & mask, z & mask, b=None, depth=SPLIT_DEPTH)
+    x, y, z = x >> SPLIT_DEPTH, y >> SPLIT_DEPTH, z >> SPLIT_DEPTH
+    high = z_order_encode_(x, y, z, b=None, depth=depth - SPLIT_DEPTH)
+    return high, low
+
+
+@torch.inference_mode()
+def shift_code(code, depth):
+    """
+    code >> depth * 3 for code (k, n) or split code (k, n, 2).
+    """
+    if code.dim() == 2:
+        return code >> depth * 3
+    bits = depth * 3
+    assert bits <= SPLIT_DEPTH * 3
+    high, low = code.unbind(-1)
+    low = low >> bits | (high & ((1 << bits) - 1)) << (SPLIT_DEPTH * 3 - bits)
+    return torch.stack([high >> bits, low], dim=-1)
+
+
+@torch.inference_mode()
+def sort_code(code, bit_length=63):
+    """
+    Order and inverse of serialization codes (k, n) with codes less than
+    2 ** bit_length. Codes fit in 31 bits are sorted as int32, as sorting (radix sort
+    on CUDA) runs over the width of the key. Split codes (k, n, 2) are sorted by low
+    word then stably by high word (lexicographic).
+    """
+    if code.dim() == 3:
+        high, low = code.unbind(-1)
+        if bit_length - SPLIT_DEPTH * 3 <= 31:
+            high = high.int()
+        order = torch.stack([torch.sort(low_, stable=True)[1] for low_ in low])
+        order = torch.gather(
+            order,
+            1,
+            torch.stack(
+                [
+                    torch.sort(high_[order_], stable=True)[1]
+                    for high_, order_ in zip(high, order)
+                ]
+            ),
+        )
+    else:
+        if bit_length <= 31:
+            code = code.int()
+        order = torch.stack([torch.sort(code_, stable=True)[1] for code_ in code])
+    inverse = torch.empty_like(order).scatter_(
+        dim=1,
+        index=order,
+        src=torch.arange(0, code.shape[1], device=order.device).expand_as(order),
+    )
+    return order, inverse
+
+
+@torch.inference_mode()
+def unique_code(code, order):
+    """
+    Same as torch.unique(code, sorted=True, return_inverse=True, return_counts=True)
+    for code (n,) or split code (n, 2) of an order, using its order instead of sorting.
+    """
+    code = code[order]
+    head = torch.ones(len(code), dtype=torch.bool, device=code.device)
+    if code.dim() == 2:
+        head[1:] = (code[1:] != code[:-1]).any(dim=-1)
+    else:
+        head[1:] = code[1:] != code[:-1]
+    cluster = torch.empty_like(order).scatter_(0, order, torch.cumsum(head, 0) - 1)
+    head_indices = torch.nonzero(head)[:, 0]
+    counts = torch.diff(head_indices, append=head_indices.new_tensor([len(code)]))
+    return code[head_indices], cluster, counts
+
+
+@torch.inference_mode()
+def pool_order(order, cluster):
+    """
+    Order (k, m) of clusters from order (k, n) of points, where a cluster contains
+    points with the same code prefix (code >> pooling_depth * 3), i.e. pooled codes
+    are already sorted along the order of points. Same as sorting pooled code.
+    """
+    cluster = cluster[order]
+    head = torch.ones_like(cluster, dtype=torch.bool)
+    head[:, 1:] = cluster[:, 1:] != cluster[:, :-1]
+    return cluster[head].reshape(order.shape[0], -1)
+
+
+class SerializationCache:
+    """
+    LRU cache of serialization code, order and inverse keyed on grid_coord, batch,
+    depth and orders, for test time augmentation where the same voxelization is
+    serialized many times. Entry is verified against the stored grid_coord and batch.
+    """
+
+    def __init__(self, size=8):
+        self.size = size
+        self.cache = OrderedDict()
+
+    @staticmethod
+    def fingerprint(grid_coord, batch, depth, orders):
+        grid_coord = grid_coord.long()
+        checksum = torch.cat(
+            [grid_coord.sum(0), (grid_coord[:, [1, 2, 0]] * grid_coord).sum(0)]
+        )
+        if batch is not None:
+            checksum = torch.cat(
+                [checksum, (batch.long() * grid_coord[:, 0]).sum(0, True)]
+            )
+        return (tuple(grid_coord.shape), depth, tuple(orders)) + tuple(
+            checksum.tolist()
+        )
+
+    def get(self, grid_coord, batch, depth, orders):
+        key = self.fingerprint(grid_coord, batch, depth, orders)
+        if key not in self.cache:
+            return None
+        grid_coord_, batch_, value = self.cache[key]
+        if not torch.equal(grid_coord_, grid_coord) or (
+            batch is not None and not torch.equal(batch_, batch)
+        ):
+            return None
+        self.cache.move_to_end(key)
+        return value
+
+    def put(self, grid_coord, batch, depth, orders, value):
+        key = self.fingerprint(grid_coord, batch, depth, orders)
+        self.cache[key] = (
+            grid_coord.clone(),
+            batch.clone() if batch is not None else None,
+            value,
+        )
+        self.cache.move_to_end(key)
+        while len(self.cache) > self.size:
+            self.cache.popitem(last=False)
+
+    def clear(self):
+        self.cache.clear()
+
+
 @torch.inference_mode()
 def decode(code, depth=16, order="z"):
     assert order in {"z", "hilbert"}
@@ -51,8 +250,45 @@ def z_order_decode(code: torch.Tensor, depth):
     return grid_coord
 
 
+def swap_xy(code: torch.Tensor):
+    # swap x and y bits of an interleaved key, i.e. encode grid_coord[:, [1, 0, 2]]
+    return (code & X_MASK) >> 1 | (code & Y_MASK) << 1 | code & Z_MASK
+
+
 def hilbert_encode(grid_coord: torch.Tensor, depth: int = 16):
-    return hilbert_encode_(grid_coord, num_dims=3, num_bits=depth)
+    # Skilling's transform on integer coordinates then interleaved as z-order,
+    # same result as hilbert.encode working on arrays of bits but much faster
+    assert depth <= SPLIT_DEPTH
+    x = hilbert_transpose(grid_coord, depth=depth)
+    return z_order_encode_(x[0], x[1], x[2], b=None, depth=depth)
+
+
+def hilbert_transpose(grid_coord: torch.Tensor, depth: int = 16):
+    """
+    Hilbert index in transposed form (Skilling, 2004): 3 coordinates whose
+    interleaved bits are the hilbert code, any depth fit in int64.
+    """
+    x = [grid_coord[:, i].long() for i in range(3)]
+    # inverse undo excess work
+    q = 1 << max(depth - 1, 0)
+    while q > 1:
+        p = q - 1
+        x[0] = torch.where(x[0] & q != 0, x[0] ^ p, x[0])
+        for i in range(1, 3):
+            mask = x[i] & q != 0
+            t = (x[0] ^ x[i]) & p
+            x[0] = torch.where(mask, x[0] ^ p, x[0] ^ t)
+            x[i] = torch.where(mask, x[i], x[i] ^ t)
+        q >>= 1
+    # gray encode
+    x[1] = x[1] ^ x[0]
+    x[2] = x[2] ^ x[1]
+    t = torch.zeros_like(x[2])
+    q = 1 << max(depth - 1, 0)
+    while q > 1:
+        t = torch.where(x[2] & q != 0, t ^ (q - 1), t)
+        q >>= 1
+    return [x[0] ^ t, x[1] ^ t, x[2] ^ t]
 
 
 def hilbert_decode(code: torch.Tensor, depth: int = 16):
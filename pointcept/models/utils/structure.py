@@ -7,7 +7,7 @@ except ImportError:
     ocnn = None
 from addict import Dict
 
-from pointcept.models.utils.serialization import encode, decode
+from pointcept.models.utils.serialization import encode_orders, sort_code, decode
 from pointcept.models.utils import offset2batch, batch2offset
 
 
@@ -44,11 +44,13 @@ class Point(Dict):
         elif "offset" not in self.keys() and "batch" in self.keys():
             self["offset"] = batch2offset(self.batch)
 
-    def serialization(self, order="z", depth=None, shuffle_orders=False):
+    def serialization(self, order="z", depth=None, shuffle_orders=False, cache=None):
         """
         Point Cloud Serialization
 
         relay on ["grid_coord" or "coord" + "grid_size", "batch", "feat"]
+        cache: optional SerializationCache reusing code, order and inverse of a
+            grid_coord seen before (e.g. test time augmentation)
         """
         assert "batch" in self.keys()
         if "grid_coord" not in self.keys():
@@ -65,31 +67,30 @@ class Point(Dict):
             # Adaptive measure the depth of serialization cube (length = 2 ^ depth)
             depth = int(self.grid_coord.max()).bit_length()
         self["serialized_depth"] = depth
-        # Maximum bit length for serialization code is 63 (int64)
-        assert depth * 3 + len(self.offset).bit_length() <= 63
-        # Here we follow OCNN and set the depth limitation to 16 (48bit) for the point position.
-        # Although depth is limited to less than 16, we can encode a 655.36^3 (2^16 * 0.01) meter^3
-        # cube with a grid size of 0.01 meter. We consider it is enough for the current stage.
-        # We can unlock the limitation by optimizing the z-order encoding function if necessary.
-        assert depth <= 16
+        # Serialization code is (batch << depth * 3 | code of grid_coord), which is kept
+        # as int64 if it fits in 63 bits, otherwise split into two int64 words (.., 2)
+        # compared lexicographically (see encode_orders). Depth is limited to 32, i.e. a
+        # 42949.67^3 (2^32 * 0.01 / 1000) km^3 cube with a grid size of 0.01 meter.
+        assert depth <= 32
+        bit_length = depth * 3 + len(self.offset).bit_length()
 
         # The serialization codes are arranged as following structures:
         # [Order1 ([n]),
         #  Order2 ([n]),
         #   ...
         #  OrderN ([n])] (k, n)
-        code = [
-            encode(self.grid_coord, self.batch, depth, order=order_) for order_ in order
-        ]
-        code = torch.stack(code)
-        order = torch.argsort(code)
-        inverse = torch.zeros_like(order).scatter_(
-            dim=1,
-            index=order,
-            src=torch.arange(0, code.shape[1], device=order.device).repeat(
-                code.shape[0], 1
-            ),
-        )
+        order = [order] if isinstance(order, str) else list(order)
+        serialized = None
+        if cache is not None:
+            serialized = cache.get(self.grid_coord, self.batch, depth, order)
+        if serialized is None:
+            code = encode_orders(
+                self.grid_coord, self.batch, depth, orders=order, split=bit_length > 63
+            )
+            serialized = (code,) + sort_code(code, bit_length=bit_length)
+            if cache is not None:
+                cache.put(self.grid_coord, self.batch, depth, order, serialized)
+        code, order, inverse = serialized
 
         if shuffle_orders:
             perm = torch.randperm(code.shape[0])
@@ -6,6 +6,13 @@ Please cite our work if the code is helpful to you.
 """
 
 import os
+import atexit
+import contextlib
+import fcntl
+import shutil
+import tempfile
+import multiprocessing as mp
+from collections import OrderedDict
 import SharedArray
 
 try:
@@ -54,3 +61,307 @@ def shared_dict(name, var=None):
         for key in keys:
             data[key] = shared_array(name=f"{name}.{key}")
     return data
+
+
+def parse_bytes(size):
+    """
+    Parse a byte budget, e.g. 1024, "512M", "8G", "1.5T".
+    """
+    if isinstance(size, (int, float)):
+        return int(size)
+    size = str(size).strip().upper().rstrip("B")
+    units = dict(K=1024, M=1024**2, G=1024**3, T=1024**4)
+    if size and size[-1] in units:
+        return int(float(size[:-1]) * units[size[-1]])
+    return int(size)
+
+
+class SceneCache:
+    """
+    Bounded scene cache with byte-budget eviction.
+
+    Backends:
+        "shm": entries are npy files in /dev/shm, shared by all processes of the node;
+        "mmap": same layout on a local disk (e.g. SSD) given by `root`;
+        "memory": in-process dict, each dataloader worker owns a separate budget.
+    Shared backends are reference counted: every process building a cache registers
+    itself in the namespace, the namespace is removed when the last one exits, and
+    namespaces left by crashed processes are swept on the next start. Entries are
+    written to .tmp outside the namespace lock, which is held only to rename them in
+    place and update the running byte usage kept in .usage.
+    Hit / miss / eviction counters are shared with dataloader workers.
+    """
+
+    BACKENDS = ("shm", "mmap", "memory")
+    POLICIES = ("lru", "lfu")
+
+    def __init__(
+        self,
+        namespace="default",
+        backend="shm",
+        budget="8G",
+        policy="lru",
+        root=None,
+    ):
+        assert backend in self.BACKENDS
+        assert policy in self.POLICIES
+        self.namespace = str(namespace)
+        self.backend = backend
+        self.budget = parse_bytes(budget)
+        self.policy = policy
+        # [hit, miss, eviction], shared with dataloader workers
+        self.counter = mp.Array("q", 3)
+
+        if backend == "memory":
+            self.root = None
+            self.path = None
+            self._entries = OrderedDict()
+            self._frequency = dict()
+            self._usage = 0
+        else:
+            if root is None:
+                root = "/dev/shm" if backend == "shm" else tempfile.gettempdir()
+            self.root = os.path.join(root, "pointcept-cache")
+            self.path = os.path.join(self.root, self.namespace)
+            os.makedirs(self.root, exist_ok=True)
+            self.sweep(self.root)
+            os.makedirs(os.path.join(self.path, ".refs"), exist_ok=True)
+            with self._lock(self.path):
+                os.makedirs(os.path.join(self.path, ".refs"), exist_ok=True)
+                os.makedirs(os.path.join(self.path, ".tmp"), exist_ok=True)
+                open(self._ref_path(), "w").close()
+                if not os.path.exists(self._usage_path()):
+                    self._write_usage(self._scan_usage())
+            self._owner = os.getpid()
+            atexit.register(self.release)
+
+    @staticmethod
+    def _alive(pid):
+        try:
+            os.kill(pid, 0)
+        except ProcessLookupError:
+            return False
+        except PermissionError:
+            pass
+        return True
+
+    @classmethod
+    def sweep(cls, root):
+        """
+        Remove dead references and namespaces without any live reference.
+        """
+        for namespace in os.listdir(root):
+            path = os.path.join(root, namespace)
+            if not os.path.isdir(os.path.join(path, ".refs")):
+                continue
+            with contextlib.suppress(FileNotFoundError), cls._lock(path):
+                alive = False
+                for ref in os.listdir(os.path.join(path, ".refs")):
+                    if ref.isdigit() and cls._alive(int(ref)):
+                        alive = True
+                    else:
+                        os.remove(os.path.join(path, ".refs", ref))
+                if not alive:
+                    shutil.rmtree(path, ignore_errors=True)
+
+    def _ref_path(self, pid=None):
+        return os.path.join(self.path, ".refs", str(pid or os.getpid()))
+
+    @staticmethod
+    @contextlib.contextmanager
+    def _lock(path):
+        with open(os.path.join(path, ".lock"), "a") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def release(self):
+        if self.path is None or os.getpid() != self._owner:
+            return
+        with contextlib.suppress(FileNotFoundError), self._lock(self.path):
+            os.remove(self._ref_path())
+            if not os.listdir(os.path.join(self.path, ".refs")):
+                shutil.rmtree(self.path, ignore_errors=True)
+        self.path = None
+
+    def _entry_path(self, key):
+        return os.path.join(self.path, str(key).replace(os.path.sep, "-"))
+
+    def _usage_path(self):
+        return os.path.join(self.path, ".usage")
+
+    def _read_usage(self):
+        with open(self._usage_path(), "rb") as f:
+            return int.from_bytes(f.read(8), "little")
+
+    def _write_usage(self, usage):
+        # fixed size counter rewritten in place, updated under the namespace lock
+        fd = os.open(self._usage_path(), os.O_RDWR | os.O_CREAT)
+        try:
+            os.pwrite(fd, max(usage, 0).to_bytes(8, "little"), 0)
+        finally:
+            os.close(fd)
+
+    @staticmethod
+    def _entry_size(entry_path):
+        return sum(file.stat().st_size for file in os.scandir(entry_path))
+
+    def _scan_usage(self):
+        usage = 0
+        with os.scandir(self.path) as it:
+            for entry in it:
+                if not entry.name.startswith(".") and entry.is_dir():
+                    with contextlib.suppress(FileNotFoundError):
+                        usage += self._entry_size(entry.path)
+        return usage
+
+    def get(self, key):
+        """
+        Return the cached dict of numpy arrays, or None if missing. Arrays from
+        shared backends are copy-on-write maps, in-place modification stays private.
+        """
+        data = self._get(key)
+        with self.counter.get_lock():
+            self.counter[0 if data is not None else 1] += 1
+        return data
+
+    def _get(self, key):
+        if self.backend == "memory":
+            if key not in self._entries:
+                return None
+            self._entries.move_to_end(key)
+            self._frequency[key] += 1
+            return {k: v.copy() for k, v in self._entries[key].items()}
+
+        entry_path = self._entry_path(key)
+        try:
+            self._touch(entry_path)
+            data = {}
+            for file in os.listdir(entry_path):
+                if file.endswith(".npy"):
+                    data[file[:-4]] = np.load(
+                        os.path.join(entry_path, file), mmap_mode="c"
+                    )
+        except (FileNotFoundError, ValueError):
+            # missing or evicted by another process while reading
+            return None
+        return data
+
+    def _touch(self, entry_path):
+        # .hits: access time (mtime, lru) and hit count (fixed size counter, lfu)
+        hits_path = os.path.join(entry_path, ".hits")
+        if self.policy == "lru":
+            os.utime(hits_path)
+            return
+        # rewritten in place, concurrent hits may be lost, which only skews lfu order
+        fd = os.open(hits_path, os.O_RDWR)
+        try:
+            hits = int.from_bytes(os.pread(fd, 8, 0), "little")
+            os.pwrite(fd, (hits + 1).to_bytes(8, "little"), 0)
+        finally:
+            os.close(fd)
+
+    @staticmethod
+    def _read_hits(hits_path):
+        with open(hits_path, "rb") as f:
+            return int.from_bytes(f.read(8), "little")
+
+    def put(self, key, data):
+        """
+        Cache the numpy arrays in `data`, evicting entries to stay within the budget.
+        """
+        data = {k: v for k, v in data.items() if isinstance(v, np.ndarray)}
+        nbytes = sum(v.nbytes for v in data.values())
+        if nbytes > self.budget:
+            return
+        if self.backend == "memory":
+            if key in self._entries:
+                return
+            self._evict_memory(self.budget - nbytes)
+            self._entries[key] = {k: v.copy() for k, v in data.items()}
+            self._frequency[key] = 1
+            self._usage += nbytes
+            return
+
+        entry_path = self._entry_path(key)
+        if os.path.exists(entry_path):
+            return
+        # written outside the lock, in .tmp where eviction does not look
+        tmp_path = os.path.join(
+            self.path, ".tmp", f"{os.path.basename(entry_path)}-{os.getpid()}"
+        )
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        os.makedirs(tmp_path)
+        for k, v in data.items():
+            np.save(os.path.join(tmp_path, f"{k}.npy"), v)
+        with open(os.path.join(tmp_path, ".hits"), "wb") as f:
+            f.write((1).to_bytes(8, "little"))
+        size = self._entry_size(tmp_path)
+        with self._lock(self.path):
+            if os.path.exists(entry_path):
+                shutil.rmtree(tmp_path, ignore_errors=True)
+                return
+            usage = self._read_usage()
+            if usage + size > self.budget:
+                usage = self._evict_shared(self.budget - size, usage)
+            os.rename(tmp_path, entry_path)
+            self._write_usage(usage + size)
+
+    def _evict_memory(self, target):
+        while self._entries and self._usage > target:
+            if self.policy == "lru":
+                key = next(iter(self._entries))
+            else:
+                key = min(self._entries, key=self._frequency.__getitem__)
+            entry = self._entries.pop(key)
+            self._frequency.pop(key)
+            self._usage -= sum(v.nbytes for v in entry.values())
+            with self.counter.get_lock():
+                self.counter[2] += 1
+
+    def _evict_shared(self, target, usage):
+        # called under the namespace lock, returns the usage after eviction
+        entries = []
+        with os.scandir(self.path) as it:
+            for entry in it:
+                if entry.name.startswith(".") or not entry.is_dir():
+                    continue
+                hits_path = os.path.join(entry.path, ".hits")
+                try:
+                    mtime = os.stat(hits_path).st_mtime
+                    # lru: least recent access first, lfu: least hits first
+                    order = (
+                        (mtime,)
+                        if self.policy == "lru"
+                        else (self._read_hits(hits_path), mtime)
+                    )
+                except FileNotFoundError:
+                    continue
+                entries.append((order, entry.path))
+        entries.sort()
+        for _, path in entries:
+            if usage <= target:
+                break
+            usage -= self._entry_size(path)
+            shutil.rmtree(path, ignore_errors=True)
+            with self.counter.get_lock():
+                self.counter[2] += 1
+        return usage
+
+    def usage(self):
+        if self.backend == "memory":
+            return self._usage
+        return self._read_usage()
+
+    def stats(self):
+        with self.counter.get_lock():
+            hit, miss, eviction = self.counter[:]
+        return dict(
+            hit=hit,
+            miss=miss,
+            eviction=eviction,
+            hit_rate=hit / max(hit + miss, 1),
+            usage=self.usage(),
+        )
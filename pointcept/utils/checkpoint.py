@@ -0,0 +1,189 @@
+"""
+Checkpoint Utils
+
+A checkpoint is either a full training checkpoint (epoch, state_dict, optimizer,
+scheduler, scaler, best_metric_value) or, saved by CheckpointSaver with shard=True,
+a small manifest listing shard files (relative to the manifest) that each hold a
+part of the model and optimizer state, written by different ranks, or inference
+weights exported by tools/export_weights.py (state_dict, epoch). CheckpointReader
+reads all of them lazily from memory-mapped files.
+
+Author: Xiaoyang Wu (xiaoyang.wu.cs@gmail.com)
+Please cite our work if the code is helpful to you.
+"""
+
+import os
+import copy
+import shutil
+import torch
+from collections import OrderedDict
+
+MANIFEST_VERSION = 1
+
+
+def to_cpu(obj):
+    # copy of a (nested) state on cpu, safe to write while training goes on
+    if isinstance(obj, torch.Tensor):
+        return obj.detach().to("cpu", copy=True)
+    if isinstance(obj, dict):
+        return obj.__class__((key, to_cpu(value)) for key, value in obj.items())
+    if isinstance(obj, (list, tuple)):
+        return obj.__class__(to_cpu(value) for value in obj)
+    return copy.deepcopy(obj)
+
+
+def state_size(obj):
+    # bytes of tensors in a (nested) state
+    if isinstance(obj, torch.Tensor):
+        return obj.numel() * obj.element_size()
+    if isinstance(obj, dict):
+        return sum(state_size(value) for value in obj.values())
+    if isinstance(obj, (list, tuple)):
+        return sum(state_size(value) for value in obj)
+    return 0
+
+
+def partition(sizes, num_parts):
+    """
+    Assign items (in order) to the part of least total size so far, deterministic
+    on every rank for the same sizes.
+    """
+    load = [0] * num_parts
+    owner = []
+    for size in sizes:
+        part = min(range(num_parts), key=lambda i: load[i])
+        load[part] += size
+        owner.append(part)
+    return owner
+
+
+def save_file(obj, path):
+    # torch.save to a temporary file then rename, a file on disk is always complete
+    torch.save(obj, path + ".tmp")
+    os.replace(path + ".tmp", path)
+
+
+def link_file(src, dst):
+    # hard link (a copy if the file system has none), replacing dst atomically
+    tmp = dst + ".tmp"
+    if os.path.lexists(tmp):
+        os.remove(tmp)
+    try:
+        os.link(src, tmp)
+    except OSError:
+        shutil.copyfile(src, tmp)
+    os.replace(tmp, dst)
+
+
+def is_manifest(checkpoint):
+    return isinstance(checkpoint, dict) and "shards" in checkpoint
+
+
+def shard_paths(path, checkpoint):
+    root = os.path.dirname(os.path.abspath(path))
+    return [os.path.join(root, shard) for shard in checkpoint["shards"]]
+
+
+def mmap_load(path):
+    """
+    torch.load a file memory-mapped on cpu, tensors are read from disk when
+    accessed. Falls back to a plain cpu load for files without mmap support
+    (legacy serialization or older torch).
+    """
+    try:
+        return torch.load(path, map_location="cpu", mmap=True, weights_only=False)
+    except (RuntimeError, TypeError):
+        return torch.load(path, map_location="cpu", weights_only=False)
+
+
+class CheckpointReader(object):
+    """
+    Lazy reader of a full, sharded (see is_manifest) or exported weights checkpoint.
+    Files are memory-mapped, so only the tensors used are read: state_dict for test,
+    optimizer state only if optimizer is called (resume). Tensors stay on cpu and
+    are copied straight to the device of the parameters by load_state_dict.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        checkpoint = mmap_load(path)
+        if is_manifest(checkpoint):
+            assert checkpoint["version"] == MANIFEST_VERSION, "Unsupported checkpoint."
+            self.shards = [mmap_load(shard) for shard in shard_paths(path, checkpoint)]
+            main = [shard for shard in self.shards if "epoch" in shard]
+            assert len(main) == 1, f"Missing main shard of {path}."
+            self.main = main[0]
+        else:
+            self.shards = [checkpoint]
+            self.main = checkpoint
+
+    @property
+    def sharded(self):
+        return "state_dict_keys" in self.main
+
+    def get(self, key, default=None):
+        # epoch, best_metric_value, scheduler, scaler
+        return self.main.get(key, default)
+
+    def __getitem__(self, key):
+        if key == "state_dict":
+            return self.state_dict()
+        if key == "optimizer":
+            return self.optimizer()
+        return self.main[key]
+
+    def state_dict(self):
+        if not self.sharded:
+            return self.main["state_dict"]
+        state_dict = {}
+        for shard in self.shards:
+            state_dict.update(shard["state_dict"])
+        return {key: state_dict[key] for key in self.main["state_dict_keys"]}
+
+    def optimizer(self):
+        if not self.sharded:
+            return self.main["optimizer"]
+        state = {}
+        for shard in self.shards:
+            state.update(shard["optimizer_state"])
+        return dict(
+            state={key: state[key] for key in sorted(state)},
+            param_groups=self.main["optimizer_param_groups"],
+        )
+
+    def to_dict(self):
+        # the full checkpoint format
+        checkpoint = dict(state_dict=self.state_dict())
+        for key in ["epoch", "scheduler", "scaler", "best_metric_value"]:
+            if key in self.main:
+                checkpoint[key] = self.main[key]
+        if self.sharded or "optimizer" in self.main:
+            checkpoint["optimizer"] = self.optimizer()
+        return checkpoint
+
+
+def load_checkpoint(path):
+    """
+    Load a checkpoint in the full format (memory-mapped, on cpu), a sharded
+    checkpoint is reassembled.
+    """
+    return CheckpointReader(path).to_dict()
+
+
+def convert_state_dict(state_dict, ddp, keywords="", replacement=""):
+    """
+    Rename the keys of state_dict for a model wrapped by DDP (module.xxx) or not
+    (xxx), keywords are replaced by replacement on keys with the module. prefix.
+    Tensors are not copied.
+    """
+    weight = OrderedDict()
+    for key, value in state_dict.items():
+        if not key.startswith("module."):
+            key = "module." + key  # xxx.xxx -> module.xxx.xxx
+        # Now all keys contain "module." no matter DDP or not.
+        if keywords and keywords in key:
+            key = key.replace(keywords, replacement)
+        if not ddp:
+            key = key[7:]  # module.xxx.xxx -> xxx.xxx
+        weight[key] = value
+    return weight
@@ -6,12 +6,17 @@ Please cite our work if the code is helpful to you.
 """
 
 import os
+import queue
+import threading
 import warnings
 from collections import abc
 import numpy as np
 import torch
+import torch.distributed as dist
 from importlib import import_module
 
+import pointcept.utils.comm as comm
+
 
 class AverageMeter(object):
     """Computes and stores the average and current value"""
@@ -65,11 +70,132 @@ def intersection_and_union_gpu(output, target, k, ignore_index=-1):
     return area_intersection, area_union, area_target
 
 
+class ConfusionMatrix(object):
+    """
+    Streaming confusion matrix (row target, column prediction) of num_classes,
+    accumulated on the device of the inputs with one bincount per update; points
+    with ignore_index (or out of range) target or prediction are skipped. sync sums
+    the matrix over ranks with one all_reduce, summary derives the metrics of
+    intersection_and_union from the accumulated (or a given) matrix.
+    """
+
+    def __init__(self, num_classes, ignore_index=-1):
+        self.num_classes = num_classes
+        self.ignore_index = ignore_index
+        self.matrix = torch.zeros((num_classes, num_classes), dtype=torch.long)
+
+    def reset(self):
+        self.matrix = torch.zeros_like(self.matrix)
+
+    def compute(self, pred, target):
+        # pred, target: tensor or ndarray of class index, return matrix of the batch
+        k = self.num_classes
+        pred = torch.as_tensor(pred).reshape(-1).long()
+        target = torch.as_tensor(target).reshape(-1).to(pred.device).long()
+        assert pred.shape == target.shape
+        mask = (target != self.ignore_index) & (target >= 0) & (target < k)
+        mask &= (pred >= 0) & (pred < k)
+        matrix = torch.bincount(target[mask] * k + pred[mask], minlength=k * k)
+        return matrix.view(k, k)
+
+    def accumulate(self, matrix):
+        self.matrix = self.matrix.to(matrix.device) + matrix
+
+    def update(self, pred, target):
+        matrix = self.compute(pred, target)
+        self.accumulate(matrix)
+        return matrix
+
+    def sync(self):
+        if comm.get_world_size() > 1:
+            matrix = self.matrix
+            if dist.get_backend() == dist.Backend.NCCL:
+                matrix = matrix.cuda()
+            dist.all_reduce(matrix)
+            self.matrix = matrix
+
+    def summary(self, matrix=None):
+        matrix = self.matrix if matrix is None else matrix
+        matrix = matrix.cpu().double().numpy()
+        intersection = np.diag(matrix)
+        target = matrix.sum(1)
+        union = target + matrix.sum(0) - intersection
+        iou_class = intersection / (union + 1e-10)
+        acc_class = intersection / (target + 1e-10)
+        return dict(
+            intersection=intersection,
+            union=union,
+            target=target,
+            iou_class=iou_class,
+            acc_class=acc_class,
+            m_iou=np.mean(iou_class),
+            m_acc=np.mean(acc_class),
+            all_acc=sum(intersection) / (sum(target) + 1e-10),
+        )
+
+
 def make_dirs(dir_name):
     if not os.path.exists(dir_name):
         os.makedirs(dir_name, exist_ok=True)
 
 
+class AsyncWriter(object):
+    """
+    Run write jobs (e.g. np.save, np.savetxt, ndarray.tofile) on background
+    threads fed by a bounded queue, so that serialization overlaps with the next
+    forward. submit blocks when max_pending jobs are waiting, flush waits for all
+    submitted jobs and re-raises the first error, check re-raises the first error of
+    finished jobs without waiting. num_workers=0 writes inline.
+    """
+
+    def __init__(self, num_workers=2, max_pending=8):
+        self.num_workers = num_workers
+        self.errors = []
+        self.queue = queue.Queue(maxsize=max_pending)
+        self.workers = []
+        for _ in range(num_workers):
+            worker = threading.Thread(target=self._run, daemon=True)
+            worker.start()
+            self.workers.append(worker)
+
+    def _run(self):
+        while True:
+            job = self.queue.get()
+            if job is None:
+                self.queue.task_done()
+                break
+            fn, args, kwargs = job
+            try:
+                fn(*args, **kwargs)
+            except Exception as e:
+                self.errors.append(e)
+            finally:
+                self.queue.task_done()
+
+    def submit(self, fn, *args, **kwargs):
+        if self.num_workers == 0:
+            fn(*args, **kwargs)
+        else:
+            self.queue.put((fn, args, kwargs))
+
+    def check(self):
+        if len(self.errors) > 0:
+            raise self.errors.pop(0)
+
+    def flush(self):
+        self.queue.join()
+        self.check()
+
+    def close(self):
+        for _ in self.workers:
+            self.queue.put(None)
+        for worker in self.workers:
+            worker.join()
+        self.workers = []
+        self.num_workers = 0
+        self.check()
+
+
 def find_free_port():
     import socket
 
@@ -0,0 +1,91 @@
+"""
+Benchmark the train dataloader of a config on CPU: per transform latency of the
+data.train pipeline, then samples/s of the loader for a sweep of num_workers,
+prefetch_factor and pin_memory, and the recommended setting (the cheapest one
+within 5% of the best throughput). Set tune_dataloader in the config to apply
+it automatically when training starts.
+
+e.g. python tools/benchmark_dataloader.py --config-file configs/scannet/semseg-pt-v3m1-0-base.py --num-gpus 4
+
+Author: Xiaoyang Wu (xiaoyang.wu.cs@gmail.com)
+Please cite our work if the code is helpful to you.
+"""
+
+import argparse
+
+from pointcept.datasets import build_dataset
+from pointcept.datasets.dataloader import profile_transform, tune_dataloader
+from pointcept.utils.config import Config, DictAction
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--config-file", required=True, help="path to config file")
+    parser.add_argument(
+        "--num-gpus",
+        default=1,
+        type=int,
+        help="GPUs of the training, the batch size per gpu is batch_size / num_gpus",
+    )
+    parser.add_argument("--num-workers", default=None, type=int, nargs="+")
+    parser.add_argument("--prefetch-factor", default=[2, 4], type=int, nargs="+")
+    parser.add_argument(
+        "--pin-memory", default=[True], type=lambda x: x == "true", nargs="+"
+    )
+    parser.add_argument("--num-batches", default=20, type=int)
+    parser.add_argument(
+        "--num-samples",
+        default=16,
+        type=int,
+        help="Samples to profile the transforms, 0 to skip.",
+    )
+    parser.add_argument(
+        "--options", nargs="+", action=DictAction, help="custom options"
+    )
+    args = parser.parse_args()
+
+    cfg = Config.fromfile(args.config_file)
+    if args.options is not None:
+        cfg.merge_from_dict(args.options)
+    batch_size = cfg.batch_size // args.num_gpus
+    max_workers = cfg.num_worker // args.num_gpus
+    num_workers = args.num_workers or sorted(
+        {*[2**i for i in range(max_workers.bit_length())], max_workers}
+    )
+    train_data = build_dataset(cfg.data.train)
+
+    if args.num_samples > 0:
+        print(f"Transform latency ({args.num_samples} samples, ms):")
+        stats = profile_transform(train_data, args.num_samples)
+        total = sum(value["latency"] for value in stats.values())
+        for name, value in sorted(stats.items(), key=lambda x: -x[1]["latency"]):
+            print(
+                f"  {name:<40} {value['latency']:8.2f} "
+                f"({value['latency'] / total * 100:5.1f}%) {value['points']:10.0f} pts"
+            )
+        print(f"  {'total':<40} {total:8.2f}")
+
+    print(f"Dataloader throughput (batch size per gpu {batch_size}):")
+    setting, results = tune_dataloader(
+        train_data,
+        batch_size,
+        num_workers=num_workers,
+        prefetch_factor=args.prefetch_factor,
+        pin_memory=args.pin_memory,
+        num_batches=args.num_batches,
+        mix_prob=cfg.mix_prob,
+    )
+    for result, throughput in results:
+        print(
+            "  num_workers {num_workers:3d} prefetch_factor {prefetch_factor} "
+            "pin_memory {pin_memory}: {throughput:8.2f} samples/s".format(
+                throughput=throughput, **result
+            )
+        )
+    print(
+        "Recommended: --options num_worker={} prefetch_factor={} "
+        "pin_memory={}".format(
+            setting["num_workers"] * args.num_gpus,
+            setting["prefetch_factor"],
+            setting["pin_memory"],
+        )
+    )
@@ -0,0 +1,133 @@
+"""
+Benchmark the torch backend of pointgroup_ops (spatial hash ball query and
+connected components clustering) on random scenes, and check it against a brute
+force ball query (the CUDA kernel: d2 < radius^2, first 1000 neighbours in index
+order) and BFS clustering (the C++ op) on a small batch.
+
+e.g. python tools/benchmark_pointgroup_ops.py --num-points 100000 --radius 0.03
+
+Author: Xiaoyang Wu (xiaoyang.wu.cs@gmail.com)
+Please cite our work if the code is helpful to you.
+"""
+
+import time
+import argparse
+from collections import deque
+import torch
+
+from pointgroup_ops import ball_query, connected_components
+
+
+def make_batch(num_points, batch_size, num_classes, seed=0, device="cpu"):
+    generator = torch.Generator().manual_seed(seed)
+    coord = torch.rand(num_points * batch_size, 3, generator=generator)
+    coord = coord * torch.tensor([2.0, 2.0, 1.0])
+    batch = torch.arange(batch_size).repeat_interleave(num_points).int()
+    label = torch.randint(0, num_classes, (len(coord),), generator=generator).int()
+    return coord.to(device), batch.to(device), label.to(device)
+
+
+def ball_query_reference(coords, batch_idxs, radius, max_active=1000):
+    radius2 = torch.tensor(radius, dtype=torch.float).square()
+    idx, length = [], []
+    for i in range(len(coords)):
+        diff = coords[i] - coords
+        d2 = diff[:, 0] * diff[:, 0] + diff[:, 1] * diff[:, 1] + diff[:, 2] * diff[:, 2]
+        mask = (d2 < radius2) & (batch_idxs == batch_idxs[i])
+        neighbour = mask.nonzero().view(-1)[:max_active]
+        idx.append(neighbour)
+        length.append(len(neighbour))
+    length = torch.tensor(length)
+    start_len = torch.stack([torch.cumsum(length, dim=0) - length, length], dim=1)
+    return torch.cat(idx).int(), start_len.int()
+
+
+def bfs_cluster_reference(semantic_label, ball_query_idxs, start_len, threshold):
+    label, idx = semantic_label.tolist(), ball_query_idxs.tolist()
+    start_len = start_len.tolist()
+    visited, clusters = [False] * len(label), []
+    for seed in range(len(label)):
+        if visited[seed]:
+            continue
+        cluster, queue, visited[seed] = [seed], deque([seed]), True
+        while queue:
+            current = queue.popleft()
+            start, length = start_len[current]
+            for i in idx[start : start + length]:
+                if label[i] == label[current] and not visited[i]:
+                    visited[i] = True
+                    cluster.append(i)
+                    queue.append(i)
+        if len(cluster) >= threshold:
+            clusters.append(sorted(cluster))
+    return clusters
+
+
+def check(radius, threshold, device):
+    coords, batch_idxs, label = make_batch(1500, 2, 2, seed=1)
+    # denser than the benchmark scenes, to have clusters and truncated balls
+    coords = coords / 8
+    for max_active in [1000, 16]:
+        idx, start_len = ball_query(
+            coords.to(device), batch_idxs.to(device), radius, max_active=max_active
+        )
+        reference = ball_query_reference(coords, batch_idxs, radius, max_active)
+        assert torch.equal(idx.cpu(), reference[0])
+        assert torch.equal(start_len.cpu(), reference[1])
+    idx, start_len = ball_query(coords, batch_idxs, radius)
+    cluster_idxs, cluster_offsets = connected_components(
+        label.to(device), idx.to(device), start_len.to(device), threshold
+    )
+    cluster_idxs, cluster_offsets = cluster_idxs.cpu(), cluster_offsets.cpu()
+    reference = bfs_cluster_reference(label, idx, start_len, threshold)
+    assert len(cluster_offsets) == len(reference) + 1
+    for i, cluster in enumerate(reference):
+        begin, end = cluster_offsets[i], cluster_offsets[i + 1]
+        assert (cluster_idxs[begin:end, 0] == i).all()
+        assert cluster_idxs[begin:end, 1].tolist() == cluster
+    print(f"ball query and clustering ({len(reference)} clusters): PASS")
+
+
+def timeit(func, iters, device):
+    func()
+    if device == "cuda":
+        torch.cuda.synchronize()
+    start = time.perf_counter()
+    for _ in range(iters):
+        output = func()
+    if device == "cuda":
+        torch.cuda.synchronize()
+    return (time.perf_counter() - start) / iters * 1000, output
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--num-points", default=100000, type=int)
+    parser.add_argument("--batch-size", default=2, type=int)
+    parser.add_argument("--num-classes", default=2, type=int)
+    parser.add_argument("--radius", default=0.03, type=float)
+    parser.add_argument("--min-points", default=50, type=int)
+    parser.add_argument("--iters", default=3, type=int)
+    parser.add_argument(
+        "--device", default="cuda" if torch.cuda.is_available() else "cpu"
+    )
+    args = parser.parse_args()
+
+    check(args.radius, args.min_points, args.device)
+
+    coords, batch_idxs, label = make_batch(
+        args.num_points, args.batch_size, args.num_classes, device=args.device
+    )
+    query, (idx, start_len) = timeit(
+        lambda: ball_query(coords, batch_idxs, args.radius), args.iters, args.device
+    )
+    cluster, (_, cluster_offsets) = timeit(
+        lambda: connected_components(label, idx, start_len, args.min_points),
+        args.iters,
+        args.device,
+    )
+    print(
+        f"{len(coords)} points, device {args.device}: ball query {query:.1f} ms "
+        f"({len(idx)} neighbours), clustering {cluster:.1f} ms "
+        f"({len(cluster_offsets) - 1} clusters)"
+    )
@@ -0,0 +1,329 @@
+"""
+Check the CPU backend of pointops against brute-force references and benchmark it
+on random offset-delimited batches, then compare exact and bucketed farthest point
+sampling (latency and coverage) and the dilated kNN grouping of query_and_group
+(batch sizes 1 to 64) on CPU or CUDA.
+
+e.g. python tools/benchmark_pointops.py --num-points 50000 --batch-size 4
+
+Author: Xiaoyang Wu (xiaoyang.wu.cs@gmail.com)
+Please cite our work if the code is helpful to you.
+"""
+
+import time
+import argparse
+import torch
+
+import pointops
+from pointops.utils import dilated_knn_index
+
+
+def make_batch(num_points, batch_size, ratio=0.25, seed=0):
+    generator = torch.Generator().manual_seed(seed)
+    count = torch.randint(num_points // 2, num_points + 1, (batch_size,))
+    count = count.clamp(min=2)
+    coord = torch.rand(int(count.sum()), 3, generator=generator) * 5
+    offset = torch.cumsum(count, 0).int()
+    new_offset = torch.cumsum((count * ratio).int().clamp(min=1), 0).int()
+    return coord, offset, new_offset
+
+
+def batch_slices(offset):
+    start = 0
+    for end in offset.tolist():
+        yield slice(start, end)
+        start = end
+
+
+def knn_reference(nsample, xyz, offset, new_xyz, new_offset):
+    idx = torch.full((new_xyz.shape[0], nsample), -1, dtype=torch.long)
+    dist = torch.full((new_xyz.shape[0], nsample), 1e5)
+    for s, new_s in zip(batch_slices(offset), batch_slices(new_offset)):
+        d = torch.cdist(new_xyz[new_s].double(), xyz[s].double())
+        k = min(nsample, d.shape[1])
+        d, i = torch.topk(d, k, dim=1, largest=False)
+        idx[new_s, :k] = i + s.start
+        dist[new_s, :k] = d.float()
+    return idx, dist
+
+
+def ball_reference(radius, xyz, offset, new_xyz, new_offset):
+    # number of points within radius of each query
+    count = torch.zeros(new_xyz.shape[0], dtype=torch.long)
+    for s, new_s in zip(batch_slices(offset), batch_slices(new_offset)):
+        d2 = torch.cdist(new_xyz[new_s], xyz[s]).square()
+        count[new_s] = ((d2 < radius**2) | (d2 <= 1e-5)).sum(1)
+    return count
+
+
+def fps_reference(xyz, offset, new_offset):
+    idx = []
+    for s, new_s in zip(batch_slices(offset), batch_slices(new_offset)):
+        points = xyz[s]
+        dist = torch.full((points.shape[0],), 1e10)
+        old = 0
+        idx.append(s.start)
+        for _ in range(new_s.stop - new_s.start - 1):
+            dist = torch.minimum(dist, (points - points[old]).square().sum(-1))
+            old = int(torch.argmax(dist))
+            idx.append(s.start + old)
+    return torch.tensor(idx)
+
+
+def check(name, passed):
+    print(f"[{'PASS' if passed else 'FAIL'}] {name}")
+    return passed
+
+
+def parity(nsample=16, radius=0.3):
+    # small batches, including one with less points than nsample
+    coord, offset, new_offset = make_batch(2000, 3, seed=1)
+    coord = torch.cat([coord, torch.rand(8, 3)])
+    offset = torch.cat([offset, offset[-1:] + 8])
+    new_offset = torch.cat([new_offset, new_offset[-1:] + 4])
+    new_coord = coord[
+        torch.cat(
+            [
+                torch.arange(s.start, s.start + new_s.stop - new_s.start)
+                for s, new_s in zip(batch_slices(offset), batch_slices(new_offset))
+            ]
+        )
+    ].contiguous()
+    passed = True
+
+    idx, dist = pointops.knn_query(nsample, coord, offset, new_coord, new_offset)
+    ref_idx, ref_dist = knn_reference(nsample, coord, offset, new_coord, new_offset)
+    passed &= check(
+        "knn_query",
+        torch.allclose(dist, ref_dist, atol=1e-4)
+        and torch.equal(idx == -1, ref_idx == -1),
+    )
+
+    ref_count = ball_reference(radius, coord, offset, new_coord, new_offset)
+    idx, dist = pointops.ball_query(
+        nsample, radius, 0, coord, offset, new_coord, new_offset
+    )
+    dist_ref = (coord[idx.long()] - new_coord.unsqueeze(1)).norm(dim=-1)
+    passed &= check(
+        "ball_query",
+        torch.equal((idx != -1).sum(1), ref_count.clamp(max=nsample))
+        and bool((dist_ref[idx != -1] < radius + 1e-6).all())
+        and bool((dist[:, 1:] >= dist[:, :-1] - 1e-6)[idx[:, 1:] != -1].all()),
+    )
+    idx, _ = pointops.random_ball_query(
+        nsample, radius, 0, coord, offset, new_coord, new_offset
+    )
+    dist_ref = (coord[idx.long()] - new_coord.unsqueeze(1)).norm(dim=-1)
+    passed &= check(
+        "random_ball_query",
+        torch.equal((idx != -1).sum(1), ref_count.clamp(max=nsample))
+        and bool((dist_ref[idx != -1] < radius + 1e-6).all()),
+    )
+
+    idx = pointops.farthest_point_sampling(coord, offset, new_offset)
+    passed &= check(
+        "farthest_point_sampling",
+        torch.equal(idx.long(), fps_reference(coord, offset, new_offset)),
+    )
+
+    # differentiable ops against their torch formulation (forward and backward)
+    idx, _ = pointops.knn_query(nsample, coord, offset)
+    idx[idx == -1] = 0
+    feat = torch.rand(coord.shape[0], 8, requires_grad=True)
+    weight = torch.rand(coord.shape[0], nsample, 4, requires_grad=True)
+    position = torch.rand(coord.shape[0], nsample, 8, requires_grad=True)
+    ops = dict(
+        grouping=(
+            lambda: pointops.grouping2(feat, idx),
+            lambda: feat[idx.long()],
+        ),
+        interpolation=(
+            lambda: pointops.interpolation2(coord, coord, feat, offset, offset),
+            lambda: pointops.interpolation(coord, coord, feat, offset, offset),
+        ),
+        subtraction=(
+            lambda: pointops.subtraction(feat, feat, idx),
+            lambda: feat.unsqueeze(1) - feat[idx.long()],
+        ),
+        aggregation=(
+            lambda: pointops.aggregation(feat, position, weight, idx),
+            lambda: ((feat[idx.long()] + position) * weight.repeat(1, 1, 2)).sum(1),
+        ),
+    )
+    for name, (op, reference) in ops.items():
+        grads = []
+        for fn in (op, reference):
+            for tensor in (feat, weight, position):
+                tensor.grad = None
+            output = fn()
+            output.backward(torch.ones_like(output))
+            grads.append(
+                [output]
+                + [t.grad for t in (feat, weight, position) if t.grad is not None]
+            )
+        passed &= check(
+            name,
+            len(grads[0]) == len(grads[1])
+            and all(
+                torch.allclose(a, b, atol=1e-4) for a, b in zip(grads[0], grads[1])
+            ),
+        )
+    return passed
+
+
+def benchmark(num_points, batch_size, nsample, radius, iters):
+    coord, offset, new_offset = make_batch(num_points, batch_size)
+    new_idx = pointops.farthest_point_sampling(coord, offset, new_offset)
+    new_coord = coord[new_idx.long()].contiguous()
+    feat = torch.rand(coord.shape[0], 32)
+    idx, _ = pointops.knn_query(nsample, coord, offset)
+    ops = dict(
+        knn_query=lambda: pointops.knn_query(nsample, coord, offset),
+        ball_query=lambda: pointops.ball_query(
+            nsample, radius, 0, coord, offset, new_coord, new_offset
+        ),
+        random_ball_query=lambda: pointops.random_ball_query(
+            nsample, radius, 0, coord, offset, new_coord, new_offset
+        ),
+        farthest_point_sampling=lambda: pointops.farthest_point_sampling(
+            coord, offset, new_offset
+        ),
+        grouping=lambda: pointops.grouping(idx, feat, coord, with_xyz=True),
+        interpolation=lambda: pointops.interpolation(
+            new_coord, coord, feat[new_idx.long()], new_offset, offset
+        ),
+        subtraction=lambda: pointops.subtraction(feat, feat, idx),
+    )
+    print(
+        f"{coord.shape[0]} points in {batch_size} batches, "
+        f"{new_coord.shape[0]} queries, {torch.get_num_threads()} threads:"
+    )
+    for name, op in ops.items():
+        op()  # warm up
+        start = time.perf_counter()
+        for _ in range(iters):
+            op()
+        latency = (time.perf_counter() - start) / iters * 1000
+        print(f"{name}: {latency:.2f} ms")
+
+
+def benchmark_sampling(num_points, batch_size, bucket_sizes, iters, device):
+    coord, offset, new_offset = make_batch(num_points, batch_size)
+    coord, offset, new_offset = (
+        coord.to(device),
+        offset.to(device),
+        new_offset.to(device),
+    )
+    strategies = dict(
+        fps=lambda: pointops.farthest_point_sampling(coord, offset, new_offset)
+    )
+    for bucket_size in bucket_sizes:
+        strategies[f"bucket_fps ({bucket_size})"] = (
+            lambda bucket_size=bucket_size: pointops.bucket_farthest_point_sampling(
+                coord, offset, new_offset, bucket_size
+            )
+        )
+    print(
+        f"Sampling {int(new_offset[-1])} of {coord.shape[0]} points in {batch_size} "
+        f"batches on {device}, coverage: distance from a point to its nearest sample"
+    )
+    for name, op in strategies.items():
+        op()  # warm up
+        if device == "cuda":
+            torch.cuda.synchronize()
+        start = time.perf_counter()
+        for _ in range(iters):
+            idx = op()
+        if device == "cuda":
+            torch.cuda.synchronize()
+        latency = (time.perf_counter() - start) / iters * 1000
+        _, dist = pointops.knn_query(
+            1, coord[idx.long()].contiguous(), new_offset, coord, offset
+        )
+        dist = dist.squeeze(-1).float().cpu()
+        print(
+            f"{name}: {latency:.2f} ms, coverage mean {dist.mean():.4f} "
+            f"p99 {torch.quantile(dist, 0.99):.4f} max {dist.max():.4f}"
+        )
+
+
+def dilated_knn_reference(idx_no_dilation, nsample, dilation, offset, new_offset):
+    # per batch python loop of the former query_and_group
+    num_samples_total = 1 + (nsample - 1) * (dilation + 1)
+    idx = []
+    batch_end = offset.tolist()
+    batch_start = [0] + batch_end[:-1]
+    new_batch_end = new_offset.tolist()
+    new_batch_start = [0] + new_batch_end[:-1]
+    for i in range(offset.shape[0]):
+        if batch_end[i] - batch_start[i] < num_samples_total:
+            soft_dilation = (batch_end[i] - batch_start[i] - 1) / (nsample - 1) - 1
+        else:
+            soft_dilation = dilation
+        idx.append(
+            idx_no_dilation[
+                new_batch_start[i] : new_batch_end[i],
+                [int((soft_dilation + 1) * i) for i in range(nsample)],
+            ]
+        )
+    return torch.cat(idx, dim=0)
+
+
+def benchmark_dilated_knn(num_points, batch_sizes, nsample, iters, device, dilation=1):
+    # the kNN query itself is shared, only the dilated index selection is timed
+    num_samples_total = 1 + (nsample - 1) * (dilation + 1)
+    print(
+        f"Dilated kNN index of query_and_group, {nsample} of {num_samples_total} "
+        f"neighbours, about {num_points} points per batch on {device}:"
+    )
+    for batch_size in batch_sizes:
+        coord, offset, _ = make_batch(num_points, batch_size)
+        # some batches with less than num_samples_total points (soft dilation)
+        count = torch.diff(offset, prepend=offset.new_zeros(1))
+        count[::4] = torch.randint(nsample, num_samples_total, count[::4].shape)
+        coord = torch.rand(int(count.sum()), 3) * 5
+        offset = torch.cumsum(count, 0).int()
+        coord, offset = coord.to(device), offset.to(device)
+        idx, _ = pointops.knn_query(num_samples_total, coord, offset)
+        latency, result = [], []
+        for fn in [dilated_knn_reference, dilated_knn_index]:
+            result.append(fn(idx, nsample, dilation, offset, offset))
+            if device == "cuda":
+                torch.cuda.synchronize()
+            start = time.perf_counter()
+            for _ in range(iters):
+                fn(idx, nsample, dilation, offset, offset)
+            if device == "cuda":
+                torch.cuda.synchronize()
+            latency.append((time.perf_counter() - start) / iters * 1000)
+        print(
+            f"batch size {batch_size}: loop {latency[0]:.3f} ms, "
+            f"vectorized {latency[1]:.3f} ms, "
+            f"equal {torch.equal(result[0], result[1])}"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--num-points", default=50000, type=int)
+    parser.add_argument("--batch-size", default=4, type=int)
+    parser.add_argument("--nsample", default=16, type=int)
+    parser.add_argument("--radius", default=0.1, type=float)
+    parser.add_argument("--iters", default=5, type=int)
+    parser.add_argument(
+        "--bucket-sizes", default=[256, 1024, 4096], type=int, nargs="+"
+    )
+    parser.add_argument(
+        "--device", default="cuda" if torch.cuda.is_available() else "cpu"
+    )
+    args = parser.parse_args()
+
+    if not parity(args.nsample):
+        raise RuntimeError("CPU backend does not match the reference.")
+    benchmark(args.num_points, args.batch_size, args.nsample, args.radius, args.iters)
+    benchmark_sampling(
+        args.num_points, args.batch_size, args.bucket_sizes, args.iters, args.device
+    )
+    benchmark_dilated_knn(
+        args.num_points // 50, [1, 2, 4, 8, 16, 32, 64], args.nsample, 20, args.device
+    )
@@ -0,0 +1,212 @@
+"""
+Benchmark forward latency of Point Transformer V3 (PT-v3m1) on CPU (or CUDA) on
+random grid sampled scenes, and the share of it spent building the padding plan
+(pad / unpad / cu_seqlens) of SerializedAttention, against the per batch loop it
+replaces. Without flash attention (CPU) patch size follows the smallest scene.
+
+e.g. python tools/benchmark_ptv3.py --num-points 40000 --batch-size 4
+
+Author: Xiaoyang Wu (xiaoyang.wu.cs@gmail.com)
+Please cite our work if the code is helpful to you.
+"""
+
+import time
+import argparse
+import torch
+import torch.nn as nn
+from addict import Dict
+
+from pointcept.models.builder import build_model
+from pointcept.models.utils.misc import offset2bincount
+from pointcept.models.point_transformer_v3.point_transformer_v3m1_base import (
+    SerializedAttention,
+)
+
+
+def make_batch(num_points, batch_size, grid_size=0.02, seed=0):
+    generator = torch.Generator().manual_seed(seed)
+    coord, offset = [], []
+    for _ in range(batch_size):
+        count = int(torch.randint(num_points // 2, num_points + 1, (1,)))
+        scene = torch.rand(count, 3, generator=generator) * torch.tensor([8, 8, 3])
+        # keep one point per grid, like GridSample does in the data pipeline
+        _, index = torch.unique(
+            torch.div(scene, grid_size, rounding_mode="trunc").int(),
+            dim=0,
+            return_inverse=True,
+        )
+        scene = scene[_first(index)]
+        coord.append(scene)
+        offset.append(len(scene))
+    coord = torch.cat(coord)
+    return dict(
+        coord=coord,
+        feat=torch.cat([coord, torch.rand(coord.shape, generator=generator)], 1),
+        offset=torch.cumsum(torch.tensor(offset), 0),
+        grid_size=grid_size,
+    )
+
+
+def _first(index):
+    # first point of each grid
+    first = torch.full((int(index.max()) + 1,), len(index), dtype=torch.long)
+    first.scatter_reduce_(0, index, torch.arange(len(index)), reduce="amin")
+    return first
+
+
+def padding_reference(offset, patch_size):
+    # per batch loop of the original SerializedAttention.get_padding_and_inverse
+    bincount = offset2bincount(offset)
+    bincount_pad = (
+        torch.div(bincount + patch_size - 1, patch_size, rounding_mode="trunc")
+        * patch_size
+    )
+    mask_pad = bincount > patch_size
+    bincount_pad = ~mask_pad * bincount + mask_pad * bincount_pad
+    _offset = nn.functional.pad(offset, (1, 0))
+    _offset_pad = nn.functional.pad(torch.cumsum(bincount_pad, dim=0), (1, 0))
+    pad = torch.arange(_offset_pad[-1], device=offset.device)
+    unpad = torch.arange(_offset[-1], device=offset.device)
+    cu_seqlens = []
+    for i in range(len(offset)):
+        unpad[_offset[i] : _offset[i + 1]] += _offset_pad[i] - _offset[i]
+        if bincount[i] != bincount_pad[i]:
+            pad[
+                _offset_pad[i + 1]
+                - patch_size
+                + (bincount[i] % patch_size) : _offset_pad[i + 1]
+            ] = pad[
+                _offset_pad[i + 1]
+                - 2 * patch_size
+                + (bincount[i] % patch_size) : _offset_pad[i + 1]
+                - patch_size
+            ]
+        pad[_offset_pad[i] : _offset_pad[i + 1]] -= _offset_pad[i] - _offset[i]
+        cu_seqlens.append(
+            torch.arange(
+                _offset_pad[i],
+                _offset_pad[i + 1],
+                step=patch_size,
+                dtype=torch.int32,
+                device=offset.device,
+            )
+        )
+    cu_seqlens = nn.functional.pad(
+        torch.concat(cu_seqlens), (0, 1), value=_offset_pad[-1]
+    )
+    return pad, unpad, cu_seqlens
+
+
+def get_padding_reference(self, point):
+    keys = [f"{key}_{self.patch_size}" for key in ["pad", "unpad", "cu_seqlens"]]
+    if not set(keys).issubset(point.keys()):
+        for key, value in zip(keys, padding_reference(point.offset, self.patch_size)):
+            point[key] = value
+    return tuple(point[key] for key in keys)
+
+
+def synchronize(device):
+    if device == "cuda":
+        torch.cuda.synchronize()
+
+
+def timed(func, record, device):
+    # accumulate time spent in func into record
+    def wrapper(*args, **kwargs):
+        synchronize(device)
+        start = time.perf_counter()
+        output = func(*args, **kwargs)
+        synchronize(device)
+        record.append(time.perf_counter() - start)
+        return output
+
+    return wrapper
+
+
+def check_plan(num_points, patch_sizes, device):
+    for batch_size in [1, 3, 8]:
+        offset = make_batch(num_points, batch_size)["offset"].to(device)
+        for patch_size in patch_sizes:
+            attn = SerializedAttention(
+                channels=16, num_heads=1, patch_size=patch_size, enable_flash=False
+            )
+            attn.patch_size = patch_size
+            point = dict(
+                offset=offset, feat=torch.empty(int(offset[-1]), 0, device=device)
+            )
+            plan = attn.get_padding_and_inverse(Dict(point))
+            reference = padding_reference(offset, patch_size)
+            for name, a, b in zip(["pad", "unpad", "cu_seqlens"], plan, reference):
+                assert a.dtype == b.dtype and torch.equal(a, b), (
+                    f"{name} mismatch (batch size {batch_size}, "
+                    f"patch size {patch_size})"
+                )
+    print("padding plan: PASS")
+
+
+def benchmark(model, data_dict, iters, device):
+    plan_record = []
+    methods = dict(
+        vectorized=SerializedAttention.get_padding_and_inverse,
+        loop=get_padding_reference,
+    )
+    for name, method in methods.items():
+        SerializedAttention.get_padding_and_inverse = timed(method, plan_record, device)
+        latency = []
+        for i in range(iters + 1):
+            plan_record.clear()
+            synchronize(device)
+            start = time.perf_counter()
+            with torch.no_grad():
+                model(dict(data_dict))
+            synchronize(device)
+            # first iteration is warm up
+            if i > 0:
+                latency.append((time.perf_counter() - start, sum(plan_record)))
+        forward, plan = [sum(x) / len(x) * 1000 for x in zip(*latency)]
+        print(
+            f"{name}: forward {forward:.1f} ms, padding plan {plan:.2f} ms "
+            f"({plan / forward * 100:.1f}%)"
+        )
+    SerializedAttention.get_padding_and_inverse = methods["vectorized"]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--num-points", default=40000, type=int)
+    parser.add_argument("--batch-size", default=4, type=int)
+    parser.add_argument("--iters", default=5, type=int)
+    parser.add_argument("--patch-size", default=1024, type=int)
+    parser.add_argument(
+        "--device", default="cuda" if torch.cuda.is_available() else "cpu"
+    )
+    parser.add_argument(
+        "--enable-flash",
+        action="store_true",
+        help="Use flash attention (CUDA only), patch size is fixed then.",
+    )
+    args = parser.parse_args()
+
+    check_plan(args.num_points // 10, [1, 7, 48, args.patch_size], "cpu")
+
+    model = build_model(
+        dict(
+            type="PT-v3m1",
+            in_channels=6,
+            order=("z", "z-trans", "hilbert", "hilbert-trans"),
+            enc_patch_size=[args.patch_size] * 5,
+            dec_patch_size=[args.patch_size] * 4,
+            enable_flash=args.enable_flash,
+        )
+    )
+    model = model.to(args.device).eval()
+    data_dict = make_batch(args.num_points, args.batch_size)
+    data_dict = {
+        key: value.to(args.device) if isinstance(value, torch.Tensor) else value
+        for key, value in data_dict.items()
+    }
+    print(
+        f"{len(data_dict['coord'])} points, batch size {args.batch_size}, "
+        f"device {args.device}"
+    )
+    benchmark(model, data_dict, args.iters, args.device)
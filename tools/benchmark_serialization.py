@@ -0,0 +1,205 @@
+"""
+Benchmark serialization of Point (multi-order code, order and inverse) on random
+voxelized batches: per order encoding + argsort as before vs. the fused engine
+(encode_orders + sort_code), pooled order vs. sorting pooled code again, and
+SerializationCache hits for repeated grid_coord (test time augmentation). Deeper
+than 16 levels (or with too many batches) codes are split into two words, encoding
+throughput is compared with the z_order.xyz2key LUT path at depth 16.
+
+e.g. python tools/benchmark_serialization.py --num-points 200000 --batch-size 4
+
+Author: Xiaoyang Wu (xiaoyang.wu.cs@gmail.com)
+Please cite our work if the code is helpful to you.
+"""
+
+import time
+import argparse
+import torch
+
+from pointcept.models.utils.serialization import (
+    encode_orders,
+    sort_code,
+    shift_code,
+    unique_code,
+    pool_order,
+    SerializationCache,
+)
+from pointcept.models.utils.serialization.z_order import xyz2key
+from pointcept.models.utils.serialization.hilbert import encode as hilbert_encode
+
+ORDERS = ("z", "z-trans", "hilbert", "hilbert-trans")
+
+
+def make_batch(num_points, batch_size, depth, seed=0, device="cpu"):
+    generator = torch.Generator().manual_seed(seed)
+    grid_coord = torch.randint(0, 1 << depth, (num_points, 3), generator=generator)
+    batch = torch.randint(0, batch_size, (num_points,), generator=generator)
+    # one point per voxel, ordered by batch
+    key = torch.unique(torch.cat([batch[:, None], grid_coord], dim=1), dim=0)
+    key = key[torch.randperm(len(key), generator=generator)]
+    key = key[torch.sort(key[:, 0], stable=True)[1]]
+    return key[:, 1:].int().to(device), key[:, 0].to(device)
+
+
+def serialization_reference(grid_coord, batch, depth, orders):
+    # encode each order (hilbert on arrays of bits), argsort and scatter inverse
+    code = []
+    for order in orders:
+        coord = grid_coord[:, [1, 0, 2]] if order.endswith("-trans") else grid_coord
+        if order.startswith("z"):
+            x, y, z = coord[:, 0].long(), coord[:, 1].long(), coord[:, 2].long()
+            code_ = xyz2key(x, y, z, b=None, depth=depth)
+        else:
+            code_ = hilbert_encode(coord, num_dims=3, num_bits=depth)
+        code.append(batch.long() << depth * 3 | code_)
+    code = torch.stack(code)
+    order = torch.argsort(code)
+    inverse = torch.zeros_like(order).scatter_(
+        dim=1,
+        index=order,
+        src=torch.arange(0, code.shape[1], device=order.device).repeat(
+            code.shape[0], 1
+        ),
+    )
+    return code, order, inverse
+
+
+def serialization(grid_coord, batch, depth, orders, cache=None, split=None):
+    if cache is not None:
+        serialized = cache.get(grid_coord, batch, depth, orders)
+        if serialized is not None:
+            return serialized
+    bit_length = depth * 3 + (int(batch.max()) + 1).bit_length()
+    split = bit_length > 63 if split is None else split
+    code = encode_orders(grid_coord, batch, depth, orders=orders, split=split)
+    serialized = (code,) + sort_code(code, bit_length=bit_length)
+    if cache is not None:
+        cache.put(grid_coord, batch, depth, orders, serialized)
+    return serialized
+
+
+def pooling(code, order, pooling_depth=1, fused=True):
+    # clusters and pooled order as SerializedPooling of PT-v3m1
+    if fused:
+        code = shift_code(code, pooling_depth)
+        _, cluster, counts = unique_code(code[0], order[0])
+    else:
+        code = code >> pooling_depth * 3
+        _, cluster, counts = torch.unique(
+            code[0], sorted=True, return_inverse=True, return_counts=True
+        )
+    _, indices = torch.sort(cluster)
+    idx_ptr = torch.cat([counts.new_zeros(1), torch.cumsum(counts, dim=0)])
+    code = code[:, indices[idx_ptr[:-1]]]
+    if fused:
+        return pool_order(order, cluster)
+    return torch.argsort(code)
+
+
+def merge(code):
+    # split code (k, n, 2) as int64, only for codes fit in 63 bits
+    return code[..., 0] << 48 | code[..., 1]
+
+
+def timeit(func, iters, device):
+    func()
+    if device == "cuda":
+        torch.cuda.synchronize()
+    start = time.perf_counter()
+    for _ in range(iters):
+        func()
+    if device == "cuda":
+        torch.cuda.synchronize()
+    return (time.perf_counter() - start) / iters * 1000
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--num-points", default=200000, type=int)
+    parser.add_argument("--batch-size", default=4, type=int)
+    parser.add_argument("--depths", default=[16, 20, 24], type=int, nargs="+")
+    parser.add_argument("--iters", default=3, type=int)
+    parser.add_argument(
+        "--device", default="cuda" if torch.cuda.is_available() else "cpu"
+    )
+    args = parser.parse_args()
+
+    for depth in args.depths:
+        grid_coord, batch = make_batch(
+            args.num_points, args.batch_size, depth, device=args.device
+        )
+        fused = serialization(grid_coord, batch, depth, ORDERS)
+        split = serialization(grid_coord, batch, depth, ORDERS, split=True)
+        if fused[0].dim() == 2:
+            # split codes hold the same code, sorted as the same order
+            assert torch.equal(merge(split[0]), fused[0])
+            assert all(torch.equal(a, b) for a, b in zip(fused[1:], split[1:]))
+        if depth <= 16 and fused[0].dim() == 2:
+            reference = serialization_reference(grid_coord, batch, depth, ORDERS)
+            for name, a, b in zip(["code", "order", "inverse"], reference, fused):
+                assert torch.equal(a, b), f"{name} mismatch at depth {depth}"
+        pooled = pooling(*split[:2], fused=True)
+        if fused[0].dim() == 2:
+            assert torch.equal(pooled, pooling(merge(split[0]), split[1], fused=False))
+
+        cache = SerializationCache()
+        serialization(grid_coord, batch, depth, ORDERS, cache=cache)
+        latency = dict(
+            fused=timeit(
+                lambda: serialization(grid_coord, batch, depth, ORDERS),
+                args.iters,
+                args.device,
+            ),
+            split=timeit(
+                lambda: serialization(grid_coord, batch, depth, ORDERS, split=True),
+                args.iters,
+                args.device,
+            ),
+            cached=timeit(
+                lambda: serialization(grid_coord, batch, depth, ORDERS, cache=cache),
+                args.iters,
+                args.device,
+            ),
+            pooling_split=timeit(
+                lambda: pooling(*split[:2], fused=True), args.iters, args.device
+            ),
+        )
+        if depth <= 16 and fused[0].dim() == 2:
+            latency["reference"] = timeit(
+                lambda: serialization_reference(grid_coord, batch, depth, ORDERS),
+                args.iters,
+                args.device,
+            )
+            latency["pooling_sort"] = timeit(
+                lambda: pooling(*fused[:2], fused=False), args.iters, args.device
+            )
+            latency["pooling_fused"] = timeit(
+                lambda: pooling(*fused[:2], fused=True), args.iters, args.device
+            )
+        print(
+            f"depth {depth}, {len(grid_coord)} points: "
+            + ", ".join(f"{key} {value:.1f} ms" for key, value in latency.items())
+        )
+
+        # z-order encoding throughput against the LUT path (depth <= 16 only)
+        x, y, z = grid_coord.long().unbind(1)
+        throughput = dict(
+            encode=timeit(
+                lambda: encode_orders(grid_coord, batch, depth, ("z",), split=True),
+                args.iters,
+                args.device,
+            )
+        )
+        if depth <= 16:
+            throughput["xyz2key"] = timeit(
+                lambda: xyz2key(x, y, z, b=batch, depth=depth),
+                args.iters,
+                args.device,
+            )
+        print(
+            f"depth {depth}, z-order encoding: "
+            + ", ".join(
+                f"{key} {len(grid_coord) / value / 1000:.1f} M points/s"
+                for key, value in throughput.items()
+            )
+        )
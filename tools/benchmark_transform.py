@@ -0,0 +1,126 @@
+"""
+Benchmark per sample latency of a transform pipeline with and without fusing
+consecutive geometric transforms (Compose(fuse=True)), on a synthetic scene.
+
+e.g. python tools/benchmark_transform.py --config-file configs/scannet/semseg-pt-v3m1-0-base.py
+
+Author: Xiaoyang Wu (xiaoyang.wu.cs@gmail.com)
+Please cite our work if the code is helpful to you.
+"""
+
+import time
+import random
+import argparse
+import numpy as np
+from copy import deepcopy
+
+from pointcept.datasets.transform import Compose
+from pointcept.utils.config import Config
+
+# geometric and color part of the common indoor semseg training pipeline
+DEFAULT_TRANSFORM = [
+    dict(type="CenterShift", apply_z=True),
+    dict(
+        type="RandomRotate",
+        angle=[-1, 1],
+        axis="z",
+        center=[0, 0, 0],
+        always_apply=True,
+    ),
+    dict(type="RandomRotate", angle=[-1 / 64, 1 / 64], axis="x", p=0.5),
+    dict(type="RandomRotate", angle=[-1 / 64, 1 / 64], axis="y", p=0.5),
+    dict(type="RandomScale", scale=[0.9, 1.1]),
+    dict(type="RandomFlip", p=0.5),
+    dict(type="RandomJitter", sigma=0.005, clip=0.02),
+    dict(type="ChromaticAutoContrast", p=0.2, blend_factor=None),
+    dict(type="ChromaticTranslation", p=0.95, ratio=0.05),
+    dict(type="ChromaticJitter", p=0.95, std=0.05),
+    dict(type="CenterShift", apply_z=False),
+    dict(type="NormalizeColor"),
+]
+
+
+def make_scene(num_points, seed=0):
+    rng = np.random.default_rng(seed)
+    return dict(
+        coord=(rng.random((num_points, 3)) * [8, 8, 3]).astype(np.float32),
+        color=rng.integers(0, 256, (num_points, 3)).astype(np.float32),
+        normal=rng.standard_normal((num_points, 3)).astype(np.float32),
+        segment=rng.integers(0, 20, num_points),
+    )
+
+
+def seed_all(seed):
+    random.seed(seed)
+    np.random.seed(seed)
+
+
+def run(transform, scene, iters, seed):
+    outputs, latency = [], []
+    for i in range(iters):
+        data_dict = deepcopy(scene)
+        seed_all(seed + i)
+        start = time.perf_counter()
+        data_dict = transform(data_dict)
+        latency.append(time.perf_counter() - start)
+        outputs.append(data_dict)
+    return outputs, np.array(latency) * 1000
+
+
+def max_diff(outputs_a, outputs_b, key):
+    # fused and unfused coord differ by float rounding, which a later voxelization
+    # or crop can turn into other sampled points (samples of other shape skipped)
+    diff = [
+        float(np.abs(np.asarray(a[key]) - np.asarray(b[key])).max())
+        for a, b in zip(outputs_a, outputs_b)
+        if a[key].shape == b[key].shape
+    ]
+    return max(diff) if len(diff) > 0 else float("nan")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--config-file",
+        default=None,
+        help="Benchmark data.train.transform of the config, default: a typical "
+        "indoor pipeline without voxelization.",
+    )
+    parser.add_argument("--num-points", default=200000, type=int)
+    parser.add_argument("--iters", default=50, type=int)
+    parser.add_argument("--seed", default=0, type=int)
+    args = parser.parse_args()
+
+    if args.config_file is not None:
+        transform_cfg = Config.fromfile(args.config_file).data.train.transform
+    else:
+        transform_cfg = DEFAULT_TRANSFORM
+    scene = make_scene(args.num_points, args.seed)
+
+    results = dict()
+    for fuse in [False, True]:
+        transform = Compose(deepcopy(transform_cfg), fuse=fuse)
+        run(transform, scene, 2, args.seed)  # warm up
+        results[fuse] = run(transform, scene, args.iters, args.seed)
+        latency = results[fuse][1]
+        print(
+            f"fuse={fuse}: mean {latency.mean():.2f} ms, "
+            f"p50 {np.percentile(latency, 50):.2f} ms, "
+            f"p95 {np.percentile(latency, 95):.2f} ms per sample "
+            f"({args.num_points} points)"
+        )
+    speedup = results[False][1].mean() / results[True][1].mean()
+    print(f"Speedup: {speedup:.2f}x")
+
+    # same seed, same samples: fused vs unfused, fused vs fused
+    fused_again = run(
+        Compose(deepcopy(transform_cfg), fuse=True), scene, args.iters, args.seed
+    )[0]
+    for key in ["coord", "normal", "color"]:
+        if key not in results[True][0][0].keys():
+            continue
+        print(
+            f"{key}: max |fused - unfused| = "
+            f"{max_diff(results[True][0], results[False][0], key):.3e}, "
+            f"max |fused - fused| = {max_diff(results[True][0], fused_again, key):.3e}"
+        )
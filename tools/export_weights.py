@@ -0,0 +1,69 @@
+"""
+Export the model weights of a (full or sharded) training checkpoint to a slim
+inference file (state_dict without the "module." prefix, epoch), which is read by
+the testers and CheckpointLoader like a training checkpoint.
+
+e.g. python tools/export_weights.py --checkpoint exp/scannet/semseg-pt-v3m1-0-base/model/model_best.pth --output model_best_weights.pth
+
+Author: Xiaoyang Wu (xiaoyang.wu.cs@gmail.com)
+Please cite our work if the code is helpful to you.
+"""
+
+import os
+import argparse
+
+from pointcept.utils.checkpoint import (
+    CheckpointReader,
+    convert_state_dict,
+    save_file,
+    state_size,
+)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--checkpoint",
+        required=True,
+        help="Path to the training checkpoint, e.g. model/model_best.pth",
+    )
+    parser.add_argument(
+        "--output",
+        required=True,
+        help="Path of the exported weights.",
+    )
+    parser.add_argument(
+        "--keywords",
+        default="",
+        help="Keyword of weight names to replace, e.g. module.backbone.",
+    )
+    parser.add_argument(
+        "--replacement",
+        default="",
+        help="Replacement of the keyword, e.g. module.",
+    )
+    parser.add_argument(
+        "--half",
+        action="store_true",
+        help="Save floating point weights in float16.",
+    )
+    args = parser.parse_args()
+
+    checkpoint = CheckpointReader(args.checkpoint)
+    state_dict = convert_state_dict(
+        checkpoint.state_dict(),
+        ddp=False,
+        keywords=args.keywords,
+        replacement=args.replacement,
+    )
+    for key, value in state_dict.items():
+        # copy out of the memory-mapped file
+        value = value.detach().clone()
+        if args.half and value.is_floating_point():
+            value = value.half()
+        state_dict[key] = value
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+    save_file(dict(state_dict=state_dict, epoch=checkpoint.get("epoch")), args.output)
+    print(
+        f"Exported {len(state_dict)} weights ({state_size(state_dict) / 1024**2:.1f} MB) "
+        f"of epoch {checkpoint.get('epoch')} to {args.output}"
+    )
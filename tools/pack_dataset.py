@@ -0,0 +1,87 @@
+"""
+Pack a processed dataset (data_root/split/scene/*.npy) into a packed store
+(data_root/packed), which is read by datasets built with storage="packed".
+
+Author: Xiaoyang Wu (xiaoyang.wu.cs@gmail.com)
+Please cite our work if the code is helpful to you.
+"""
+
+import os
+import argparse
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+
+from pointcept.datasets.storage import PackedSceneWriter
+
+
+def get_scene_list(dataset_root, split):
+    # a scene is any folder holding .npy assets, e.g. split/scene or split/seq/frame
+    scene_list = []
+    for root, dirs, files in os.walk(os.path.join(dataset_root, split)):
+        dirs.sort()
+        if any(file.endswith(".npy") for file in files):
+            scene_list.append(os.path.relpath(root, dataset_root))
+    return scene_list
+
+
+def load_scene(dataset_root, scene):
+    scene_path = os.path.join(dataset_root, scene)
+    data_dict = dict()
+    for asset in sorted(os.listdir(scene_path)):
+        if not asset.endswith(".npy"):
+            continue
+        data_dict[asset[:-4]] = np.load(os.path.join(scene_path, asset))
+    return data_dict
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--dataset_root",
+        required=True,
+        help="Path to the Pointcept processed dataset.",
+    )
+    parser.add_argument(
+        "--splits",
+        required=True,
+        type=str,
+        nargs="+",
+        help="Splits need to pack, e.g. --splits train val test",
+    )
+    parser.add_argument(
+        "--output_root",
+        default=None,
+        help="Output path of the packed store, default: ${dataset_root}/packed",
+    )
+    parser.add_argument(
+        "--shard_size",
+        default=16,
+        type=float,
+        help="Maximum size (GB) of each shard file.",
+    )
+    parser.add_argument(
+        "--num_workers",
+        default=8,
+        type=int,
+        help="Num workers for loading scenes.",
+    )
+    config = parser.parse_args()
+    output_root = config.output_root or os.path.join(config.dataset_root, "packed")
+
+    scene_list = []
+    for split in config.splits:
+        scene_list += get_scene_list(config.dataset_root, split)
+    print(f"Packing {len(scene_list)} scenes into {output_root} ...")
+    pool = ThreadPoolExecutor(max_workers=config.num_workers)
+    with PackedSceneWriter(
+        output_root, shard_size=int(config.shard_size * 1024**3)
+    ) as writer:
+        # load scenes chunk by chunk to bound memory, write them in order
+        chunk_size = config.num_workers * 2
+        for start in range(0, len(scene_list), chunk_size):
+            chunk = scene_list[start : start + chunk_size]
+            data_iter = pool.map(load_scene, [config.dataset_root] * len(chunk), chunk)
+            for i, (scene, data_dict) in enumerate(zip(chunk, data_iter)):
+                writer.write(scene, data_dict)
+                print(f"[{start + i + 1}/{len(scene_list)}] Packed {scene}")
+    pool.shutdown()
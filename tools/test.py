@@ -16,7 +16,7 @@ from pointcept.engines.launch import launch
 
 def main_worker(cfg):
     cfg = default_setup(cfg)
-    tester = TESTERS.build(dict(type=cfg.test.type, cfg=cfg))
+    tester = TESTERS.build(dict(**cfg.test, cfg=cfg))
     tester.test()
 
 